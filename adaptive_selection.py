@@ -0,0 +1,139 @@
+"""
+Adaptive Question Selection
+Keeps running score statistics and picks questions that match the user's level
+
+Tables used (created by init_db in app.py):
+- question_stats: count, mean and M2 (for variance) of scores per question
+- user_category_mastery: moving average of each user's scores per category
+
+Both are updated when an answer is submitted, so selecting questions never
+scans interview_responses. Selection uses only index seeks:
+1. List the categories with a loose index scan (one seek per category)
+2. Keep the categories in a heap ordered by the user's mastery (weakest first)
+3. For each pick, seek the question whose mean score is closest to the
+   user's mastery in that category
+This is O(k log n) for k questions out of n.
+"""
+
+import heapq
+
+PRIOR_MEAN_SCORE = 50    # Mean score assumed for unanswered questions and unseen categories
+MASTERY_WEIGHT = 0.3     # Weight of the newest score in the mastery moving average
+CATEGORY_SPREAD = 15     # How much a pick lowers a category's priority, to spread questions out
+
+
+def answer_stats_statements(user_id, question, score):
+    """
+    Statements that update question statistics and the user's category mastery for one answer
+    `question` is the question dict stored in the session
+    Returns a list of (sql, params), so they can be queued with the answer itself
+    """
+    category = question.get('category') or 'General'
+
+    # Welford's online algorithm in one statement: every right-hand side
+    # reads the old row, so the update is atomic and needs no extra SELECT
+    return [
+        ('''
+            INSERT INTO question_stats (question_id, question_type, category, response_count, score_mean, score_m2)
+            VALUES (?, ?, ?, 1, ?, 0)
+            ON CONFLICT (question_id) DO UPDATE SET
+                response_count = response_count + 1,
+                score_mean = score_mean + (excluded.score_mean - score_mean) / (response_count + 1),
+                score_m2 = score_m2 + (excluded.score_mean - score_mean) *
+                    (excluded.score_mean - (score_mean + (excluded.score_mean - score_mean) / (response_count + 1)))
+        ''', (question['id'], question['question_type'], category, score)),
+        ('''
+            INSERT INTO user_category_mastery (user_id, category, response_count, mastery)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (user_id, category) DO UPDATE SET
+                response_count = response_count + 1,
+                mastery = mastery + ? * (excluded.mastery - mastery)
+        ''', (user_id, category, score, MASTERY_WEIGHT)),
+    ]
+
+
+def question_variance(stats):
+    """Sample variance of a question's scores from a question_stats row (shown on the admin question list)"""
+    if stats['response_count'] < 2:
+        return 0
+    return stats['score_m2'] / (stats['response_count'] - 1)
+
+
+def list_categories(conn, question_type=None):
+    """
+    Distinct categories, found by jumping from one category to the next in the index
+    (a loose index scan) instead of reading every question
+    """
+    if question_type:
+        type_filter, params = 'question_type = ? AND', (question_type,)
+    else:
+        type_filter, params = '', ()
+    rows = conn.execute(f'''
+        WITH RECURSIVE c(category) AS (
+            SELECT MIN(category) FROM question_stats WHERE {type_filter} 1
+            UNION ALL
+            SELECT (SELECT MIN(category) FROM question_stats
+                    WHERE {type_filter} category > c.category)
+            FROM c WHERE c.category IS NOT NULL
+        )
+        SELECT category FROM c WHERE category IS NOT NULL
+    ''', params + params).fetchall()
+    return [row[0] for row in rows]
+
+
+def nearest_question(conn, category, target, question_type=None, exclude=()):
+    """Id of the question in `category` whose mean score is closest to `target`"""
+    query = 'SELECT question_id, score_mean FROM question_stats WHERE category = ?'
+    params = [category]
+    if question_type:
+        query += ' AND question_type = ?'
+        params.append(question_type)
+    if exclude:
+        query += f" AND question_id NOT IN ({','.join('?' * len(exclude))})"
+        params.extend(exclude)
+
+    # One index seek on each side of the target
+    above = conn.execute(query + ' AND score_mean >= ? ORDER BY score_mean LIMIT 1',
+                         params + [target]).fetchone()
+    below = conn.execute(query + ' AND score_mean < ? ORDER BY score_mean DESC LIMIT 1',
+                         params + [target]).fetchone()
+
+    candidates = [row for row in (above, below) if row]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: abs(row['score_mean'] - target))['question_id']
+
+
+def select_adaptive_questions(conn, user_id, interview_type, count, questions):
+    """
+    Pick `count` questions for the user, starting with their weakest categories
+    interview_type is 'HR', 'Technical' or 'Mixed'
+    questions maps question id -> question (the question cache in app.py)
+    Returns questions in the order they should be asked
+    """
+    question_type = None if interview_type == 'Mixed' else interview_type
+
+    mastery = {
+        row['category']: row['mastery']
+        for row in conn.execute(
+            'SELECT category, mastery FROM user_category_mastery WHERE user_id = ?', (user_id,)
+        )
+    }
+
+    # Heap entries: (priority, category, target score); weakest category first
+    heap = []
+    for category in list_categories(conn, question_type):
+        level = mastery.get(category, PRIOR_MEAN_SCORE)
+        heap.append((level, category, level))
+    heapq.heapify(heap)
+
+    chosen = []
+    while heap and len(chosen) < count:
+        priority, category, target = heapq.heappop(heap)
+        question_id = nearest_question(conn, category, target, question_type, chosen)
+        if question_id is None:
+            continue  # No questions left in this category
+        chosen.append(question_id)
+        heapq.heappush(heap, (priority + CATEGORY_SPREAD, category, target))
+
+    return [questions[question_id] for question_id in chosen if question_id in questions]
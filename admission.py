@@ -0,0 +1,293 @@
+"""
+Admission Control for Answer Evaluation
+Keeps answer latency bounded when many candidates submit at the same time
+
+Every evaluation first asks the controller for a mode, based on the load:
+the evaluations running in all server workers plus the connections waiting
+in the listening socket's accept queue (requests no worker has picked up yet).
+
+- load < soft limit: full evaluation (evaluate_answer)
+- soft limit <= load < hard limit: quick evaluation (keyword and length
+  scoring, calculate_fallback_score: no TF-IDF and no comparison with the
+  ideal answer); the answer is saved with needs_rescoring = 1
+- load >= hard limit: Overloaded is raised and the route answers 503 with
+  Retry-After, which costs the worker almost nothing, so the queue drains
+
+serve.py workers are single-threaded and take connections from one shared
+socket, so a request waits for every request accepted before it. Answering
+the excess quickly keeps that wait, and the tail latency, bounded.
+
+Counting: serve.py gives each worker a slot in a shared memory array
+(share()/assign()) and clears the slot of a worker that exited, so a worker
+killed during an evaluation does not leave its count behind. The accept
+queue length is read with TCP_INFO (Linux only; elsewhere only running
+evaluations are counted). Without serve.py (python app.py) the evaluations
+running in the process are counted.
+
+Rescoring: quick scores are provisional. `python admission.py rescore`
+evaluates the flagged answers again with evaluate_answer and corrects the
+answer, the question statistics, the user's category mastery and, for
+completed interviews, the performance analytics and rollups (and bumps the
+data versions of the pages showing them, see page_cache.py). Run it when the
+server is quiet (e.g. from cron); archived interviews are not rescored.
+
+Usage:
+    python admission.py status --db instance/interview_system.db
+    python admission.py rescore --db instance/interview_system.db
+"""
+
+import argparse
+import json
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from multiprocessing.sharedctypes import RawArray
+
+from question_cache import bump_data_version
+
+FULL = 'full'    # evaluate_answer
+QUICK = 'quick'  # calculate_fallback_score, rescored later
+
+RESCORE_BATCH = 50  # Answers rescored per transaction
+
+# struct tcp_info starts with 8 one-byte fields; on a listening socket
+# tcpi_unacked is the accept queue length and tcpi_sacked its maximum
+_TCP_INFO = struct.Struct('8B6I')
+
+
+class Overloaded(Exception):
+    """Raised instead of evaluating when the load is at the hard limit"""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many answers are being evaluated')
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Chooses how an answer is evaluated from the current load
+    A limit of None disables it (hard_limit=None: never reject)
+    """
+
+    def __init__(self, soft_limit, hard_limit, retry_after=1):
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.retry_after = retry_after
+        self.counts = [0]   # Evaluations running, per worker slot (a shared array under serve.py)
+        self.slot = 0
+        self.listener = None  # serve.py's listening socket
+        self.lock = threading.Lock()
+
+    def share(self, slots, listener=None):
+        """Called by serve.py before forking: one counter per worker slot, visible to all processes"""
+        self.counts = RawArray('i', slots)
+        self.listener = listener
+
+    def assign(self, slot):
+        """Called in a new worker: count its evaluations in this slot"""
+        self.slot = slot
+        self.counts[slot] = 0
+
+    def release(self, slot):
+        """Called by serve.py when the worker using this slot has exited"""
+        self.counts[slot] = 0
+
+    def in_flight(self):
+        """Evaluations running in all workers"""
+        return sum(self.counts)
+
+    def queued(self):
+        """Connections waiting to be accepted by a worker"""
+        if self.listener is None or not hasattr(socket, 'TCP_INFO'):
+            return 0
+        try:
+            info = self.listener.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+            return _TCP_INFO.unpack_from(info)[12]
+        except (OSError, struct.error):
+            return 0
+
+    def load(self):
+        return self.in_flight() + self.queued()
+
+    def mode(self):
+        """FULL or QUICK for the current load; raises Overloaded at the hard limit"""
+        if self.soft_limit is None and self.hard_limit is None:
+            return FULL
+        load = self.load()
+        if self.hard_limit is not None and load >= self.hard_limit:
+            raise Overloaded(self.retry_after)
+        if self.soft_limit is not None and load >= self.soft_limit:
+            return QUICK
+        return FULL
+
+    @contextmanager
+    def admit(self):
+        """Decide the mode, then count the evaluation as running until the block ends"""
+        mode = self.mode()
+        with self.lock:
+            self.counts[self.slot] += 1
+        try:
+            yield mode
+        finally:
+            with self.lock:
+                self.counts[self.slot] -= 1
+
+    def stats(self):
+        return {'in_flight': self.in_flight(), 'queued': self.queued(),
+                'soft_limit': self.soft_limit, 'hard_limit': self.hard_limit}
+
+
+# ==================== RESCORING ====================
+
+def _mastery_correction(conn, user_id, category, response_id, delta, weight):
+    """
+    Change of the user's category mastery when the score of one answer changes by delta
+    Mastery is an exponential moving average: an answer counted with weight w (1 for the
+    user's first answer in the category) still counts w * (1 - w)^k after k later answers
+    """
+    earlier, later = conn.execute('''
+        SELECT COALESCE(SUM(ir.id < ?), 0), COALESCE(SUM(ir.id > ?), 0)
+        FROM interview_responses ir
+        JOIN interviews i ON i.id = ir.interview_id
+        JOIN questions q ON q.id = ir.question_id
+        WHERE i.user_id = ? AND COALESCE(q.category, 'General') = ?
+    ''', (response_id, response_id, user_id, category)).fetchone()
+    return delta * (weight if earlier else 1) * (1 - weight) ** later
+
+
+def _rebuild_rollups(conn, user_id, interview_type, completed_at):
+    """Recompute the day and week rollups of a completed interview from performance_analytics"""
+    day = datetime.strptime(completed_at[:10], '%Y-%m-%d').date()
+    week = day - timedelta(days=day.weekday())
+    for period, period_start, days in (('day', day, 1), ('week', week, 7)):
+        conn.execute('''
+            INSERT OR REPLACE INTO performance_rollups
+            (user_id, period, period_start, interview_type, interview_count, score_sum, score_min, score_max)
+            SELECT ?, ?, ?, ?, COUNT(*), SUM(pa.overall_score), MIN(pa.overall_score), MAX(pa.overall_score)
+            FROM interviews i
+            JOIN performance_analytics pa ON pa.interview_id = i.id
+            WHERE i.user_id = ? AND COALESCE(i.interview_type, 'Mixed') = ?
+              AND i.completed_at >= ? AND i.completed_at < ?
+            HAVING COUNT(*) > 0
+        ''', (user_id, period, period_start.isoformat(), interview_type, user_id, interview_type,
+              period_start.isoformat(), (period_start + timedelta(days=days)).isoformat()))
+
+
+def rescore(database, mastery_weight, min_age=3600, pause=0.0, limit=None):
+    """
+    Evaluate flagged answers again and correct everything computed from their quick scores
+    Answers of interviews still in progress are left until they are min_age seconds old,
+    so a candidate's results are not rescored while they are being computed
+    Returns the number of answers rescored
+    """
+    from nlp_evaluator import evaluate_answer
+
+    conn = sqlite3.connect(database, timeout=30)
+    conn.row_factory = sqlite3.Row
+    rescored = 0
+    while limit is None or rescored < limit:
+        rows = conn.execute('''
+            SELECT ir.id, ir.interview_id, ir.user_answer, ir.score, i.user_id, i.status,
+                   i.interview_type, i.completed_at, q.id AS question_id, q.question_text,
+                   q.question_type, q.ideal_answer, COALESCE(q.category, 'General') AS category
+            FROM interview_responses ir
+            JOIN interviews i ON i.id = ir.interview_id
+            JOIN questions q ON q.id = ir.question_id
+            WHERE ir.needs_rescoring = 1 AND i.archived_month IS NULL
+              AND (i.status = 'Completed' OR ir.answered_at < datetime('now', ?))
+            ORDER BY ir.id LIMIT ?
+        ''', (f'-{int(min_age)} seconds', RESCORE_BATCH)).fetchall()
+        if not rows:
+            break
+
+        # Evaluate outside the transaction, so the database is not locked meanwhile
+        evaluations = [evaluate_answer(row['question_text'], row['user_answer'], row['question_type'],
+                                       ideal_answer=row['ideal_answer']) for row in rows]
+
+        interviews = {}
+        with conn:
+            for row, evaluation in zip(rows, evaluations):
+                updated = conn.execute('''
+                    UPDATE interview_responses
+                    SET score = ?, feedback = ?, keywords_matched = ?, needs_rescoring = 0
+                    WHERE id = ? AND needs_rescoring = 1
+                ''', (evaluation['score'], evaluation['feedback'],
+                      json.dumps(evaluation.get('keywords_matched', [])), row['id'])).rowcount
+                if not updated:
+                    continue  # Archived or rescored by another run meanwhile
+                old, new = row['score'], evaluation['score']
+                delta = new - old
+
+                # Welford with one value replaced: the count stays the same
+                conn.execute('''
+                    UPDATE question_stats SET
+                        score_mean = score_mean + ? / response_count,
+                        score_m2 = MAX(0, score_m2 + ? * (? - (score_mean + ? / response_count) + ? - score_mean))
+                    WHERE question_id = ?
+                ''', (delta, delta, new, delta, old, row['question_id']))
+                conn.execute('UPDATE user_category_mastery SET mastery = mastery + ? WHERE user_id = ? AND category = ?',
+                             (_mastery_correction(conn, row['user_id'], row['category'], row['id'],
+                                                  delta, mastery_weight),
+                              row['user_id'], row['category']))
+                bump_data_version(conn, f"interview:{row['interview_id']}")
+                if row['status'] == 'Completed':
+                    interviews[row['interview_id']] = row
+                rescored += 1
+
+            for interview_id, row in interviews.items():
+                scores = conn.execute('''
+                    SELECT q.question_type, ir.score FROM interview_responses ir
+                    JOIN questions q ON q.id = ir.question_id
+                    WHERE ir.interview_id = ?
+                ''', (interview_id,)).fetchall()
+                by_type = {'HR': [], 'Technical': []}
+                for question_type, score in scores:
+                    by_type.setdefault(question_type, []).append(score)
+                conn.execute('''
+                    UPDATE performance_analytics SET overall_score = ?, hr_score = ?, technical_score = ?
+                    WHERE interview_id = ?
+                ''', (sum(score for _, score in scores) / len(scores),
+                      sum(by_type['HR']) / len(by_type['HR']) if by_type['HR'] else 0,
+                      sum(by_type['Technical']) / len(by_type['Technical']) if by_type['Technical'] else 0,
+                      interview_id))
+                if row['completed_at']:
+                    _rebuild_rollups(conn, row['user_id'], row['interview_type'] or 'Mixed', row['completed_at'])
+                bump_data_version(conn, f"performance:{row['user_id']}")
+        time.sleep(pause)
+    conn.close()
+    return rescored
+
+
+def status(database):
+    conn = sqlite3.connect(database)
+    waiting, oldest = conn.execute('''
+        SELECT COUNT(*), MIN(answered_at) FROM interview_responses WHERE needs_rescoring = 1
+    ''').fetchone()
+    conn.close()
+    print(f'{waiting} answers waiting for rescoring' + (f' (oldest from {oldest})' if waiting else ''))
+
+
+def main():
+    from adaptive_selection import MASTERY_WEIGHT
+
+    parser = argparse.ArgumentParser(description='Rescore answers that got a quick evaluation under overload')
+    parser.add_argument('command', choices=['status', 'rescore'])
+    parser.add_argument('--db', default='instance/interview_system.db', help='database file')
+    parser.add_argument('--limit', type=int, help='rescore: most answers to rescore in this run')
+    parser.add_argument('--pause', type=float, default=0.1, help='rescore: seconds to sleep between batches')
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        status(args.db)
+    else:
+        started = time.perf_counter()
+        count = rescore(args.db, MASTERY_WEIGHT, pause=args.pause, limit=args.limit)
+        print(f'Rescored {count} answers in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
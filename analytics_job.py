@@ -0,0 +1,237 @@
+"""
+Offline Analytics Job
+Builds admin analytics with pandas and saves them as Parquet files
+
+Outputs (in instance/analytics/):
+1. question_stats.parquet - per-question score statistics and calibrated difficulty
+2. category_stats.parquet - per-category score distribution (10-point bins)
+3. cohort_trends.parquet - average score per signup-month cohort and month
+
+Tables are read in chunks and only per-group sums are kept between chunks,
+so memory depends on the number of questions/categories/cohorts, not on
+the number of responses. Archived interviews (archive.py) are read from
+their month files after the main database.
+
+Usage:
+    python analytics_job.py [--db instance/interview_system.db] [--out instance/analytics] [--archive instance/archive]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from archive import ARCHIVE_FOLDER, each_schema
+
+DEFAULT_DATABASE = 'instance/interview_system.db'
+ANALYTICS_FOLDER = 'instance/analytics'
+CHUNK_SIZE = 200000
+
+# Mean score thresholds used to calibrate question difficulty
+EASY_MIN_SCORE = 70
+MEDIUM_MIN_SCORE = 50
+
+SCORE_BINS = 10  # 0-10, 10-20, ..., 90-100
+
+# Loaded analytics, reused until the files change: {folder: (mtime, tables)}
+_cache = {}
+
+
+def _add(total, partial):
+    """Add one chunk's partial sums to the running totals"""
+    if total is None:
+        return partial
+    return total.add(partial, fill_value=0)
+
+
+def _std(count, total, total_sq):
+    """Standard deviation from count, sum and sum of squares"""
+    mean = total / count
+    return np.sqrt(np.clip(total_sq / count - mean ** 2, 0, None))
+
+
+def _chunks(conn, query, chunk_size, archive_folder):
+    """Chunks of a query over `{schema}` tables, in the main database and then every archive month"""
+    for schema in each_schema(conn, archive_folder):
+        yield from pd.read_sql_query(query.format(schema=schema), conn, chunksize=chunk_size)
+
+
+def compute_response_stats(conn, questions, chunk_size=CHUNK_SIZE, archive_folder=ARCHIVE_FOLDER):
+    """
+    One pass over interview_responses
+    Returns (question_stats, category_stats) DataFrames
+    """
+    category_by_id = questions.set_index('id')['category'].fillna('General')
+    per_question = None
+    per_category_bin = None
+
+    chunks = _chunks(
+        conn, 'SELECT question_id, score FROM {schema}.interview_responses WHERE score IS NOT NULL',
+        chunk_size, archive_folder
+    )
+    for chunk in chunks:
+        score = chunk['score'].astype('float64')
+        chunk = chunk.assign(score_sq=score ** 2)
+
+        per_question = _add(per_question, chunk.groupby('question_id').agg(
+            responses=('score', 'size'),
+            score_sum=('score', 'sum'),
+            score_sq_sum=('score_sq', 'sum')
+        ))
+
+        category = chunk['question_id'].map(category_by_id).fillna('General')
+        score_bin = (score // (100 / SCORE_BINS)).clip(0, SCORE_BINS - 1).astype('int8')
+        per_category_bin = _add(per_category_bin, chunk.groupby([category, score_bin]).agg(
+            responses=('score', 'size'),
+            score_sum=('score', 'sum'),
+            score_sq_sum=('score_sq', 'sum')
+        ))
+
+    # Per-question statistics and difficulty calibration
+    question_stats = questions.rename(columns={'id': 'question_id'}).set_index('question_id')
+    if per_question is not None:
+        question_stats = question_stats.join(per_question, how='left')
+    else:
+        question_stats = question_stats.assign(responses=0, score_sum=0.0, score_sq_sum=0.0)
+    question_stats['responses'] = question_stats['responses'].fillna(0).astype('int64')
+    answered = question_stats['responses'] > 0
+    count = question_stats['responses'].where(answered)
+    question_stats['mean_score'] = question_stats['score_sum'] / count
+    question_stats['std_score'] = _std(count, question_stats['score_sum'], question_stats['score_sq_sum'])
+    question_stats['calibrated_difficulty'] = np.select(
+        [~answered, question_stats['mean_score'] >= EASY_MIN_SCORE,
+         question_stats['mean_score'] >= MEDIUM_MIN_SCORE],
+        [None, 'Easy', 'Medium'],
+        default='Hard'
+    )
+    question_stats['difficulty_mismatch'] = answered & (
+        question_stats['calibrated_difficulty'] != question_stats['difficulty']
+    )
+    question_stats = question_stats.drop(columns=['score_sum', 'score_sq_sum']).reset_index()
+
+    # Per-category distribution: one row per category, one column per score bin
+    if per_category_bin is None:
+        category_stats = pd.DataFrame(columns=['category', 'responses', 'mean_score', 'std_score'] +
+                                      [f'bin_{b}' for b in range(SCORE_BINS)])
+    else:
+        per_category_bin.index.names = ['category', 'score_bin']
+        totals = per_category_bin.groupby(level='category').sum()
+        bins = per_category_bin['responses'].unstack('score_bin', fill_value=0)
+        bins = bins.reindex(columns=range(SCORE_BINS), fill_value=0).astype('int64')
+        bins.columns = [f'bin_{b}' for b in bins.columns]
+        category_stats = pd.DataFrame({
+            'responses': totals['responses'].astype('int64'),
+            'mean_score': totals['score_sum'] / totals['responses'],
+            'std_score': _std(totals['responses'], totals['score_sum'], totals['score_sq_sum'])
+        }).join(bins).reset_index()
+
+    return question_stats, category_stats
+
+
+def compute_cohort_trends(conn, chunk_size=CHUNK_SIZE, archive_folder=ARCHIVE_FOLDER):
+    """
+    Average overall score per cohort (month the user signed up) and month of the interview
+    """
+    totals = None
+    chunks = _chunks(conn, '''
+        SELECT substr(u.created_at, 1, 7) AS cohort,
+               substr(pa.created_at, 1, 7) AS month,
+               pa.overall_score
+        FROM {schema}.performance_analytics pa
+        JOIN main.users u ON pa.user_id = u.id
+        WHERE pa.overall_score IS NOT NULL
+    ''', chunk_size, archive_folder)
+    for chunk in chunks:
+        totals = _add(totals, chunk.groupby(['cohort', 'month']).agg(
+            interviews=('overall_score', 'size'),
+            score_sum=('overall_score', 'sum')
+        ))
+
+    if totals is None:
+        return pd.DataFrame(columns=['cohort', 'month', 'interviews', 'mean_score'])
+    totals['interviews'] = totals['interviews'].astype('int64')
+    totals['mean_score'] = totals['score_sum'] / totals['interviews']
+    return totals.drop(columns='score_sum').reset_index()
+
+
+def _compact(df):
+    """Smaller column types for the Parquet files"""
+    for column in df.columns:
+        if df[column].dtype == 'float64':
+            df[column] = df[column].astype('float32')
+        elif column in ('category', 'question_type', 'difficulty', 'calibrated_difficulty',
+                        'cohort', 'month'):
+            df[column] = df[column].astype('category')
+    return df
+
+
+def write_table(df, folder, name):
+    """Write one table atomically, so the admin pages never read a half-written file"""
+    path = os.path.join(folder, f'{name}.parquet')
+    tmp_path = path + '.tmp'
+    _compact(df).to_parquet(tmp_path, index=False, compression='zstd')
+    os.replace(tmp_path, path)
+    return path
+
+
+def run(database=DEFAULT_DATABASE, folder=ANALYTICS_FOLDER, chunk_size=CHUNK_SIZE, archive_folder=ARCHIVE_FOLDER):
+    """Compute all analytics tables and write them to `folder`"""
+    os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(database)
+    try:
+        questions = pd.read_sql_query(
+            'SELECT id, question_text, question_type, category, difficulty FROM questions', conn
+        )
+        question_stats, category_stats = compute_response_stats(conn, questions, chunk_size, archive_folder)
+        cohort_trends = compute_cohort_trends(conn, chunk_size, archive_folder)
+    finally:
+        conn.close()
+
+    return [
+        write_table(question_stats, folder, 'question_stats'),
+        write_table(category_stats, folder, 'category_stats'),
+        write_table(cohort_trends, folder, 'cohort_trends'),
+    ]
+
+
+def load_analytics(folder=ANALYTICS_FOLDER):
+    """
+    Read the analytics tables written by run()
+    Returns dict of DataFrames (plus 'generated_at'), or None if the job has not run yet
+    """
+    names = ('question_stats', 'category_stats', 'cohort_trends')
+    paths = [os.path.join(folder, f'{name}.parquet') for name in names]
+    try:
+        mtime = max(os.path.getmtime(path) for path in paths)
+    except OSError:
+        return None
+
+    cached = _cache.get(folder)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    tables = {name: pd.read_parquet(path) for name, path in zip(names, paths)}
+    tables['generated_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
+    _cache[folder] = (mtime, tables)
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build admin analytics from the interview database')
+    parser.add_argument('--db', default=DEFAULT_DATABASE, help='SQLite database path')
+    parser.add_argument('--out', default=ANALYTICS_FOLDER, help='output folder for Parquet files')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows read per chunk')
+    parser.add_argument('--archive', default=ARCHIVE_FOLDER, help='folder of archived month files (archive.py)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    for path in run(args.db, args.out, args.chunk_size, args.archive):
+        print(f'Wrote {path} ({os.path.getsize(path)} bytes)')
+    print(f'Finished in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
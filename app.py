@@ -3,22 +3,54 @@ AI-Based Online Job Interview Preparation System
 Main Flask Application
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, has_request_context, abort
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import sqlite3
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta, timezone
 from functools import wraps
 import json
+import random
+import time
 
 # Import NLP modules
-from nlp_evaluator import evaluate_answer
+from evaluator_service import EvaluatorClient
+from adaptive_selection import answer_stats_statements, question_variance, select_adaptive_questions, PRIOR_MEAN_SCORE
+from write_behind import WriteBehindQueue, WriteTimeout
+from duplicate_detection import find_similar, ideal_answer_similarity, index_statements, DUPLICATE_THRESHOLD
+from question_cache import QuestionCache, bump_data_version, data_version_statement, data_versions
+from page_cache import FragmentCache, code_version, page_etag
+from question_search import search_questions, similar_questions
+from admission import AdmissionController, Overloaded, QUICK
+import archive
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'  # Change this in production
 app.config['DATABASE'] = 'instance/interview_system.db'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024  # Reject request bodies over 1 MB
+app.config['EVALUATION_MAX_TOKENS'] = 1000      # Words of an answer analyzed by the evaluator
+app.config['EVALUATION_TIME_BUDGET'] = 0.5      # CPU seconds per evaluation before cheaper scoring is used
+app.config['EVALUATOR_SOCKET'] = 'instance/evaluator.sock'  # evaluator_service.py socket (None: always in-process)
+app.config['EVALUATOR_TIMEOUT'] = 5             # Seconds to wait for the evaluator service
+app.config['EVALUATION_SOFT_LIMIT'] = 8         # Evaluations running + requests queued before quick scoring (None: never)
+app.config['EVALUATION_HARD_LIMIT'] = 64        # Evaluations running + requests queued before answering 503 (None: never)
+app.config['EVALUATION_RETRY_AFTER'] = 1        # Seconds a client is asked to wait after a 503
+app.config['LIVE_SCORING_MAX_SESSIONS'] = 1000  # Drafts scored live in one process (see live_scoring.py)
+app.config['PERFORMANCE_PAGE_SIZE'] = 20        # Interviews per page on the performance page
+app.config['ADMIN_RESULTS_PAGE_SIZE'] = 50      # Interviews per page on the admin results page
+app.config['PERFORMANCE_SERIES_MAX_POINTS'] = 500  # Largest series the performance API returns
+app.config['QUESTION_SEARCH_PAGE_SIZE'] = 50    # Questions per page of the admin question search
+app.config['PAGE_CACHE_MAX_ENTRIES'] = 500      # Rendered result page fragments kept per process (see page_cache.py)
+app.config['ANALYTICS_FOLDER'] = 'instance/analytics'  # Parquet files written by analytics_job.py
+app.config['ARCHIVE_FOLDER'] = 'instance/archive'      # Month files of old interviews written by archive.py
+app.config['WRITE_BEHIND_MAX_BATCH'] = 200      # Most answers saved in one database commit
+app.config['WRITE_BEHIND_MAX_DELAY'] = 0.02     # Seconds an answer may wait for others to join its commit
+app.config['WRITE_BEHIND_WAIT'] = False         # True: submit_answer waits until its answer is committed
+app.config['WRITE_BEHIND_BARRIER_TIMEOUT'] = 5  # Seconds interview_complete waits for queued answers
+app.config['WRITE_BEHIND_COMMIT_TIMEOUT'] = 10  # Seconds a request waits for its own commit (then 503)
 
 # Ensure directories exist
 os.makedirs('instance', exist_ok=True)
@@ -27,19 +59,292 @@ os.makedirs('templates', exist_ok=True)
 os.makedirs('static/css', exist_ok=True)
 os.makedirs('static/js', exist_ok=True)
 
-# Database connection helper
+# Database connection helpers
+def _is_write(sql):
+    return not sql.lstrip()[:6].upper().startswith(('SELECT', 'PRAGMA', 'WITH'))
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that adds the time of write statements to its connection's write_time"""
+    def execute(self, sql, parameters=()):
+        if not _is_write(sql):
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.connection.write_time += time.perf_counter() - started
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self.connection.write_time += time.perf_counter() - started
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Connection that measures time spent in writes and commits
+    This is where SQLite waits for the write lock when other processes are writing.
+    The total for a request is reported in the Server-Timing response header.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_time = 0.0
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            self.write_time += time.perf_counter() - started
+
+    def close(self):
+        if has_request_context():
+            g.db_write_time = g.get('db_write_time', 0.0) + self.write_time
+        self.write_time = 0.0
+        super().close()
+
 def get_db():
     """Get database connection"""
-    conn = sqlite3.connect(app.config['DATABASE'])
+    conn = sqlite3.connect(app.config['DATABASE'], factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+# Process-local copy of the question bank (see question_cache.py)
+question_cache = QuestionCache()
+
+def get_questions(conn=None):
+    """The question cache, checked against the data version at most once per request"""
+    if has_request_context() and g.get('questions_checked'):
+        return question_cache
+    if conn is None:
+        conn = get_db()
+        question_cache.refresh(conn)
+        conn.close()
+    else:
+        question_cache.refresh(conn)
+    if has_request_context():
+        g.questions_checked = True
+    return question_cache
+
+def with_questions(responses):
+    """
+    Response rows as dicts with their question's text, type, category and ideal answer
+    Responses to deleted questions are left out
+    """
+    questions = get_questions()
+    result = []
+    for r in responses:
+        question = questions.get(r['question_id'])
+        if question is None:
+            continue
+        response = dict(r)
+        response.update(question_text=question.question_text, question_type=question.question_type,
+                        category=question.category, ideal_answer=question.ideal_answer)
+        result.append(response)
+    return result
+
+# Answers and interview results are saved through this queue, which
+# commits the writes of many requests together (see write_behind.py)
+write_queue = WriteBehindQueue(
+    lambda: app.config['DATABASE'],
+    max_batch=app.config['WRITE_BEHIND_MAX_BATCH'],
+    max_delay=app.config['WRITE_BEHIND_MAX_DELAY'],
+    timeout=app.config['WRITE_BEHIND_COMMIT_TIMEOUT']
+)
+
+def queue_write(statements, wait=False, unless=None):
+    """Queue statements for the next group commit; time spent waiting counts as database write time"""
+    started = time.perf_counter()
+    try:
+        return write_queue.submit(statements, wait=wait, unless=unless)
+    finally:
+        if has_request_context():
+            g.db_write_time = g.get('db_write_time', 0.0) + time.perf_counter() - started
+
+# Answers are evaluated by evaluator_service.py when it is running
+evaluator_client = EvaluatorClient(app.config['EVALUATOR_SOCKET'], timeout=app.config['EVALUATOR_TIMEOUT'])
+
+# Under load answers get a quick evaluation or a 503 (see admission.py);
+# serve.py shares the counters between its workers
+admission = AdmissionController(
+    app.config['EVALUATION_SOFT_LIMIT'],
+    app.config['EVALUATION_HARD_LIMIT'],
+    retry_after=app.config['EVALUATION_RETRY_AFTER']
+)
+
+def run_evaluation(question_text, user_answer, question_type, ideal_answer=None):
+    """
+    Evaluate an answer in the evaluator service, or in this process if the service is down
+    Above the soft limit the evaluation is a quick one ('overload' in degraded_stages,
+    rescored later); raises Overloaded at the hard limit
+    """
+    args = {
+        'question_text': question_text,
+        'user_answer': user_answer,
+        'question_type': question_type,
+        'max_tokens': app.config['EVALUATION_MAX_TOKENS'],
+    }
+    with admission.admit() as mode:
+        if mode == QUICK:
+            evaluation = evaluator_client.quick_evaluate(**args)
+            if evaluation is None:
+                from nlp_evaluator import quick_evaluate
+                evaluation = quick_evaluate(**args)
+            return evaluation
+        
+        args.update(ideal_answer=ideal_answer, time_budget=app.config['EVALUATION_TIME_BUDGET'])
+        evaluation = evaluator_client.evaluate(**args)
+        if evaluation is None:
+            # Imported here so workers that use the service never load scikit-learn and NLTK
+            from nlp_evaluator import evaluate_answer
+            evaluation = evaluate_answer(**args)
+        return evaluation
+
+# Drafts scored in this process when the evaluator service is not running
+local_drafts = None
+
+def update_draft(key, question, update):
+    """
+    Live scores of a draft answer (see live_scoring.py), in the evaluator service if it is running
+    Returns the scores, or None when the browser has to send the whole draft again
+    Raises ValueError for an invalid update
+    """
+    global local_drafts
+    reply = evaluator_client.update_draft(key, question, update)
+    if reply is not None:
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return reply.get('result')
+    
+    if local_drafts is None:
+        from live_scoring import DraftStore
+        local_drafts = DraftStore(app.config['LIVE_SCORING_MAX_SESSIONS'])
+    return local_drafts.update(key, question, update)
+
+def wait_for_answers(interview_id, expected):
+    """
+    Make sure all answers of an interview are committed before they are read
+    Answers queued by this process are flushed; answers queued by another
+    server worker are waited for until `expected` of them are in the database.
+    """
+    started = time.perf_counter()
+    timeout = app.config['WRITE_BEHIND_BARRIER_TIMEOUT']
+    if not write_queue.flush(timeout):
+        raise WriteTimeout('Queued answers were not committed in time')
+    conn = get_db()
+    try:
+        while time.perf_counter() - started < timeout:
+            count = conn.execute('SELECT COUNT(*) FROM interview_responses WHERE interview_id = ?',
+                                 (interview_id,)).fetchone()[0]
+            if count >= expected:
+                break
+            time.sleep(app.config['WRITE_BEHIND_MAX_DELAY'])
+    finally:
+        conn.close()
+        if has_request_context():
+            g.db_write_time = g.get('db_write_time', 0.0) + time.perf_counter() - started
+
+@app.after_request
+def add_db_timing(response):
+    """Report database write time (including lock waits) for load testing"""
+    if 'db_write_time' in g:
+        response.headers['Server-Timing'] = f'db-write;dur={g.db_write_time * 1000:.2f}'
+    return response
+
+@app.errorhandler(sqlite3.OperationalError)
+def database_busy(error):
+    """Answer 'database is locked' errors with 503 so clients know to retry"""
+    if 'locked' not in str(error):
+        raise error
+    return 'The server is busy, please try again.', 503, {'Retry-After': '1'}
+
+@app.errorhandler(WriteTimeout)
+def write_timeout(error):
+    """The write queue is too slow: the client retries (finishing an interview twice is safe)"""
+    headers = {'Retry-After': '1'}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'The server is busy, please try again.'}), 503, headers
+    return 'The server is busy, please try again.', 503, headers
+
+@app.errorhandler(Overloaded)
+def evaluation_overloaded(error):
+    """Too many answers are being evaluated: ask the client to send the answer again later"""
+    headers = {'Retry-After': str(error.retry_after)}
+    if request.path.startswith('/api/'):
+        return jsonify({'error': 'The server is busy, please send your answer again.',
+                        'retry_after': error.retry_after}), 503, headers
+    return 'The server is busy, please try again.', 503, headers
+
+# Result pages: rendered data fragments by ETag (see page_cache.py)
+fragment_cache = FragmentCache(app.config['PAGE_CACHE_MAX_ENTRIES'])
+CODE_VERSION = code_version(os.path.dirname(os.path.abspath(__file__)))
+
+def versioned_page(template, key, names, render_fragment, **context):
+    """
+    Render a page whose data part depends only on the data versions `names`
+    A matching If-None-Match (or If-Modified-Since) gets a 304 after one version lookup;
+    otherwise the fragment comes from fragment_cache, or render_fragment(conn) renders it.
+    key: what else the fragment depends on (page number...); the user is always part of it
+    """
+    conn = get_db()
+    try:
+        versions = data_versions(conn, names)
+        etag = page_etag(template, [session.get('user_id')] + list(key), versions, CODE_VERSION)
+        changes = [changed_at for _, changed_at in versions.values() if changed_at]
+        last_modified = datetime.strptime(max(changes), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc) if changes else None
+        
+        # Pending flashed messages are shown by the page around the fragment, so it is rendered
+        if '_flashes' not in session:
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                # Last-Modified has one-second resolution: changes in the current second do not count yet
+                not_modified = (last_modified is not None and request.if_modified_since is not None and
+                                request.if_modified_since >= last_modified and
+                                datetime.now(timezone.utc) - last_modified >= timedelta(seconds=1))
+            if not_modified:
+                response = app.response_class(status=304)
+                return conditional_headers(response, etag, last_modified)
+        
+        fragment = fragment_cache.get(etag)
+        if fragment is None:
+            fragment = Markup(render_fragment(conn))
+            fragment_cache.put(etag, fragment)
+    finally:
+        conn.close()
+    response = app.make_response(render_template(template, fragment=fragment, **context))
+    return conditional_headers(response, etag, last_modified)
+
+def conditional_headers(response, etag, last_modified):
+    """Browsers keep the page but ask again every time; it differs per logged-in user"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
 # Initialize database
 def init_db():
     """Initialize database with schema"""
     conn = get_db()
     cursor = conn.cursor()
     
+    # Lets archive.py give space freed by archiving back in small steps
+    # (only takes effect in a new, empty database)
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
     # Create users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -119,6 +424,163 @@ def init_db():
         )
     ''')
     
+    # Create performance_rollups table (daily/weekly score aggregates per user and interview type)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS performance_rollups (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            period_start DATE NOT NULL,
+            interview_type TEXT NOT NULL,
+            interview_count INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            score_min REAL NOT NULL,
+            score_max REAL NOT NULL,
+            PRIMARY KEY (user_id, period, period_start, interview_type),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_performance_analytics_user
+        ON performance_analytics (user_id, created_at)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_performance_analytics_interview ON performance_analytics (interview_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_interview_responses_interview ON interview_responses (interview_id)')
+    
+    # Answers that got a quick evaluation under load, waiting for `python admission.py rescore`
+    try:
+        cursor.execute('ALTER TABLE interview_responses ADD COLUMN needs_rescoring INTEGER NOT NULL DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_interview_responses_rescoring
+        ON interview_responses (id) WHERE needs_rescoring = 1
+    ''')
+    
+    # Month file (YYYY-MM) holding the responses and analytics of an archived interview (see archive.py)
+    try:
+        cursor.execute('ALTER TABLE interviews ADD COLUMN archived_month TEXT')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_interviews_user ON interviews (user_id, archived_month)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_interviews_archive ON interviews (archived_month, completed_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archive_months (
+            month TEXT PRIMARY KEY,
+            interview_count INTEGER NOT NULL,
+            response_count INTEGER NOT NULL,
+            archived_at DATETIME,
+            compacted_at DATETIME
+        )
+    ''')
+    
+    # Build rollups for history recorded before the table existed. Bucketed by the
+    # interview's completed_at (local time), like performance_rollup_statements and
+    # admission.py's rebuild; pa.created_at is UTC (CURRENT_TIMESTAMP)
+    rollup_count = cursor.execute('SELECT COUNT(*) FROM performance_rollups').fetchone()[0]
+    if rollup_count == 0:
+        completed_at = "COALESCE(i.completed_at, datetime(pa.created_at, 'localtime'))"
+        for period, period_start in (('day', f"date({completed_at})"),
+                                     ('week', f"date({completed_at}, 'weekday 0', '-6 days')")):
+            cursor.execute(f'''
+                INSERT INTO performance_rollups
+                (user_id, period, period_start, interview_type, interview_count, score_sum, score_min, score_max)
+                SELECT pa.user_id, ?, {period_start}, COALESCE(i.interview_type, 'Mixed'),
+                       COUNT(*), SUM(pa.overall_score), MIN(pa.overall_score), MAX(pa.overall_score)
+                FROM performance_analytics pa
+                JOIN interviews i ON pa.interview_id = i.id
+                GROUP BY pa.user_id, {period_start}, COALESCE(i.interview_type, 'Mixed')
+            ''', (period,))
+    
+    # Create question_stats table (running score statistics per question)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS question_stats (
+            question_id INTEGER PRIMARY KEY,
+            question_type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            response_count INTEGER NOT NULL DEFAULT 0,
+            score_mean REAL NOT NULL,
+            score_m2 REAL NOT NULL DEFAULT 0,
+            FOREIGN KEY (question_id) REFERENCES questions(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_question_stats_category ON question_stats (category, score_mean)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_question_stats_type ON question_stats (question_type, category, score_mean)')
+    
+    # Create user_category_mastery table (moving average score per user and category)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_category_mastery (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            response_count INTEGER NOT NULL,
+            mastery REAL NOT NULL,
+            PRIMARY KEY (user_id, category),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    
+    # Build mastery for answers given before the table existed
+    mastery_count = cursor.execute('SELECT COUNT(*) FROM user_category_mastery').fetchone()[0]
+    if mastery_count == 0:
+        cursor.execute('''
+            INSERT INTO user_category_mastery (user_id, category, response_count, mastery)
+            SELECT i.user_id, COALESCE(q.category, 'General'), COUNT(*), AVG(ir.score)
+            FROM interview_responses ir
+            JOIN interviews i ON ir.interview_id = i.id
+            JOIN questions q ON ir.question_id = q.id
+            WHERE ir.score IS NOT NULL
+            GROUP BY i.user_id, COALESCE(q.category, 'General')
+        ''')
+    
+    # Create near-duplicate answer index tables (see duplicate_detection.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_signatures (
+            response_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (response_id) REFERENCES interview_responses(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS answer_lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            response_id INTEGER NOT NULL,
+            PRIMARY KEY (band, bucket, response_id)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Create full-text index of the questions, kept in sync by triggers (see question_search.py)
+    fts_exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'questions_fts'").fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+            question_text, ideal_answer, question_type, category, difficulty,
+            content='questions', content_rowid='id', tokenize='porter unicode61'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+            INSERT INTO questions_fts (rowid, question_text, ideal_answer, question_type, category, difficulty)
+            VALUES (new.id, new.question_text, new.ideal_answer, new.question_type, new.category, new.difficulty);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, question_text, ideal_answer, question_type, category, difficulty)
+            VALUES ('delete', old.id, old.question_text, old.ideal_answer, old.question_type, old.category, old.difficulty);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions BEGIN
+            INSERT INTO questions_fts (questions_fts, rowid, question_text, ideal_answer, question_type, category, difficulty)
+            VALUES ('delete', old.id, old.question_text, old.ideal_answer, old.question_type, old.category, old.difficulty);
+            INSERT INTO questions_fts (rowid, question_text, ideal_answer, question_type, category, difficulty)
+            VALUES (new.id, new.question_text, new.ideal_answer, new.question_type, new.category, new.difficulty);
+        END
+    ''')
+    if not fts_exists:
+        # Index the questions added before the index existed
+        cursor.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+    
     # Create default admin user (username: admin, password: admin123)
     admin_exists = cursor.execute('SELECT id FROM users WHERE username = ?', ('admin',)).fetchone()
     if not admin_exists:
@@ -128,6 +590,19 @@ def init_db():
             VALUES (?, ?, ?, ?, ?)
         ''', ('admin', 'admin@interview.com', admin_password, 'Administrator', 1))
     
+    # Create data_versions table (change counters used to invalidate caches, see question_cache.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            changed_at DATETIME
+        )
+    ''')
+    try:
+        cursor.execute('ALTER TABLE data_versions ADD COLUMN changed_at DATETIME')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    
     # Insert sample questions if table is empty
     question_count = cursor.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
     if question_count == 0:
@@ -167,10 +642,76 @@ def init_db():
             INSERT INTO questions (question_text, question_type, category, difficulty, ideal_answer)
             VALUES (?, ?, ?, ?, ?)
         ''', sample_questions)
+        bump_data_version(conn, 'questions')
+    
+    # Add statistics for questions that have none yet (from any existing responses)
+    cursor.execute('''
+        INSERT INTO question_stats (question_id, question_type, category, response_count, score_mean, score_m2)
+        SELECT q.id, q.question_type, COALESCE(q.category, 'General'),
+               COUNT(ir.score),
+               COALESCE(AVG(ir.score), ?),
+               COALESCE(SUM(ir.score * ir.score) - COUNT(ir.score) * AVG(ir.score) * AVG(ir.score), 0)
+        FROM questions q
+        LEFT JOIN interview_responses ir ON ir.question_id = q.id
+        WHERE q.id NOT IN (SELECT question_id FROM question_stats)
+        GROUP BY q.id
+    ''', (PRIOR_MEAN_SCORE,))
     
     conn.commit()
     conn.close()
 
+# Performance rollup helpers
+def performance_rollup_statements(user_id, interview_id, interview_type, score, when):
+    """
+    Statements that add one completed interview to the user's daily and weekly rollups
+    They do nothing once the interview has its performance_analytics row, so they
+    must come before that INSERT; a retried completion is not counted twice
+    """
+    day = when.date()
+    week = day - timedelta(days=day.weekday())  # Weeks start on Monday
+    return [('''
+        INSERT INTO performance_rollups
+        (user_id, period, period_start, interview_type, interview_count, score_sum, score_min, score_max)
+        SELECT ?, ?, ?, ?, 1, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM performance_analytics WHERE interview_id = ?)
+        ON CONFLICT (user_id, period, period_start, interview_type) DO UPDATE SET
+            interview_count = interview_count + 1,
+            score_sum = score_sum + excluded.score_sum,
+            score_min = MIN(score_min, excluded.score_min),
+            score_max = MAX(score_max, excluded.score_max)
+    ''', (user_id, period, period_start.isoformat(), interview_type or 'Mixed', score, score, score, interview_id))
+        for period, period_start in (('day', day), ('week', week))]
+
+def downsample_rollups(rows, start, end, points):
+    """
+    Merge rollup rows into exactly `points` equal-width time buckets
+    Each bucket gets the combined count, mean, min and max of its rows
+    """
+    total_days = (end - start).days + 1
+    buckets = [{'count': 0, 'sum': 0.0, 'min': None, 'max': None} for _ in range(points)]
+    
+    for row in rows:
+        offset = (date.fromisoformat(row['period_start']) - start).days
+        # Weekly rows may start before the range; count them in the first bucket
+        index = min(points - 1, max(0, offset) * points // total_days)
+        bucket = buckets[index]
+        bucket['count'] += row['interview_count']
+        bucket['sum'] += row['score_sum']
+        bucket['min'] = row['score_min'] if bucket['min'] is None else min(bucket['min'], row['score_min'])
+        bucket['max'] = row['score_max'] if bucket['max'] is None else max(bucket['max'], row['score_max'])
+    
+    series = []
+    for index, bucket in enumerate(buckets):
+        bucket_start = start + timedelta(days=index * total_days // points)
+        series.append({
+            'start': bucket_start.isoformat(),
+            'count': bucket['count'],
+            'mean': round(bucket['sum'] / bucket['count'], 2) if bucket['count'] else None,
+            'min': bucket['min'],
+            'max': bucket['max']
+        })
+    return series
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
@@ -181,6 +722,15 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Login required decorator for JSON API routes (401 instead of a redirect)
+def api_login_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return jsonify({'error': 'Login required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 # Admin required decorator
 def admin_required(f):
     @wraps(f)
@@ -197,6 +747,300 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# ==================== INTERVIEW HELPERS ====================
+# Shared by the page routes and the JSON interview API
+
+def question_summary(question):
+    """Fields of a question kept in the session and sent to the browser (no ideal answer)"""
+    return {
+        'id': question['id'],
+        'question_text': question['question_text'],
+        'question_type': question['question_type'],
+        'category': question['category'],
+        'difficulty': question['difficulty']
+    }
+
+def begin_interview(interview_type, num_questions, selection_mode='Random'):
+    """
+    Pick questions, create the interview record and store the interview in the session
+    Returns the number of questions (0 if no questions are available)
+    """
+    conn = get_db()
+    user_id = session['user_id']
+    cache = get_questions(conn)
+    
+    # Get questions based on type
+    if selection_mode == 'Adaptive':
+        # Focus on the user's weakest categories, at their level
+        questions = select_adaptive_questions(conn, user_id, interview_type, num_questions, cache.by_id)
+    else:
+        ids = cache.ids(None if interview_type == 'Mixed' else interview_type)
+        questions = [cache.get(question_id) for question_id in random.sample(ids, min(num_questions, len(ids)))]
+    
+    if not questions:
+        conn.close()
+        return 0
+    
+    # Create interview record
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO interviews (user_id, interview_type, total_questions, status)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, interview_type, len(questions), 'In Progress'))
+    interview_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    
+    session['current_interview_id'] = interview_id
+    session['interview_questions'] = [question_summary(q) for q in questions]
+    session['current_question_index'] = 0
+    return len(questions)
+
+def current_question():
+    """
+    The question the user should answer next
+    Returns (question, question_num, total_questions); question is None when all are answered
+    """
+    questions = session.get('interview_questions', [])
+    current_index = session.get('current_question_index', 0)
+    if current_index >= len(questions):
+        return None, current_index, len(questions)
+    return questions[current_index], current_index + 1, len(questions)
+
+def skip_saved_answers():
+    """
+    Move the session past questions whose answers are already saved
+    An answer can be saved while its response, and the session cookie that
+    moved on to the next question, never reached the browser
+    """
+    questions = session.get('interview_questions', [])
+    index = session.get('current_question_index', 0)
+    if index >= len(questions):
+        return
+    write_queue.flush(app.config['WRITE_BEHIND_BARRIER_TIMEOUT'])
+    conn = get_db()
+    saved = {row[0] for row in conn.execute('SELECT question_id FROM interview_responses WHERE interview_id = ?',
+                                            (session['current_interview_id'],))}
+    conn.close()
+    while index < len(questions) and questions[index]['id'] in saved:
+        index += 1
+    session['current_question_index'] = index
+
+def record_answer(user_answer):
+    """
+    Evaluate the answer to the current question, save it and move on to the next question
+    Returns (question, evaluation)
+    """
+    question, question_num, _ = current_question()
+    
+    # Get ideal answer from the question bank if available
+    question_row = get_questions().get(question['id'])
+    ideal_answer = question_row.ideal_answer if question_row and question_row.ideal_answer else None
+    
+    # Evaluate answer using NLP (pass ideal_answer if available)
+    evaluation = run_evaluation(
+        question['question_text'], 
+        user_answer, 
+        question['question_type'],
+        ideal_answer=ideal_answer
+    )
+    
+    # Queue the response for the next group commit, together with its
+    # near-duplicate index entries, the per-question statistics, the
+    # user's category mastery and the data versions of the result pages
+    answered_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())  # Same format as CURRENT_TIMESTAMP
+    statements = [('''
+        INSERT INTO interview_responses 
+        (interview_id, question_id, user_answer, score, feedback, keywords_matched, answered_at, needs_rescoring)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        session['current_interview_id'],
+        question['id'],
+        user_answer,
+        evaluation['score'],
+        evaluation['feedback'],
+        json.dumps(evaluation.get('keywords_matched', [])),
+        answered_at,
+        int('overload' in evaluation.get('degraded_stages', []))  # Quick score, see admission.py
+    ))]
+    statements += index_statements(user_answer)  # Must directly follow the INSERT (reads its id)
+    statements += answer_stats_statements(session['user_id'], question, evaluation['score'])
+    statements.append(data_version_statement(f"interview:{session['current_interview_id']}"))
+    # A retried request (e.g. after a 503 from a commit timeout) does not save the answer twice
+    already_saved = ('SELECT 1 FROM interview_responses WHERE interview_id = ? AND question_id = ?',
+                     (session['current_interview_id'], question['id']))
+    queue_write(statements, wait=app.config['WRITE_BEHIND_WAIT'], unless=already_saved)
+    
+    # Move to next question
+    session['current_question_index'] = question_num
+    return question, evaluation
+
+def analyze_responses(responses):
+    """
+    Scores, strengths, weaknesses and suggestions of an interview
+    `responses` are interview_responses rows with their question's fields (see with_questions)
+    """
+    # Calculate scores
+    total_score = sum(r['score'] for r in responses)
+    avg_score = total_score / len(responses) if responses else 0
+    
+    hr_responses = [r for r in responses if r['question_type'] == 'HR']
+    technical_responses = [r for r in responses if r['question_type'] == 'Technical']
+    
+    hr_score = sum(r['score'] for r in hr_responses) / len(hr_responses) if hr_responses else 0
+    technical_score = sum(r['score'] for r in technical_responses) / len(technical_responses) if technical_responses else 0
+    
+    # Calculate strengths and weaknesses
+    strengths = []
+    weaknesses = []
+    improvement_suggestions = []
+    
+    # Analyze by question type
+    if hr_score >= 70:
+        strengths.append("Strong performance in HR/Behavioral questions")
+    elif hr_score < 50:
+        weaknesses.append("Needs improvement in HR/Behavioral questions")
+        improvement_suggestions.append("Practice common HR questions like 'Tell me about yourself', 'Why do you want to work here', and 'Where do you see yourself in 5 years'. Focus on providing structured, detailed answers with examples.")
+    
+    if technical_score >= 70:
+        strengths.append("Strong technical knowledge and understanding")
+    elif technical_score < 50:
+        weaknesses.append("Technical knowledge needs improvement")
+        improvement_suggestions.append("Review technical concepts related to your field. Practice explaining technical topics clearly and concisely. Include specific examples and use cases in your answers.")
+    
+    # Analyze by score ranges
+    excellent_answers = [r for r in responses if r['score'] >= 80]
+    poor_answers = [r for r in responses if r['score'] < 50]
+    
+    if len(excellent_answers) >= len(responses) * 0.5:
+        strengths.append("Consistently providing detailed and comprehensive answers")
+    elif len(poor_answers) >= len(responses) * 0.5:
+        weaknesses.append("Answers are often too brief or lack detail")
+        improvement_suggestions.append("Aim to provide answers with at least 50-100 words. Include relevant examples, explain concepts clearly, and structure your answers with an introduction, main points, and conclusion.")
+    
+    # Analyze by category performance
+    category_scores = {}
+    for r in responses:
+        category = r['category'] or 'General'
+        if category not in category_scores:
+            category_scores[category] = []
+        category_scores[category].append(r['score'])
+    
+    for category, scores in category_scores.items():
+        avg_cat_score = sum(scores) / len(scores)
+        if avg_cat_score >= 75:
+            strengths.append(f"Strong understanding of {category} topics")
+        elif avg_cat_score < 50:
+            weaknesses.append(f"Needs improvement in {category} area")
+            improvement_suggestions.append(f"Focus on studying {category} concepts. Review fundamental principles and practice explaining them in your own words.")
+    
+    # General suggestions based on overall performance
+    if avg_score >= 80:
+        strengths.append("Excellent overall interview performance")
+    elif avg_score < 60:
+        improvement_suggestions.append("Practice more mock interviews to improve your confidence and answer quality. Review your weak areas and prepare structured answers beforehand.")
+    
+    # Length analysis
+    avg_length = sum(len(r['user_answer'].split()) for r in responses) / len(responses)
+    if avg_length < 30:
+        weaknesses.append("Answers are consistently too short")
+        improvement_suggestions.append("Expand your answers by including examples, explaining your thought process, and providing context. Aim for 50-100 words per answer.")
+    elif avg_length > 150:
+        weaknesses.append("Some answers may be too lengthy")
+        improvement_suggestions.append("Practice being concise while maintaining clarity. Focus on key points and avoid unnecessary details.")
+    
+    # If no specific strengths/weaknesses identified, provide general ones
+    if not strengths:
+        if avg_score >= 60:
+            strengths.append("Good foundation in interview preparation")
+        else:
+            strengths.append("Completed the interview - practice makes perfect")
+    
+    if not weaknesses:
+        weaknesses.append("Continue practicing to maintain consistency")
+    
+    if not improvement_suggestions:
+        improvement_suggestions.append("Continue practicing mock interviews regularly")
+        improvement_suggestions.append("Review feedback after each interview to identify patterns")
+        improvement_suggestions.append("Prepare answers for common questions in advance")
+    
+    return {
+        'responses': responses,
+        'avg_score': avg_score,
+        'hr_score': hr_score,
+        'technical_score': technical_score,
+        'strengths': strengths,
+        'weaknesses': weaknesses,
+        'improvement_suggestions': improvement_suggestions
+    }
+
+def finish_interview():
+    """
+    Score the current interview, save its analytics and clear it from the session
+    Returns analyze_responses() with the interview_id, or None if nothing was answered
+    """
+    interview_id = session['current_interview_id']
+    
+    # Answers may still be waiting in the write queue
+    wait_for_answers(interview_id, session.get('current_question_index', 0))
+    conn = get_db()
+    
+    # Get all responses for this interview
+    responses = with_questions(conn.execute('''
+        SELECT * FROM interview_responses
+        WHERE interview_id = ?
+        ORDER BY answered_at, id
+    ''', (interview_id,)).fetchall())
+    
+    if not responses:
+        conn.close()
+        return None
+    
+    results = analyze_responses(responses)
+    avg_score, hr_score, technical_score = results['avg_score'], results['hr_score'], results['technical_score']
+    
+    interview = conn.execute('SELECT interview_type FROM interviews WHERE id = ?', (interview_id,)).fetchone()
+    conn.close()
+    
+    # Update interview status and save performance analytics in one group commit,
+    # waiting for it so the performance page shows the interview right away.
+    # A commit that timed out may still happen, so the statements do nothing
+    # for an interview that already has its analytics when the client retries
+    completed_at = datetime.now()
+    queue_write(performance_rollup_statements(  # Keep the pre-aggregated performance history up to date
+        session['user_id'], interview_id, interview['interview_type'], avg_score, completed_at
+    ) + [('''
+        INSERT INTO performance_analytics 
+        (user_id, interview_id, overall_score, hr_score, technical_score, total_questions, questions_answered)
+        SELECT ?, ?, ?, ?, ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM performance_analytics WHERE interview_id = ?)
+    ''', (
+        session['user_id'],
+        interview_id,
+        avg_score,
+        hr_score,
+        technical_score,
+        len(responses),
+        len(responses),
+        interview_id
+    )), ('''
+        UPDATE interviews 
+        SET status = ?, completed_at = ?
+        WHERE id = ? AND status != 'Completed'
+    ''', ('Completed', completed_at, interview_id)),
+        # Pages showing this interview and the user's performance changed (see page_cache.py)
+        data_version_statement(f'interview:{interview_id}'),
+        data_version_statement(f"performance:{session['user_id']}")
+    ], wait=True)
+    
+    # Clear interview session
+    session.pop('current_interview_id', None)
+    session.pop('interview_questions', None)
+    session.pop('current_question_index', None)
+    
+    results['interview_id'] = interview_id
+    return results
+
 # ==================== ROUTES ====================
 
 @app.route('/')
@@ -291,13 +1135,13 @@ def dashboard():
         SELECT * FROM interviews WHERE user_id = ? ORDER BY started_at DESC LIMIT 5
     ''', (user_id,)).fetchall()
     
-    # Get performance stats
+    # Get performance stats (from the daily rollups, which also cover archived interviews)
     stats = conn.execute('''
         SELECT 
-            COUNT(*) as total_interviews,
-            AVG(overall_score) as avg_score
-        FROM performance_analytics
-        WHERE user_id = ?
+            COALESCE(SUM(interview_count), 0) as total_interviews,
+            SUM(score_sum) / SUM(interview_count) as avg_score
+        FROM performance_rollups
+        WHERE user_id = ? AND period = 'day'
     ''', (user_id,)).fetchone()
     
     conn.close()
@@ -310,39 +1154,12 @@ def start_interview():
     if request.method == 'POST':
         interview_type = request.form.get('interview_type')
         num_questions = int(request.form.get('num_questions', 5))
+        selection_mode = request.form.get('selection_mode', 'Random')
         
-        conn = get_db()
-        user_id = session['user_id']
-        
-        # Get questions based on type
-        if interview_type == 'Mixed':
-            questions = conn.execute('''
-                SELECT * FROM questions ORDER BY RANDOM() LIMIT ?
-            ''', (num_questions,)).fetchall()
-        else:
-            questions = conn.execute('''
-                SELECT * FROM questions WHERE question_type = ? ORDER BY RANDOM() LIMIT ?
-            ''', (interview_type, num_questions)).fetchall()
-        
-        if not questions:
+        if not begin_interview(interview_type, num_questions, selection_mode):
             flash('No questions available. Please add questions first.', 'warning')
-            conn.close()
             return redirect(url_for('dashboard'))
         
-        # Create interview record
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO interviews (user_id, interview_type, total_questions, status)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, interview_type, len(questions), 'In Progress'))
-        interview_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        session['current_interview_id'] = interview_id
-        session['interview_questions'] = [dict(q) for q in questions]
-        session['current_question_index'] = 0
-        
         return redirect(url_for('interview_question'))
     
     return render_template('start_interview.html')
@@ -355,16 +1172,10 @@ def interview_question():
         flash('No active interview. Please start a new interview.', 'warning')
         return redirect(url_for('start_interview'))
     
-    questions = session.get('interview_questions', [])
-    current_index = session.get('current_question_index', 0)
-    
-    if current_index >= len(questions):
+    question, question_num, total_questions = current_question()
+    if question is None:
         return redirect(url_for('interview_complete'))
     
-    question = questions[current_index]
-    question_num = current_index + 1
-    total_questions = len(questions)
-    
     return render_template('interview_question.html', 
                          question=question, 
                          question_num=question_num,
@@ -382,49 +1193,26 @@ def submit_answer():
         flash('Please provide an answer.', 'warning')
         return redirect(url_for('interview_question'))
     
-    questions = session.get('interview_questions', [])
-    current_index = session.get('current_question_index', 0)
-    question = questions[current_index]
-    
-    # Get ideal answer from database if available
-    conn = get_db()
-    question_row = conn.execute('SELECT ideal_answer FROM questions WHERE id = ?', (question['id'],)).fetchone()
-    ideal_answer = question_row['ideal_answer'] if question_row and question_row['ideal_answer'] else None
-    conn.close()
-    
-    # Evaluate answer using NLP (pass ideal_answer if available)
-    evaluation = evaluate_answer(
-        question['question_text'], 
-        user_answer, 
-        question['question_type'],
-        ideal_answer=ideal_answer
-    )
+    if current_question()[0] is None:
+        return redirect(url_for('interview_complete'))
     
-    # Save response to database
-    conn = get_db()
-    conn.execute('''
-        INSERT INTO interview_responses 
-        (interview_id, question_id, user_answer, score, feedback, keywords_matched)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        session['current_interview_id'],
-        question['id'],
-        user_answer,
-        evaluation['score'],
-        evaluation['feedback'],
-        json.dumps(evaluation.get('keywords_matched', []))
-    ))
-    conn.commit()
-    conn.close()
+    try:
+        question, evaluation = record_answer(user_answer)
+    except Overloaded as error:
+        # Show the question again with the answer, so it can be sent again
+        question, question_num, total_questions = current_question()
+        return render_template('interview_question.html',
+                             question=question,
+                             question_num=question_num,
+                             total_questions=total_questions,
+                             answer=user_answer,
+                             retry_after=error.retry_after), 503, {'Retry-After': str(error.retry_after)}
     
     # Store evaluation in session for feedback display
     session['last_evaluation'] = evaluation
     session['last_question'] = question
     session['last_user_answer'] = user_answer
     
-    # Move to next question
-    session['current_question_index'] = current_index + 1
-    
     # Show feedback before next question
     return redirect(url_for('show_feedback'))
 
@@ -464,163 +1252,213 @@ def interview_complete():
     if 'current_interview_id' not in session:
         return redirect(url_for('dashboard'))
     
-    interview_id = session['current_interview_id']
-    conn = get_db()
-    
-    # Get all responses for this interview
-    responses = conn.execute('''
-        SELECT ir.*, q.question_text, q.question_type, q.category
-        FROM interview_responses ir
-        JOIN questions q ON ir.question_id = q.id
-        WHERE ir.interview_id = ?
-        ORDER BY ir.answered_at
-    ''', (interview_id,)).fetchall()
-    
-    if not responses:
+    results = finish_interview()
+    if results is None:
         flash('No responses found.', 'warning')
-        conn.close()
         return redirect(url_for('dashboard'))
     
-    # Calculate scores
-    total_score = sum(r['score'] for r in responses)
-    avg_score = total_score / len(responses) if responses else 0
-    
-    hr_responses = [r for r in responses if r['question_type'] == 'HR']
-    technical_responses = [r for r in responses if r['question_type'] == 'Technical']
-    
-    hr_score = sum(r['score'] for r in hr_responses) / len(hr_responses) if hr_responses else 0
-    technical_score = sum(r['score'] for r in technical_responses) / len(technical_responses) if technical_responses else 0
-    
-    # Calculate strengths and weaknesses
-    strengths = []
-    weaknesses = []
-    improvement_suggestions = []
-    
-    # Analyze by question type
-    if hr_score >= 70:
-        strengths.append("Strong performance in HR/Behavioral questions")
-    elif hr_score < 50:
-        weaknesses.append("Needs improvement in HR/Behavioral questions")
-        improvement_suggestions.append("Practice common HR questions like 'Tell me about yourself', 'Why do you want to work here', and 'Where do you see yourself in 5 years'. Focus on providing structured, detailed answers with examples.")
-    
-    if technical_score >= 70:
-        strengths.append("Strong technical knowledge and understanding")
-    elif technical_score < 50:
-        weaknesses.append("Technical knowledge needs improvement")
-        improvement_suggestions.append("Review technical concepts related to your field. Practice explaining technical topics clearly and concisely. Include specific examples and use cases in your answers.")
-    
-    # Analyze by score ranges
-    excellent_answers = [r for r in responses if r['score'] >= 80]
-    poor_answers = [r for r in responses if r['score'] < 50]
-    
-    if len(excellent_answers) >= len(responses) * 0.5:
-        strengths.append("Consistently providing detailed and comprehensive answers")
-    elif len(poor_answers) >= len(responses) * 0.5:
-        weaknesses.append("Answers are often too brief or lack detail")
-        improvement_suggestions.append("Aim to provide answers with at least 50-100 words. Include relevant examples, explain concepts clearly, and structure your answers with an introduction, main points, and conclusion.")
-    
-    # Analyze by category performance
-    category_scores = {}
-    for r in responses:
-        category = r['category'] or 'General'
-        if category not in category_scores:
-            category_scores[category] = []
-        category_scores[category].append(r['score'])
-    
-    for category, scores in category_scores.items():
-        avg_cat_score = sum(scores) / len(scores)
-        if avg_cat_score >= 75:
-            strengths.append(f"Strong understanding of {category} topics")
-        elif avg_cat_score < 50:
-            weaknesses.append(f"Needs improvement in {category} area")
-            improvement_suggestions.append(f"Focus on studying {category} concepts. Review fundamental principles and practice explaining them in your own words.")
-    
-    # General suggestions based on overall performance
-    if avg_score >= 80:
-        strengths.append("Excellent overall interview performance")
-    elif avg_score < 60:
-        improvement_suggestions.append("Practice more mock interviews to improve your confidence and answer quality. Review your weak areas and prepare structured answers beforehand.")
+    # The results have their own URL, so reloading them does not need an active interview
+    return redirect(url_for('interview_results', interview_id=results['interview_id']))
+
+@app.route('/interview/<int:interview_id>/results')
+@login_required
+def interview_results(interview_id):
+    """Results of one of the user's completed interviews"""
+    def render_results(conn):
+        interview = conn.execute('SELECT * FROM interviews WHERE id = ? AND user_id = ?',
+                                 (interview_id, session['user_id'])).fetchone()
+        if interview is None or interview['status'] != 'Completed':
+            abort(404)
+        responses = with_questions(archive.interview_responses(conn, app.config['ARCHIVE_FOLDER'], interview))
+        if not responses:
+            abort(404)
+        return render_template('fragments/interview_results.html', **analyze_responses(responses))
     
-    # Length analysis
-    avg_length = sum(len(r['user_answer'].split()) for r in responses) / len(responses)
-    if avg_length < 30:
-        weaknesses.append("Answers are consistently too short")
-        improvement_suggestions.append("Expand your answers by including examples, explaining your thought process, and providing context. Aim for 50-100 words per answer.")
-    elif avg_length > 150:
-        weaknesses.append("Some answers may be too lengthy")
-        improvement_suggestions.append("Practice being concise while maintaining clarity. Focus on key points and avoid unnecessary details.")
+    return versioned_page('interview_complete.html', [interview_id],
+                          [f'interview:{interview_id}', 'questions'], render_results)
+
+# ==================== INTERVIEW API ROUTES ====================
+# JSON version of the interview flow: one request per answer returns the
+# evaluation and the next question together
+
+def _api_question(question, question_num, total_questions):
+    if question is None:
+        return None
+    return {**question, 'question_num': question_num, 'total_questions': total_questions}
+
+@app.route('/api/interview/start', methods=['POST'])
+@api_login_required
+def api_start_interview():
+    """Start an interview; returns the first question"""
+    data = request.get_json(silent=True) or request.form
+    interview_type = data.get('interview_type', 'Mixed')
+    try:
+        num_questions = int(data.get('num_questions', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'num_questions must be a number'}), 400
     
-    # If no specific strengths/weaknesses identified, provide general ones
-    if not strengths:
-        if avg_score >= 60:
-            strengths.append("Good foundation in interview preparation")
-        else:
-            strengths.append("Completed the interview - practice makes perfect")
+    total = begin_interview(interview_type, num_questions, data.get('selection_mode', 'Random'))
+    if not total:
+        return jsonify({'error': 'No questions available'}), 404
     
-    if not weaknesses:
-        weaknesses.append("Continue practicing to maintain consistency")
+    return jsonify({
+        'interview_id': session['current_interview_id'],
+        'total_questions': total,
+        'question': _api_question(*current_question())
+    })
+
+@app.route('/api/interview/question')
+@api_login_required
+def api_interview_question():
+    """Current question of the active interview (null when all are answered)"""
+    if 'current_interview_id' not in session:
+        return jsonify({'error': 'No active interview'}), 400
+    skip_saved_answers()
+    return jsonify({'question': _api_question(*current_question())})
+
+@app.route('/api/interview/answer', methods=['POST'])
+@api_login_required
+def api_submit_answer():
+    """Submit an answer; returns its evaluation and the next question in one response"""
+    if 'current_interview_id' not in session:
+        return jsonify({'error': 'No active interview'}), 400
     
-    if not improvement_suggestions:
-        improvement_suggestions.append("Continue practicing mock interviews regularly")
-        improvement_suggestions.append("Review feedback after each interview to identify patterns")
-        improvement_suggestions.append("Prepare answers for common questions in advance")
+    data = request.get_json(silent=True) or request.form
+    user_answer = data.get('answer', '')
+    if not user_answer:
+        return jsonify({'error': 'Please provide an answer.'}), 400
+    if current_question()[0] is None:
+        return jsonify({'error': 'All questions have been answered'}), 400
     
-    # Update interview status
-    conn.execute('''
-        UPDATE interviews 
-        SET status = ?, completed_at = ?
-        WHERE id = ?
-    ''', ('Completed', datetime.now(), interview_id))
+    question, evaluation = record_answer(user_answer)
+    next_question = _api_question(*current_question())
+    return jsonify({
+        'question_id': question['id'],
+        'evaluation': evaluation,
+        'next_question': next_question,
+        'is_complete': next_question is None
+    })
+
+@app.route('/api/interview/draft', methods=['POST'])
+@api_login_required
+def api_update_draft():
+    """
+    Live keyword coverage and length score of the answer being typed
+    Body: {base_revision, revision, start, end, text} - characters start..end of
+    revision base_revision were replaced with text - or {revision, text, reset: true}
+    with the whole draft. Answers 409 when the whole draft has to be sent.
+    """
+    if 'current_interview_id' not in session:
+        return jsonify({'error': 'No active interview'}), 400
+    question = current_question()[0]
+    if question is None:
+        return jsonify({'error': 'All questions have been answered'}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     
-    # Save performance analytics
-    conn.execute('''
-        INSERT INTO performance_analytics 
-        (user_id, interview_id, overall_score, hr_score, technical_score, total_questions, questions_answered)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        session['user_id'],
-        interview_id,
-        avg_score,
-        hr_score,
-        technical_score,
-        len(responses),
-        len(responses)
-    ))
+    # The question is only needed to start a new draft
+    question_info = None
+    if data.get('reset'):
+        question_row = get_questions().get(question['id'])
+        ideal_answer = question_row.ideal_answer if question_row else None
+        question_info = (question['question_text'], question['question_type'], ideal_answer)
     
-    conn.commit()
-    conn.close()
+    key = f"{session['user_id']}:{session['current_interview_id']}:{question['id']}"
+    try:
+        scores = update_draft(key, question_info, data)
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    if scores is None:
+        return jsonify({'resync': True}), 409
+    return jsonify(scores)
+
+@app.route('/api/interview/complete', methods=['POST'])
+@api_login_required
+def api_interview_complete():
+    """Complete the active interview; returns the final results"""
+    if 'current_interview_id' not in session:
+        return jsonify({'error': 'No active interview'}), 400
     
-    # Clear interview session
-    session.pop('current_interview_id', None)
-    session.pop('interview_questions', None)
-    session.pop('current_question_index', None)
+    results = finish_interview()
+    if results is None:
+        return jsonify({'error': 'No responses found'}), 400
     
-    return render_template('interview_complete.html', 
-                         responses=responses,
-                         avg_score=avg_score,
-                         hr_score=hr_score,
-                         technical_score=technical_score,
-                         strengths=strengths,
-                         weaknesses=weaknesses,
-                         improvement_suggestions=improvement_suggestions)
+    results['responses'] = [
+        {
+            'question_id': r['question_id'],
+            'question_text': r['question_text'],
+            'question_type': r['question_type'],
+            'category': r['category'],
+            'score': r['score'],
+            'feedback': r['feedback']
+        }
+        for r in results['responses']
+    ]
+    return jsonify(results)
 
 @app.route('/performance')
 @login_required
 def performance():
-    """View performance history"""
-    conn = get_db()
+    """View performance history (one page of interviews at a time)"""
     user_id = session['user_id']
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = app.config['PERFORMANCE_PAGE_SIZE']
     
-    analytics = conn.execute('''
-        SELECT pa.*, i.interview_type, i.started_at
-        FROM performance_analytics pa
-        JOIN interviews i ON pa.interview_id = i.id
-        WHERE pa.user_id = ?
-        ORDER BY pa.created_at DESC
-    ''', (user_id,)).fetchall()
+    def render_history(conn):
+        # Fetch one extra row to know whether there is a next page
+        analytics = archive.user_performance(conn, app.config['ARCHIVE_FOLDER'], user_id,
+                                             per_page + 1, (page - 1) * per_page)
+        return render_template('fragments/performance_history.html', analytics=analytics[:per_page],
+                               page=page, has_next=len(analytics) > per_page)
+    
+    return versioned_page('performance.html', [page], [f'performance:{user_id}'], render_history)
+
+@app.route('/api/performance/series')
+@api_login_required
+def performance_series():
+    """
+    Downsampled performance history as JSON
+    Query parameters: start, end (YYYY-MM-DD), points (bucket count), type (interview type)
+    Always returns `points` buckets, read from the pre-aggregated rollups
+    """
+    try:
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else date.today()
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else end - timedelta(days=364)
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    
+    points = request.args.get('points', 52, type=int)
+    points = max(1, min(points, app.config['PERFORMANCE_SERIES_MAX_POINTS']))
+    interview_type = request.args.get('type')
+    
+    # Daily rollups for short ranges, weekly rollups for long ones
+    period = 'day' if (end - start).days < points * 4 else 'week'
+    range_start = start if period == 'day' else start - timedelta(days=start.weekday())
     
+    query = '''
+        SELECT period_start, interview_count, score_sum, score_min, score_max
+        FROM performance_rollups
+        WHERE user_id = ? AND period = ? AND period_start BETWEEN ? AND ?
+    '''
+    params = [session['user_id'], period, range_start.isoformat(), end.isoformat()]
+    if interview_type:
+        query += ' AND interview_type = ?'
+        params.append(interview_type)
+    
+    conn = get_db()
+    rows = conn.execute(query, params).fetchall()
     conn.close()
-    return render_template('performance.html', analytics=analytics)
+    
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'granularity': period,
+        'interview_type': interview_type or 'All',
+        'series': downsample_rollups(rows, start, end, points)
+    })
 
 # ==================== ADMIN ROUTES ====================
 
@@ -629,23 +1467,35 @@ def performance():
 def admin_dashboard():
     """Admin dashboard"""
     conn = get_db()
+    questions = get_questions(conn)
     
     stats = {
         'total_users': conn.execute('SELECT COUNT(*) FROM users').fetchone()[0],
-        'total_questions': conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0],
+        'total_questions': questions.count(),
         'total_interviews': conn.execute('SELECT COUNT(*) FROM interviews').fetchone()[0],
-        'hr_questions': conn.execute("SELECT COUNT(*) FROM questions WHERE question_type = 'HR'").fetchone()[0],
-        'technical_questions': conn.execute("SELECT COUNT(*) FROM questions WHERE question_type = 'Technical'").fetchone()[0],
+        'hr_questions': questions.count('HR'),
+        'technical_questions': questions.count('Technical'),
     }
     
     conn.close()
     return render_template('admin/dashboard.html', stats=stats)
 
+def question_search_args():
+    """Search text and filters of the question search, from the query string"""
+    return {
+        'text': request.args.get('q', '').strip(),
+        'question_type': request.args.get('type') or None,
+        'category': request.args.get('category') or None,
+        'difficulty': request.args.get('difficulty') or None,
+    }
+
 @app.route('/admin/questions', methods=['GET', 'POST'])
 @admin_required
 def admin_questions():
-    """Manage questions"""
+    """Manage questions: search the question bank and add questions"""
     conn = get_db()
+    form = {}
+    similar = []
     
     if request.method == 'POST':
         question_text = request.form.get('question_text')
@@ -654,16 +1504,97 @@ def admin_questions():
         difficulty = request.form.get('difficulty')
         ideal_answer = request.form.get('ideal_answer', '')
         
-        conn.execute('''
-            INSERT INTO questions (question_text, question_type, category, difficulty, ideal_answer)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (question_text, question_type, category, difficulty, ideal_answer))
-        conn.commit()
-        flash('Question added successfully!', 'success')
+        # Show questions with about the same wording before adding a duplicate
+        if not request.form.get('allow_similar'):
+            similar = similar_questions(conn, question_text)
+        if similar:
+            form = request.form
+            flash('Similar questions already exist. Add the question anyway if it is different.', 'warning')
+        else:
+            cursor = conn.execute('''
+                INSERT INTO questions (question_text, question_type, category, difficulty, ideal_answer)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (question_text, question_type, category, difficulty, ideal_answer))
+            conn.execute('''
+                INSERT INTO question_stats (question_id, question_type, category, response_count, score_mean, score_m2)
+                VALUES (?, ?, ?, 0, ?, 0)
+            ''', (cursor.lastrowid, question_type, category or 'General', PRIOR_MEAN_SCORE))
+            bump_data_version(conn, 'questions')
+            conn.commit()
+            flash('Question added successfully!', 'success')
     
-    questions = conn.execute('SELECT * FROM questions ORDER BY created_at DESC').fetchall()
+    # One page of search results (newest questions first when nothing is searched)
+    search = question_search_args()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = app.config['QUESTION_SEARCH_PAGE_SIZE']
+    results = search_questions(conn, limit=per_page + 1, offset=(page - 1) * per_page, **search)
+    has_next = len(results) > per_page
+    results = results[:per_page]
+    
+    ids = [result['id'] for result in results]
+    stats = {
+        row['question_id']: row
+        for row in conn.execute(f'''
+            SELECT question_id, response_count, score_mean, score_m2 FROM question_stats
+            WHERE question_id IN ({', '.join('?' * len(ids))})
+        ''', ids)
+    }
+    cache = get_questions(conn)
+    questions = []
+    for result in results:
+        question = cache.get(result['id'])
+        if question is None:
+            continue  # Deleted since the cache was checked
+        question_stats = stats.get(question.id)
+        questions.append(dict(question.as_dict(), rank=result['rank'],
+                              question_html=result['question_html'], answer_html=result['answer_html'],
+                              response_count=question_stats['response_count'] if question_stats else None,
+                              score_mean=question_stats['score_mean'] if question_stats else None,
+                              score_stddev=question_variance(question_stats) ** 0.5 if question_stats else None))
     conn.close()
-    return render_template('admin/questions.html', questions=questions)
+    return render_template('admin/questions.html', questions=questions, search=search, page=page,
+                           has_next=has_next, total_questions=cache.count(),
+                           categories=sorted(cache.ids_by_category), form=form, similar=similar)
+
+@app.route('/admin/questions/search')
+@admin_required
+def admin_search_questions():
+    """
+    Ranked question search as JSON
+    Query parameters: q (words), type, category, difficulty, page
+    """
+    search = question_search_args()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = app.config['QUESTION_SEARCH_PAGE_SIZE']
+    conn = get_db()
+    results = search_questions(conn, limit=per_page + 1, offset=(page - 1) * per_page, **search)
+    cache = get_questions(conn)
+    conn.close()
+    
+    questions = []
+    for result in results[:per_page]:
+        question = cache.get(result['id'])
+        if question is not None:
+            questions.append({
+                'id': question.id,
+                'question_text': question.question_text,
+                'question_type': question.question_type,
+                'category': question.category,
+                'difficulty': question.difficulty,
+                'rank': result['rank'],
+                'question_html': str(result['question_html']),
+                'answer_html': str(result['answer_html'])
+            })
+    return jsonify({'page': page, 'has_next': len(results) > per_page, 'questions': questions})
+
+@app.route('/admin/questions/similar')
+@admin_required
+def admin_similar_questions():
+    """Existing questions with about the same wording as question_text, as JSON"""
+    conn = get_db()
+    similar = similar_questions(conn, request.args.get('question_text', ''))
+    conn.close()
+    return jsonify({'similar': similar})
 
 @app.route('/admin/questions/delete/<int:question_id>')
 @admin_required
@@ -671,6 +1602,8 @@ def delete_question(question_id):
     """Delete a question"""
     conn = get_db()
     conn.execute('DELETE FROM questions WHERE id = ?', (question_id,))
+    conn.execute('DELETE FROM question_stats WHERE question_id = ?', (question_id,))
+    bump_data_version(conn, 'questions')
     conn.commit()
     conn.close()
     flash('Question deleted successfully!', 'success')
@@ -689,34 +1622,62 @@ def admin_users():
 @app.route('/admin/results')
 @admin_required
 def admin_results():
-    """View all interview results / performance analytics"""
+    """View all interview results / performance analytics (one page at a time)"""
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = app.config['ADMIN_RESULTS_PAGE_SIZE']
     conn = get_db()
-    results = conn.execute('''
-        SELECT pa.*, u.username, i.interview_type, i.started_at
-        FROM performance_analytics pa
-        JOIN users u ON pa.user_id = u.id
-        JOIN interviews i ON pa.interview_id = i.id
-        ORDER BY pa.created_at DESC
-    ''').fetchall()
+    # Fetch one extra row to know whether there is a next page
+    results = archive.all_performance(conn, app.config['ARCHIVE_FOLDER'], per_page + 1, (page - 1) * per_page)
+    total = archive.performance_count(conn)
     conn.close()
-    return render_template('admin/results.html', results=results)
+    return render_template('admin/results.html', results=results[:per_page], total=total,
+                         page=page, has_next=len(results) > per_page)
 
 
 @app.route('/admin/results/<int:interview_id>')
 @admin_required
 def admin_interview_results(interview_id):
     """View detailed responses for a specific interview"""
-    conn = get_db()
-    interview = conn.execute('SELECT i.*, u.username FROM interviews i JOIN users u ON i.user_id = u.id WHERE i.id = ?', (interview_id,)).fetchone()
-    responses = conn.execute('''
-        SELECT ir.*, q.question_text
-        FROM interview_responses ir
-        JOIN questions q ON ir.question_id = q.id
-        WHERE ir.interview_id = ?
-        ORDER BY ir.answered_at
-    ''', (interview_id,)).fetchall()
-    conn.close()
-    return render_template('admin/interview_results.html', interview=interview, responses=responses)
+    def render_details(conn):
+        interview = conn.execute('SELECT i.*, u.username FROM interviews i JOIN users u ON i.user_id = u.id WHERE i.id = ?', (interview_id,)).fetchone()
+        if interview is None:
+            abort(404)
+        responses = with_questions(archive.interview_responses(conn, app.config['ARCHIVE_FOLDER'], interview))
+        
+        # Near-duplicates of each answer: the ideal answer and other candidates' answers
+        duplicates = {}
+        for r in responses:
+            duplicates[r['id']] = {
+                'ideal_similarity': ideal_answer_similarity(r['user_answer'], r['ideal_answer'] or ''),
+                'matches': find_similar(conn, r['user_answer'], exclude_user_id=interview['user_id'],
+                                        exclude_response_id=r['id'])
+            }
+        return render_template('fragments/admin_interview_results.html', interview=interview, responses=responses,
+                             duplicates=duplicates, duplicate_threshold=DUPLICATE_THRESHOLD)
+    
+    # 'duplicates:<id>': another candidate's answer shares a bucket with one of these
+    # answers (duplicate_detection.index_statements); 'answers': the index was rebuilt or archived
+    return versioned_page('admin/interview_results.html', [interview_id],
+                          [f'interview:{interview_id}', f'duplicates:{interview_id}', 'answers', 'questions'],
+                          render_details)
+
+@app.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    """View offline analytics (difficulty calibration, score distributions, cohort trends)"""
+    # Imported here so the web workers never load pandas and pyarrow for the other routes
+    from analytics_job import load_analytics
+    analytics = load_analytics(app.config['ANALYTICS_FOLDER'])
+    if analytics is None:
+        flash('Analytics have not been generated yet. Run: python analytics_job.py', 'info')
+        return render_template('admin/analytics.html', analytics=None)
+    
+    question_stats = analytics['question_stats'].sort_values('mean_score', na_position='last')
+    return render_template('admin/analytics.html',
+                         analytics=analytics,
+                         question_stats=question_stats.to_dict('records'),
+                         category_stats=analytics['category_stats'].to_dict('records'),
+                         cohort_trends=analytics['cohort_trends'].sort_values(['cohort', 'month']).to_dict('records'))
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,413 @@
+"""
+Interview Archive
+Moves old interview data out of the main database into one read-only SQLite file per month
+
+The rows of interview_responses and performance_analytics are only written
+once, but both tables grow without bound. Completed interviews older than
+ARCHIVE_AFTER_DAYS are moved to instance/archive/YYYY-MM.db (the month the
+interview was completed):
+- Their interview_responses and performance_analytics rows are copied to the
+  month's file and deleted from the main database; their answers leave the
+  near-duplicate index (duplicate_detection.py), which covers recent answers
+- The interviews row stays in the main database (one small row per interview,
+  used by the dashboards and counts); interviews.archived_month says where
+  the rest of the interview lives
+- archive_months lists the month files with their row counts
+
+Each batch of interviews is moved in one transaction over the main database
+and the attached month file, so a crash leaves every interview either in
+the main database or in the archive. Archive files are only written by this
+script; afterwards they are made read-only.
+
+Query layer: the routes call interview_responses(), user_performance() and
+all_performance() instead of querying the tables; month files are attached
+to the request's connection only while they are read. Rows still in the main
+database are always newer than archived ones, so the newest-first pages read
+the main database first and only attach the months they reach (the row
+counts per month come from the main database, see _newest_first).
+
+Compaction (run after archiving, e.g. nightly):
+- Month files written more than once are rewritten with VACUUM INTO and
+  swapped in atomically (readers keep the file they already opened)
+- The main database gives the freed pages back to the file system with
+  PRAGMA incremental_vacuum, a few thousand pages per transaction so the
+  web server can keep writing in between. A database created before
+  auto_vacuum was enabled needs one full VACUUM first (compact --full)
+
+Usage:
+    python archive.py run [--days 365]        # archive interviews completed more than 365 days ago
+    python archive.py compact [--full]        # vacuum changed month files and the main database
+    python archive.py status                  # months in the archive and main database size
+"""
+
+import argparse
+import fcntl
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from duplicate_detection import remove_from_index
+from question_cache import bump_data_version
+
+DEFAULT_DATABASE = 'instance/interview_system.db'
+ARCHIVE_FOLDER = 'instance/archive'
+ARCHIVE_AFTER_DAYS = 365        # Completed interviews older than this are archived
+CHUNK_INTERVIEWS = 500          # Interviews moved per transaction
+VACUUM_PAGES = 2000             # Pages freed per incremental_vacuum step
+
+ARCHIVED_TABLES = ('interview_responses', 'performance_analytics')
+ARCHIVE_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS archive.idx_interview_responses_interview ON interview_responses (interview_id)',
+    'CREATE INDEX IF NOT EXISTS archive.idx_performance_analytics_user ON performance_analytics (user_id, created_at)',
+)
+
+
+def archive_path(folder, month):
+    return os.path.join(folder, f'{month}.db')
+
+
+# ==================== QUERY LAYER ====================
+
+@contextmanager
+def attached(conn, folder, month):
+    """Attach one month file as schema `archive` for the duration of a with block, read-only"""
+    path = archive_path(folder, month)
+    if not os.path.exists(path):
+        # ATTACH would create an empty file and the rows would silently be missing
+        raise FileNotFoundError(f'Archive file for {month} is missing: {path}')
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA query_only = ON')
+    try:
+        yield 'archive'
+    finally:
+        conn.execute('PRAGMA query_only = OFF')
+        conn.execute('DETACH DATABASE archive')
+
+
+def interview_responses(conn, folder, interview):
+    """Responses of one interview (a row of interviews), wherever they are stored"""
+    query = 'SELECT * FROM {schema}.interview_responses WHERE interview_id = ? ORDER BY answered_at, id'
+    if interview['archived_month'] is None:
+        return conn.execute(query.format(schema='main'), (interview['id'],)).fetchall()
+    with attached(conn, folder, interview['archived_month']) as schema:
+        return conn.execute(query.format(schema=schema), (interview['id'],)).fetchall()
+
+
+def _newest_first(conn, folder, query, params, limit, offset, main_count, months):
+    """
+    One page of a newest-first query, from the main database and then the month files
+    main_count(): rows the query finds in the main database; months: (month, rows in it), newest first
+    """
+    rows = conn.execute(query.format(schema='main'), params + (limit, offset)).fetchall()
+    if len(rows) == limit:
+        return rows
+    offset = 0 if rows else offset - main_count()
+
+    for month, count in months:
+        if offset >= count:
+            offset -= count
+            continue
+        with attached(conn, folder, month) as schema:
+            rows += conn.execute(query.format(schema=schema), params + (limit - len(rows), offset)).fetchall()
+        offset = 0
+        if len(rows) == limit:
+            break
+    return rows
+
+
+def user_performance(conn, folder, user_id, limit, offset=0):
+    """
+    A user's performance_analytics rows with the interview's type and start time,
+    newest first, from the main database and then the archive
+    """
+    query = '''
+        SELECT pa.*, i.interview_type, i.started_at
+        FROM {schema}.performance_analytics pa
+        JOIN main.interviews i ON pa.interview_id = i.id
+        WHERE pa.user_id = ?
+        ORDER BY pa.created_at DESC
+        LIMIT ? OFFSET ?
+    '''
+    # A completed interview has exactly one performance_analytics row, so the
+    # archived interviews per month say which months the page needs
+    months = conn.execute('''
+        SELECT archived_month, COUNT(*) FROM interviews
+        WHERE user_id = ? AND archived_month IS NOT NULL
+        GROUP BY archived_month ORDER BY archived_month DESC
+    ''', (user_id,)).fetchall()
+    return _newest_first(conn, folder, query, (user_id,), limit, offset, lambda: conn.execute(
+        'SELECT COUNT(*) FROM performance_analytics WHERE user_id = ?', (user_id,)).fetchone()[0], months)
+
+
+def all_performance(conn, folder, limit, offset=0):
+    """
+    One page of every performance_analytics row with username and interview details,
+    newest first, from the main database and then the archive
+    """
+    query = '''
+        SELECT pa.*, u.username, i.interview_type, i.started_at
+        FROM {schema}.performance_analytics pa
+        JOIN main.users u ON pa.user_id = u.id
+        JOIN main.interviews i ON pa.interview_id = i.id
+        ORDER BY pa.created_at DESC
+        LIMIT ? OFFSET ?
+    '''
+    months = conn.execute('''
+        SELECT month, interview_count FROM archive_months ORDER BY month DESC
+    ''').fetchall()
+    return _newest_first(conn, folder, query, (), limit, offset, lambda: conn.execute(
+        'SELECT COUNT(*) FROM performance_analytics').fetchone()[0], months)
+
+
+def performance_count(conn):
+    """Number of performance_analytics rows, archived ones included"""
+    return conn.execute('''
+        SELECT (SELECT COUNT(*) FROM performance_analytics)
+             + (SELECT COALESCE(SUM(interview_count), 0) FROM archive_months)
+    ''').fetchone()[0]
+
+
+def archived_months(conn):
+    """Months in the archive, newest first"""
+    return [row[0] for row in conn.execute('SELECT month FROM archive_months ORDER BY month DESC')]
+
+
+def each_schema(conn, folder):
+    """
+    Yields 'main' and then 'archive' once for every month file (attached in turn),
+    for offline jobs that read all history (analytics_job.py)
+    """
+    yield 'main'
+    for month in archived_months(conn):
+        with attached(conn, folder, month) as schema:
+            yield schema
+
+
+# ==================== ARCHIVING ====================
+
+@contextmanager
+def folder_lock(folder):
+    """Only one archive or compact run at a time"""
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, '.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise SystemExit(f'Another archive job is running on {folder}')
+        yield
+
+
+def _prepare_month(conn, path):
+    """Attach a month file for writing, creating its tables with the main database's columns"""
+    if os.path.exists(path):
+        os.chmod(path, 0o644)
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    conn.execute('PRAGMA archive.journal_mode = DELETE')  # Atomic commits with the main database
+    for table in ARCHIVED_TABLES:
+        sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                           (table,)).fetchone()[0]
+        conn.execute(sql.replace(f'CREATE TABLE {table}', f'CREATE TABLE IF NOT EXISTS archive.{table}', 1))
+        # Columns added to the main database by later migrations
+        existing = {row[1] for row in conn.execute(f'PRAGMA archive.table_info({table})')}
+        for _, name, column_type, _, _, _ in conn.execute(f'PRAGMA main.table_info({table})').fetchall():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE archive.{table} ADD COLUMN {name} {column_type}')
+    for sql in ARCHIVE_INDEXES:
+        conn.execute(sql)
+
+
+def _move_chunk(conn, month, start, end, cutoff, chunk_size):
+    """Move up to chunk_size interviews of one month in one transaction; returns (interviews, responses)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM temp.archive_chunk')
+        conn.execute('''
+            INSERT INTO temp.archive_chunk (id)
+            SELECT id FROM main.interviews
+            WHERE archived_month IS NULL AND completed_at >= ? AND completed_at < ? AND completed_at < ?
+                AND status = 'Completed'
+            ORDER BY completed_at LIMIT ?
+        ''', (start, end, cutoff, chunk_size))
+        interviews = conn.execute('SELECT COUNT(*) FROM temp.archive_chunk').fetchone()[0]
+        if not interviews:
+            conn.execute('COMMIT')
+            return 0, 0
+
+        for table in ARCHIVED_TABLES:
+            columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+            # OR REPLACE: rows left by a copy whose transaction did not commit are overwritten
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE interview_id IN (SELECT id FROM temp.archive_chunk)
+            ''')
+
+        responses = conn.execute('''
+            SELECT COUNT(*) FROM main.interview_responses
+            WHERE interview_id IN (SELECT id FROM temp.archive_chunk)
+        ''').fetchone()[0]
+        remove_from_index(conn, conn.execute('''
+            SELECT ir.id, ir.user_answer FROM main.interview_responses ir
+            JOIN main.answer_signatures s ON s.response_id = ir.id
+            WHERE ir.interview_id IN (SELECT id FROM temp.archive_chunk)
+        ''').fetchall())
+        bump_data_version(conn, 'answers')  # Archived answers left the near-duplicate index
+        for table in ARCHIVED_TABLES:
+            conn.execute(f'DELETE FROM main.{table} WHERE interview_id IN (SELECT id FROM temp.archive_chunk)')
+        conn.execute('UPDATE main.interviews SET archived_month = ? WHERE id IN (SELECT id FROM temp.archive_chunk)',
+                     (month,))
+        conn.execute('''
+            INSERT INTO main.archive_months (month, interview_count, response_count, archived_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (month) DO UPDATE SET
+                interview_count = interview_count + excluded.interview_count,
+                response_count = response_count + excluded.response_count,
+                archived_at = excluded.archived_at,
+                compacted_at = NULL
+        ''', (month, interviews, responses))
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return interviews, responses
+
+
+def _next_month(month):
+    year, number = map(int, month.split('-'))
+    return f'{year + number // 12}-{number % 12 + 1:02d}'
+
+
+def archive(database=DEFAULT_DATABASE, folder=ARCHIVE_FOLDER, days=ARCHIVE_AFTER_DAYS,
+            chunk_size=CHUNK_INTERVIEWS, pause=0.05):
+    """
+    Move completed interviews older than `days` into the month files
+    Sleeps `pause` seconds between transactions so the web server can write
+    Returns (interviews, responses) moved
+    """
+    # Local time, like interviews.completed_at (set by finish_interview in app.py)
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    total_interviews = total_responses = 0
+    with folder_lock(folder):
+        conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # In WAL mode SQLite commits each attached file separately, not atomically together
+            raise SystemExit('Archiving needs the main database in rollback journal mode, not WAL')
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_chunk (id INTEGER PRIMARY KEY)')
+        months = [row[0] for row in conn.execute('''
+            SELECT DISTINCT substr(completed_at, 1, 7) FROM interviews
+            WHERE archived_month IS NULL AND completed_at < ? AND status = 'Completed'
+            ORDER BY 1
+        ''', (cutoff,))]
+        for month in months:
+            path = archive_path(folder, month)
+            _prepare_month(conn, path)
+            try:
+                start, end = f'{month}-01', f'{_next_month(month)}-01'
+                moved = 0
+                while True:
+                    interviews, responses = _move_chunk(conn, month, start, end, cutoff, chunk_size)
+                    if not interviews:
+                        break
+                    moved += interviews
+                    total_interviews += interviews
+                    total_responses += responses
+                    time.sleep(pause)
+            finally:
+                conn.execute('DETACH DATABASE archive')
+                os.chmod(path, 0o444)
+            print(f'{month}: {moved} interviews archived to {path}')
+        conn.close()
+    return total_interviews, total_responses
+
+
+# ==================== COMPACTION ====================
+
+def compact(database=DEFAULT_DATABASE, folder=ARCHIVE_FOLDER, full=False, pages=VACUUM_PAGES, pause=0.05):
+    """Rewrite month files changed since their last compaction, then shrink the main database"""
+    with folder_lock(folder):
+        conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+        months = [row[0] for row in conn.execute(
+            'SELECT month FROM archive_months WHERE compacted_at IS NULL ORDER BY month')]
+        for month in months:
+            path = archive_path(folder, month)
+            tmp_path = path + '.tmp'
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)  # Left over from an interrupted compaction
+            before = os.path.getsize(path)
+            month_conn = sqlite3.connect(path, isolation_level=None)
+            month_conn.execute('VACUUM INTO ?', (tmp_path,))
+            month_conn.close()
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+            conn.execute('UPDATE archive_months SET compacted_at = CURRENT_TIMESTAMP WHERE month = ?', (month,))
+            print(f'{month}: {before} -> {os.path.getsize(path)} bytes')
+
+        before = os.path.getsize(database)
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum != 2 and full:
+            # One-time switch to incremental auto_vacuum; blocks writers while it runs
+            print('Full VACUUM of the main database...', flush=True)
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        elif auto_vacuum != 2:
+            print('The main database cannot be shrunk in steps; run "compact --full" once (blocks writes while it runs)')
+        else:
+            while conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                # executescript runs the pragma to completion; execute() stops after the first page
+                conn.executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+                time.sleep(pause)
+        print(f'Main database: {before} -> {os.path.getsize(database)} bytes')
+        conn.close()
+
+
+def status(database=DEFAULT_DATABASE, folder=ARCHIVE_FOLDER):
+    conn = sqlite3.connect(database)
+    rows = conn.execute('''
+        SELECT month, interview_count, response_count, archived_at, compacted_at
+        FROM archive_months ORDER BY month
+    ''').fetchall()
+    for month, interviews, responses, archived_at, compacted_at in rows:
+        path = archive_path(folder, month)
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        print(f'{month}: {interviews} interviews, {responses} responses, '
+              f'{size if size is not None else "MISSING"} bytes, archived {archived_at}, '
+              f'compacted {compacted_at or "never"}')
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0] * page_size
+    print(f'Main database: {os.path.getsize(database)} bytes ({free} bytes free)')
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DEFAULT_DATABASE, help='SQLite database path')
+    parser.add_argument('--folder', default=ARCHIVE_FOLDER, help='folder of the month files')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='archive old completed interviews')
+    run_parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS, help='archive interviews completed before this many days ago')
+    run_parser.add_argument('--chunk-size', type=int, default=CHUNK_INTERVIEWS, help='interviews moved per transaction')
+    run_parser.add_argument('--pause', type=float, default=0.05, help='seconds to wait between transactions')
+
+    compact_parser = subparsers.add_parser('compact', help='vacuum changed month files and the main database')
+    compact_parser.add_argument('--full', action='store_true', help='one full VACUUM to enable incremental vacuuming')
+    compact_parser.add_argument('--pages', type=int, default=VACUUM_PAGES, help='pages freed per step')
+    compact_parser.add_argument('--pause', type=float, default=0.05, help='seconds to wait between steps')
+
+    subparsers.add_parser('status', help='list the month files')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == 'run':
+        interviews, responses = archive(args.db, args.folder, args.days, args.chunk_size, args.pause)
+        print(f'Archived {interviews} interviews ({responses} responses) in {time.perf_counter() - started:.1f}s')
+    elif args.command == 'compact':
+        compact(args.db, args.folder, args.full, args.pages, args.pause)
+        print(f'Finished in {time.perf_counter() - started:.1f}s')
+    else:
+        status(args.db, args.folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+"""
+Near-Duplicate Answer Detection (MinHash + LSH)
+Finds answers that are copies of the ideal answer or of other candidates' answers
+
+Comparing a new answer with every stored answer is O(N). Instead:
+1. Every answer (its first MAX_WORDS words) is split into overlapping 3-word shingles
+2. A MinHash signature (NUM_PERM values) summarizes the shingle set; the
+   share of equal values estimates the Jaccard similarity of two answers
+3. The signature is cut into BANDS bands of ROWS values; answers with an identical band
+   land in the same bucket (Locality Sensitive Hashing). Near-duplicates
+   share at least one bucket with high probability, unrelated answers almost never
+4. Only answers in the same buckets are compared
+
+Tables (created by init_db in app.py):
+- answer_signatures: compact signature of each response (NUM_PERM 16-bit values)
+- answer_lsh_buckets: (band, bucket) -> response_id
+
+The signature and buckets are written with the response at submit time;
+matches are looked up when an admin opens an interview's results. The same
+statements bump the 'duplicates:<interview id>' data version of every
+interview with an answer in one of the new answer's buckets, so a cached
+results page (page_cache.py) is rendered again only when its matches may
+have changed.
+
+Similarity is measured on shingles, and each word is part of three of
+them, so it drops quickly: changing one word in twenty of an answer gives
+a similarity of about 0.7. With 16 bands of 4 rows, an answer with a
+similarity of 0.6 shares a bucket with probability 1 - (1 - 0.6^4)^16 = 0.89
+(0.9998 at 0.8), while answers with a similarity of 0.2 do with probability 0.03.
+
+Usage:
+    python duplicate_detection.py build                # index answers that are not indexed yet
+    python duplicate_detection.py build --rebuild      # rebuild the whole index
+    python duplicate_detection.py bench --db /tmp/scale.db
+"""
+
+import argparse
+import hashlib
+import itertools
+import random
+import re
+import sqlite3
+import time
+import zlib
+
+import numpy as np
+
+from question_cache import bump_data_version
+
+NUM_PERM = 64                # MinHash values per answer
+BANDS = 16                   # LSH bands
+ROWS = 4                     # MinHash values per band (BANDS * ROWS <= NUM_PERM)
+SHINGLE_SIZE = 3             # Words per shingle
+MIN_WORDS = 10               # Shorter answers are not indexed (too many harmless matches)
+MAX_WORDS = 1000             # Only the first words are shingled (as nlp_evaluator.MAX_ANSWER_TOKENS)
+DUPLICATE_THRESHOLD = 0.6    # Estimated similarity reported as a near-duplicate
+MAX_CANDIDATES = 200         # Most bucket matches compared per lookup
+
+# Hash functions h(x) = high 32 bits of (a * x + b) mod 2^64 with odd a
+# (multiply-shift hashing: no modulo, so numpy computes it quickly).
+# Fixed seed: signatures must be comparable across processes and runs
+_rng = np.random.RandomState(20240501)
+_A = (_rng.randint(0, 2 ** 62, NUM_PERM, dtype=np.int64).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+_B = _rng.randint(0, 2 ** 62, NUM_PERM, dtype=np.int64).astype(np.uint64)
+_SHIFT = np.uint64(32)
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def shingle_hashes(text):
+    """
+    Set of 32-bit hashes of the answer's word shingles, or None if it is too short
+    Only the first MAX_WORDS words count, so a huge answer costs no more than a long one
+    """
+    words = [match.group() for match in itertools.islice(_WORD.finditer(text.lower()), MAX_WORDS)]
+    if len(words) < MIN_WORDS:
+        return None
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode())
+            for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash_many(texts):
+    """
+    MinHash signatures (uint32 arrays of NUM_PERM values) of many texts at once
+    None for texts that are too short
+    """
+    hash_sets = [shingle_hashes(text or '') for text in texts]
+    present = [hashes for hashes in hash_sets if hashes]
+    if not present:
+        return [None] * len(texts)
+
+    # One vectorized pass over the shingles of all texts, then the minimum per text
+    offsets = np.cumsum([0] + [len(hashes) for hashes in present[:-1]])
+    values = np.fromiter((h for hashes in present for h in hashes), dtype=np.uint64)
+    permuted = _A[:, None] * values[None, :]  # Wraps around at 2^64, as intended
+    permuted += _B[:, None]
+    permuted >>= _SHIFT
+    minimums = np.minimum.reduceat(permuted, offsets, axis=1).T.astype(np.uint32)
+
+    signatures = iter(minimums)
+    return [next(signatures) if hashes else None for hashes in hash_sets]
+
+
+def minhash(text):
+    return minhash_many([text])[0]
+
+
+def pack_signature(signature):
+    """Stored form: the low 16 bits of each value (128 bytes); enough to estimate similarity"""
+    return (signature & 0xFFFF).astype('<u2').tobytes()
+
+
+def band_keys(signature):
+    """
+    One 32-bit bucket key per band; with 1M answers a band has about one
+    chance in 4000 of an accidental key collision per lookup
+    """
+    return [int.from_bytes(hashlib.blake2b(signature[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                           digest_size=4).digest(), 'little', signed=True)
+            for band in range(BANDS)]
+
+
+def estimate_similarity(packed_a, packed_b):
+    """Estimated Jaccard similarity of two stored signatures"""
+    a = np.frombuffer(packed_a, dtype='<u2')
+    b = np.frombuffer(packed_b, dtype='<u2')
+    # Unrelated 16-bit values are equal 1 time in 65536; correct for that
+    equal = float(np.count_nonzero(a == b)) / NUM_PERM
+    return max(0.0, (equal - 1 / 65536) / (1 - 1 / 65536))
+
+
+def index_statements(user_answer):
+    """
+    Statements (for the write queue) that index an answer; they must directly
+    follow the INSERT INTO interview_responses, whose id they read with last_insert_rowid()
+    """
+    signature = minhash(user_answer)
+    if signature is None:
+        return []
+    keys = band_keys(signature)
+    bucket_params = tuple(value for band, key in enumerate(keys) for value in (band, key))
+    return [
+        # response_id is the rowid, so last_insert_rowid() stays the response's id
+        ('INSERT INTO answer_signatures (response_id, signature) VALUES (last_insert_rowid(), ?)',
+         (pack_signature(signature),)),
+        ('INSERT INTO answer_lsh_buckets (band, bucket, response_id) VALUES ' +
+         ', '.join(['(?, ?, last_insert_rowid())'] * BANDS), bucket_params),
+        # Interviews whose answers share a bucket may have a new match (their own included)
+        (f'''
+            INSERT INTO data_versions (name, version, changed_at)
+            SELECT DISTINCT 'duplicates:' || ir.interview_id, 1, CURRENT_TIMESTAMP
+            FROM answer_lsh_buckets b JOIN interview_responses ir ON ir.id = b.response_id
+            WHERE {' OR '.join(['(b.band = ? AND b.bucket = ?)'] * BANDS)}
+            ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+        ''', bucket_params),
+    ]
+
+
+def remove_from_index(conn, responses):
+    """
+    Take answers out of the index (used when they are archived)
+    responses: (response_id, user_answer) pairs; the bucket rows are found by
+    computing the band keys again, since stored signatures keep only 16 bits
+    """
+    signature_ids, bucket_rows = [], []
+    for (response_id, _), signature in zip(responses, minhash_many([row[1] for row in responses])):
+        if signature is None:
+            continue
+        signature_ids.append((response_id,))
+        bucket_rows.extend((band, key, response_id) for band, key in enumerate(band_keys(signature)))
+    conn.executemany('DELETE FROM answer_lsh_buckets WHERE band = ? AND bucket = ? AND response_id = ?', bucket_rows)
+    conn.executemany('DELETE FROM answer_signatures WHERE response_id = ?', signature_ids)
+
+
+def find_similar(conn, text, exclude_user_id=None, exclude_response_id=None, limit=5):
+    """
+    Stored answers that are near-duplicates of `text`, most similar first
+    Returns a list of dicts: response_id, interview_id, user_id, username, similarity
+    """
+    signature = minhash(text)
+    if signature is None:
+        return []
+    keys = band_keys(signature)
+    # OR of (band, bucket) pairs: one primary key seek per band
+    candidates = conn.execute(f'''
+        SELECT DISTINCT response_id FROM answer_lsh_buckets
+        WHERE {' OR '.join(['(band = ? AND bucket = ?)'] * BANDS)}
+        LIMIT ?
+    ''', tuple(value for band, key in enumerate(keys) for value in (band, key)) + (MAX_CANDIDATES,)).fetchall()
+    ids = [row[0] for row in candidates if row[0] != exclude_response_id]
+    if not ids:
+        return []
+
+    rows = conn.execute(f'''
+        SELECT s.response_id, s.signature, ir.interview_id, i.user_id, u.username
+        FROM answer_signatures s
+        JOIN interview_responses ir ON ir.id = s.response_id
+        JOIN interviews i ON i.id = ir.interview_id
+        JOIN users u ON u.id = i.user_id
+        WHERE s.response_id IN ({', '.join('?' * len(ids))})
+    ''', ids).fetchall()
+
+    packed = pack_signature(signature)
+    matches = []
+    for response_id, stored, interview_id, user_id, username in rows:
+        if user_id == exclude_user_id:
+            continue  # Repeating your own earlier answer is not copying
+        similarity = estimate_similarity(packed, stored)
+        if similarity >= DUPLICATE_THRESHOLD:
+            matches.append({'response_id': response_id, 'interview_id': interview_id, 'user_id': user_id,
+                            'username': username, 'similarity': round(similarity, 2)})
+    matches.sort(key=lambda match: -match['similarity'])
+    return matches[:limit]
+
+
+def ideal_answer_similarity(user_answer, ideal_answer):
+    """Estimated similarity to the ideal answer, or None if either text is too short"""
+    signatures = minhash_many([user_answer, ideal_answer])
+    if signatures[0] is None or signatures[1] is None:
+        return None
+    return round(estimate_similarity(pack_signature(signatures[0]), pack_signature(signatures[1])), 2)
+
+
+def build_index(database, rebuild=False, chunk_size=20000):
+    """Index the answers that have no signature yet (all answers with rebuild=True)"""
+    conn = sqlite3.connect(database)
+    if rebuild:
+        conn.execute('DELETE FROM answer_lsh_buckets')
+        conn.execute('DELETE FROM answer_signatures')
+        conn.commit()
+
+    # Into an empty index, bucket rows are first appended to a plain table and
+    # the index is then built in key order once, instead of inserting 16 rows
+    # per answer at random places in the B-tree
+    bulk = conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM answer_lsh_buckets LIMIT 1)').fetchone()[0] == 0
+    bucket_table = 'answer_lsh_buckets'
+    if bulk:
+        # Signatures without buckets are left over from an interrupted build
+        conn.execute('DELETE FROM answer_signatures')
+        bucket_table = 'answer_lsh_buckets_staging'
+        conn.execute(f'DROP TABLE IF EXISTS {bucket_table}')
+        conn.execute(f'CREATE TABLE {bucket_table} (band INTEGER, bucket INTEGER, response_id INTEGER)')
+
+    started = time.perf_counter()
+    last_id = 0
+    indexed = scanned = 0
+    while True:
+        rows = conn.execute('''
+            SELECT ir.id, ir.user_answer FROM interview_responses ir
+            WHERE ir.id > ? AND NOT EXISTS (SELECT 1 FROM answer_signatures s WHERE s.response_id = ir.id)
+            ORDER BY ir.id LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        scanned += len(rows)
+
+        signature_rows, bucket_rows = [], []
+        for (response_id, _), signature in zip(rows, minhash_many([row[1] for row in rows])):
+            if signature is None:
+                continue
+            signature_rows.append((response_id, pack_signature(signature)))
+            bucket_rows.extend((band, key, response_id) for band, key in enumerate(band_keys(signature)))
+        conn.executemany('INSERT INTO answer_signatures (response_id, signature) VALUES (?, ?)', signature_rows)
+        conn.executemany(f'INSERT INTO {bucket_table} (band, bucket, response_id) VALUES (?, ?, ?)',
+                         sorted(bucket_rows))
+        conn.commit()
+        indexed += len(signature_rows)
+        elapsed = time.perf_counter() - started
+        print(f'\r{scanned} answers scanned, {indexed} indexed ({scanned / elapsed:.0f}/s)', end='', flush=True)
+
+    if bulk:
+        print('\nBuilding the bucket index...', end='', flush=True)
+        conn.execute(f'''
+            INSERT INTO answer_lsh_buckets (band, bucket, response_id)
+            SELECT band, bucket, response_id FROM {bucket_table} ORDER BY band, bucket, response_id
+        ''')
+        conn.execute(f'DROP TABLE {bucket_table}')
+        conn.commit()
+
+    bump_data_version(conn, 'answers')  # Cached admin pages show the new matches (page_cache.py)
+    conn.commit()
+    conn.close()
+    elapsed = time.perf_counter() - started
+    print(f'\nIndexed {indexed} of {scanned} answers in {elapsed:.1f}s')
+    return indexed
+
+
+def _index_size(conn):
+    """Bytes used by the signature table and the bucket index (needs the dbstat table)"""
+    try:
+        return conn.execute('''
+            SELECT SUM(pgsize) FROM dbstat WHERE name IN ('answer_signatures', 'answer_lsh_buckets')
+        ''').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def _near_copy(rng, text):
+    """A copy of `text` with about 3% of its words changed"""
+    words = text.split()
+    for _ in range(max(1, len(words) // 30)):
+        words[rng.randrange(len(words))] = rng.choice(['really', 'basically', 'also', 'mostly', 'just'])
+    return ' '.join(words)
+
+
+def bench(database, queries, seed=42):
+    """Lookup latency and recall with the LSH index, against scanning every signature"""
+    conn = sqlite3.connect(database)
+    rng = random.Random(seed)
+    total = conn.execute('SELECT COUNT(*) FROM answer_signatures').fetchone()[0]
+    if not total:
+        print('The index is empty. Run: python duplicate_detection.py build')
+        return
+    max_id = conn.execute('SELECT MAX(response_id) FROM answer_signatures').fetchone()[0]
+
+    # Near-copies of random stored answers: each should find its original
+    samples = []
+    while len(samples) < queries:
+        row = conn.execute('''
+            SELECT ir.id, ir.user_answer FROM answer_signatures s
+            JOIN interview_responses ir ON ir.id = s.response_id
+            WHERE s.response_id >= ? ORDER BY s.response_id LIMIT 1
+        ''', (rng.randint(1, max_id),)).fetchone()
+        samples.append((row[0], _near_copy(rng, row[1])))
+
+    latencies, found, matches = [], 0, 0
+    for response_id, text in samples:
+        started = time.perf_counter()
+        result = find_similar(conn, text, limit=MAX_CANDIDATES)
+        latencies.append(time.perf_counter() - started)
+        found += any(match['response_id'] == response_id for match in result)
+        matches += len(result)
+    latencies.sort()
+
+    # Baseline: compare one answer with every stored signature
+    scan_queries = min(3, queries)
+    started = time.perf_counter()
+    for _, text in samples[:scan_queries]:
+        packed = np.frombuffer(pack_signature(minhash(text)), dtype='<u2')
+        for (stored,) in conn.execute('SELECT signature FROM answer_signatures'):
+            np.count_nonzero(packed == np.frombuffer(stored, dtype='<u2'))
+    scan_time = (time.perf_counter() - started) / scan_queries
+
+    size = _index_size(conn)
+    conn.close()
+    print(f'{total} indexed answers, {queries} lookups of near-copies (3% of words changed)')
+    print(f'  LSH lookup: p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, '
+          f'p99 {latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000:.2f} ms')
+    print(f'  full scan:  {scan_time * 1000:.0f} ms per lookup')
+    print(f'  recall: {found / queries:.1%} of originals found, {matches / queries:.2f} matches per lookup')
+    if size:
+        print(f'  index size: {size / 1024 / 1024:.1f} MB ({size / total:.0f} bytes per answer)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Near-duplicate answer index')
+    parser.add_argument('command', choices=['build', 'bench'])
+    parser.add_argument('--db', default='instance/interview_system.db', help='database file')
+    parser.add_argument('--rebuild', action='store_true', help='build: drop the index and index every answer')
+    parser.add_argument('--chunk-size', type=int, default=20000, help='build: answers per transaction')
+    parser.add_argument('--queries', type=int, default=500, help='bench: lookups to time')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.db, args.rebuild, args.chunk_size)
+    else:
+        bench(args.db, args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,555 @@
+"""
+Local Evaluation Service
+Runs nlp_evaluator in a pool of long-lived processes shared by all web workers
+
+Without it every server worker loads its own copy of scikit-learn, the
+NLTK data and the evaluator caches. With it the workers only hold a small
+client. The service loads and warms up the models once, then forks its
+evaluation processes (one per CPU by default), which share them copy-on-write.
+
+Protocol (Unix domain socket):
+- Every message is a 4-byte big-endian length followed by UTF-8 JSON
+- Request:  {"id": 1, "args": {...evaluate_answer arguments...}, "timeout": 5}  or  {"id": 1, "ping": true}
+            or  {"id": 1, "draft": {"key": ..., "question": [...], "update": {...}}}
+            or  {"id": 1, "quick": {...quick_evaluate arguments...}}
+- Response: {"id": 1, "result": {...}}  or  {"id": 1, "error": "..."}  or  {"id": 1, "stats": {...}}
+            or  {"id": 1, "resync": true} (draft updates, see live_scoring.py)
+
+Evaluations from all connections wait in one queue. Whenever an evaluation
+process is free, a dispatcher thread takes what is waiting (its share, at
+most --batch-size) and sends it to that process as one task, so under load
+many answers cost one round trip to the pool; the replies for one
+connection are sent in one write. An evaluation still waiting when the
+client's timeout has passed is skipped: the client has given up and
+evaluated the answer itself. Live draft updates
+take microseconds, so they are answered right away on the connection's
+thread; the drafts of all web workers are kept here, in one DraftStore. So
+are quick evaluations (admission.py): they are asked for when the
+evaluation processes are already overloaded.
+
+EvaluatorClient.evaluate() returns None when the service is not running or
+did not answer within the timeout, so app.py can evaluate in its own
+process instead.
+
+Usage:
+    python evaluator_service.py --socket instance/evaluator.sock --db instance/interview_system.db
+    python evaluator_service.py bench --workers 8
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sqlite3
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+HEADER = struct.Struct('>I')
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024  # Answers are at most 1 MB (MAX_CONTENT_LENGTH)
+
+
+def encode_message(message):
+    data = json.dumps(message, separators=(',', ':')).encode()
+    return HEADER.pack(len(data)) + data
+
+
+def write_message(sock, message):
+    sock.sendall(encode_message(message))
+
+
+def read_message(reader):
+    """Read one message from a socket file; None when the other side closed the connection"""
+    header = reader.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    size, = HEADER.unpack(header)
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f'Message of {size} bytes is too large')
+    body = reader.read(size)
+    if len(body) < size:
+        return None
+    return json.loads(body)
+
+
+def _init_evaluation_process():
+    # Ctrl+C and SIGTERM are for the service, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _evaluate_batch(items):
+    """
+    Runs in an evaluation process: evaluates [(args, deadline)] one after the other
+    Returns one (kind, value) per item: ('result', evaluation), ('error', text), or
+    ('expired', None) when the client stopped waiting before the evaluation started
+    """
+    from nlp_evaluator import evaluate_answer
+
+    results = []
+    for args, deadline in items:
+        if deadline is not None and time.monotonic() > deadline:
+            results.append(('expired', None))
+            continue
+        try:
+            results.append(('result', evaluate_answer(**args)))
+        except Exception as error:
+            results.append(('error', f'{type(error).__name__}: {error}'))
+    return results
+
+
+class EvaluatorService:
+    """Accepts connections and evaluates their requests in batches, in a pool of processes"""
+
+    def __init__(self, path, processes=None, batch_size=16, max_drafts=1000):
+        from live_scoring import DraftStore
+
+        self.path = path
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.pool = None
+        self.pending = queue.Queue()  # (message, deadline, connection, connection lock)
+        self.free = threading.Semaphore(self.processes)  # Evaluation processes without a batch
+        self.drafts = DraftStore(max_drafts)
+        self.lock = threading.Lock()
+        self.evaluated = 0
+        self.expired = 0
+        self.batches = 0
+        self.started = time.time()
+
+    def stats(self):
+        return {
+            'pid': os.getpid(),
+            'processes': [process.pid for process in multiprocessing.active_children()],
+            'evaluated': self.evaluated,
+            'expired': self.expired,
+            'batches': self.batches,
+            'pending': self.pending.qsize(),
+            'drafts': len(self.drafts.sessions),
+            'uptime_s': round(time.time() - self.started, 1),
+        }
+
+    def handle(self, conn):
+        """Read requests from one client connection"""
+        lock = threading.Lock()  # Replies are written by the evaluation thread too
+        reader = conn.makefile('rb')
+        try:
+            while True:
+                message = read_message(reader)
+                if message is None:
+                    break
+                if message.get('ping'):
+                    with lock:
+                        write_message(conn, {'id': message.get('id'), 'stats': self.stats()})
+                elif 'draft' in message:
+                    reply = self.update_draft(message)
+                    with lock:
+                        write_message(conn, reply)
+                elif 'quick' in message:
+                    reply = self.quick_evaluate(message)
+                    with lock:
+                        write_message(conn, reply)
+                else:
+                    self.submit(message, conn, lock)
+        except (OSError, ValueError):
+            pass  # Client went away or sent garbage
+        finally:
+            reader.close()
+            conn.close()
+
+    def update_draft(self, message):
+        try:
+            draft = message['draft']
+            scores = self.drafts.update(draft['key'], draft['question'], draft['update'])
+        except (KeyError, TypeError, ValueError) as error:
+            return {'id': message.get('id'), 'error': str(error)}
+        if scores is None:
+            return {'id': message.get('id'), 'resync': True}
+        return {'id': message.get('id'), 'result': scores}
+
+    def quick_evaluate(self, message):
+        from nlp_evaluator import quick_evaluate
+
+        try:
+            return {'id': message.get('id'), 'result': quick_evaluate(**message['quick'])}
+        except Exception as error:
+            return {'id': message.get('id'), 'error': f'{type(error).__name__}: {error}'}
+
+    def submit(self, message, conn, lock):
+        """Queue an evaluation for the dispatcher"""
+        timeout = message.get('timeout')
+        deadline = time.monotonic() + timeout if timeout else None
+        self.pending.put((message, deadline, conn, lock))
+
+    def dispatch(self):
+        """Whenever an evaluation process is free, send it what is waiting as one task"""
+        while True:
+            self.free.acquire()
+            batch = [self.pending.get()]
+            # Its share of the queue, so the other processes get work too as they become free
+            share = -(-(self.pending.qsize() + 1) // self.processes)
+            while len(batch) < min(share, self.batch_size):
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            items = [(message.get('args') or {}, deadline) for message, deadline, _, _ in batch]
+
+            def failed(error, batch=batch):
+                self.reply(batch, [('error', f'{type(error).__name__}: {error}')] * len(batch))
+
+            self.pool.apply_async(_evaluate_batch, (items,), callback=lambda results, batch=batch:
+                                  self.reply(batch, results), error_callback=failed)
+
+    def reply(self, batch, results):
+        """Runs on the pool's result thread: send every connection its replies in one write"""
+        self.free.release()
+        replies = {}  # connection -> (lock, [encoded replies])
+        for (message, _, conn, lock), (kind, value) in zip(batch, results):
+            if kind == 'expired':
+                reply = {'id': message.get('id'), 'error': 'Expired'}
+            else:
+                reply = {'id': message.get('id'), kind: value}
+            replies.setdefault(conn, (lock, []))[1].append(encode_message(reply))
+        with self.lock:
+            self.batches += 1
+            self.expired += sum(kind == 'expired' for kind, _ in results)
+            self.evaluated += sum(kind != 'expired' for kind, _ in results)
+        for conn, (lock, data) in replies.items():
+            try:
+                with lock:
+                    conn.sendall(b''.join(data))
+            except OSError:
+                pass  # Client went away; it falls back to evaluating itself
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left over from a service that did not shut down cleanly
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.path)
+        os.chmod(self.path, 0o600)  # Only the user running the web server may connect
+        listener.listen(128)
+        # Forked before any connection thread starts, with the models already loaded
+        self.pool = multiprocessing.get_context('fork').Pool(self.processes, _init_evaluation_process)
+        threading.Thread(target=self.dispatch, name='dispatcher', daemon=True).start()
+        try:
+            while True:
+                conn, _ = listener.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+            self.pool.terminate()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def serve(path, database=None, processes=None, batch_size=16):
+    """Load and warm up the evaluator, then serve until SIGTERM or Ctrl+C"""
+    from nlp_evaluator import warm_up
+
+    ideal_answers = []
+    if database and os.path.exists(database):
+        conn = sqlite3.connect(database)
+        ideal_answers = conn.execute(
+            'SELECT ideal_answer, question_type FROM questions WHERE ideal_answer IS NOT NULL'
+        ).fetchall()
+        conn.close()
+    warm_up(ideal_answers)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    service = EvaluatorService(path, processes, batch_size)
+    print(f'Evaluator service listening on {path} (pid {os.getpid()}, '
+          f'{service.processes} evaluation processes)', flush=True)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+class EvaluatorClient:
+    """
+    Client used by the web workers
+    evaluate() returns None when the service is not available or slower than
+    timeout; after a failed connection or a timeout it is not tried again for
+    retry_interval seconds.
+    """
+
+    def __init__(self, path, timeout=5.0, retry_interval=5.0):
+        self.path = path
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.down_until = 0
+        self.ids = itertools.count(1)
+        self.local = threading.local()  # One connection per thread (and per process, see _connection)
+
+    def _connection(self):
+        """Returns (socket, reader, reused)"""
+        if getattr(self.local, 'pid', None) == os.getpid():
+            return self.local.sock, self.local.reader, True
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.local.sock, self.local.reader, self.local.pid = sock, sock.makefile('rb'), os.getpid()
+        return sock, self.local.reader, False
+
+    def _close(self):
+        if getattr(self.local, 'pid', None) == os.getpid():
+            self.local.reader.close()
+            self.local.sock.close()
+        self.local.pid = None
+
+    def _call(self, message):
+        if not self.path or time.monotonic() < self.down_until:
+            return None
+        for _ in range(2):
+            try:
+                sock, reader, reused = self._connection()
+            except OSError:
+                # Not running: do not try again on every request
+                self.down_until = time.monotonic() + self.retry_interval
+                return None
+            try:
+                write_message(sock, message)
+                reply = read_message(reader)
+                if reply is not None:
+                    return reply
+            except socket.timeout:
+                # Busy, not restarted: a retry would wait as long again. Its late
+                # reply must not be read by the next request, so the connection is closed
+                self._close()
+                self.down_until = time.monotonic() + self.retry_interval
+                return None
+            except (OSError, ValueError):
+                pass
+            self._close()
+            if not reused:
+                return None
+            # The service may have restarted since this connection was opened: try once more
+        return None
+
+    def evaluate(self, **args):
+        """evaluate_answer() in the service; None if it is down, slow or failed"""
+        reply = self._call({'id': next(self.ids), 'args': args, 'timeout': self.timeout})
+        if reply is None or 'result' not in reply:
+            return None
+        return reply['result']
+
+    def quick_evaluate(self, **args):
+        """quick_evaluate() in the service, answered without waiting for the evaluation processes"""
+        reply = self._call({'id': next(self.ids), 'quick': args})
+        if reply is None or 'result' not in reply:
+            return None
+        return reply['result']
+
+    def update_draft(self, key, question, update):
+        """
+        Apply a live draft update in the service (see live_scoring.py)
+        Returns the reply ({'result': ...}, {'resync': True} or {'error': ...}); None if the service is down
+        """
+        reply = self._call({'id': next(self.ids), 'draft': {'key': key, 'question': question, 'update': update}})
+        if reply is None or not ('result' in reply or 'resync' in reply or 'error' in reply):
+            return None
+        return reply
+
+    def ping(self):
+        """Service statistics, or None if it is not running"""
+        reply = self._call({'id': next(self.ids), 'ping': True})
+        return reply.get('stats') if reply else None
+
+
+# ==================== BENCHMARK ====================
+
+BENCH_QUESTIONS = [
+    ('What is Python?', 'Technical',
+     'Python is a high-level, interpreted programming language known for its simplicity and readability. '
+     'It supports multiple programming paradigms including procedural, object-oriented, and functional programming.'),
+    ('Tell me about yourself.', 'HR',
+     'I am a motivated professional with experience in software development. I enjoy solving problems, '
+     'working in teams and learning new technologies, and I am looking for a role where I can grow.'),
+    ('What is database normalization?', 'Technical',
+     'Database normalization is the process of organizing data to reduce redundancy and improve data integrity. '
+     'It divides large tables into smaller ones and defines relationships between them.'),
+]
+
+
+def _bench_answers(count):
+    words = ('python programming language experience project team database query table data design problem '
+             'solution performance testing skills communication learning object oriented function class module '
+             'normalization integrity redundancy the a and of to in for with on that this is').split()
+    answers = []
+    for i in range(count):
+        question, question_type, ideal = BENCH_QUESTIONS[i % len(BENCH_QUESTIONS)]
+        length = 30 + (i * 37) % 170
+        answer = ' '.join(words[(i * 7 + j * 3) % len(words)] for j in range(length))
+        answers.append({'question_text': question, 'user_answer': answer,
+                        'question_type': question_type, 'ideal_answer': ideal})
+    return answers
+
+
+def _latencies(evaluate, answers):
+    latencies = []
+    for args in answers:
+        started = time.perf_counter()
+        evaluate(args)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {'p50_ms': round(statistics.median(latencies), 2),
+            'p99_ms': round(latencies[max(0, int(len(latencies) * 0.99) - 1)], 2)}
+
+
+def _memory_run(mode, workers, evaluations, path, results):
+    """
+    Measure the memory of `workers` forked web workers (in a fresh process)
+    preloaded: the parent loads nlp_evaluator before forking, like serve.py does
+    per-worker: every worker loads nlp_evaluator itself (the service went down after startup,
+                or a server that does not preload)
+    service: the workers only have the client and send evaluations to the service
+    """
+    import gc
+    from serve import memory_usage
+
+    import app  # noqa: F401 (what every web worker has loaded)
+    client = EvaluatorClient(path)
+
+    def evaluate_in_process(args):
+        from nlp_evaluator import evaluate_answer
+        return evaluate_answer(**args)
+
+    if mode == 'preloaded':
+        from nlp_evaluator import warm_up
+        warm_up([(ideal, question_type) for _, question_type, ideal in BENCH_QUESTIONS])
+        evaluate = evaluate_in_process
+    elif mode == 'per-worker':
+        evaluate = evaluate_in_process
+    else:
+        evaluate = lambda args: client.evaluate(**args)  # noqa: E731
+    gc.collect()
+    gc.freeze()
+
+    answers = _bench_answers(evaluations)
+    ready_read, ready_write = os.pipe()
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            for args in answers:
+                evaluate(args)
+            os.write(ready_write, b'.')
+            time.sleep(600)
+            os._exit(0)
+        pids.append(pid)
+    for _ in range(workers):
+        os.read(ready_read, 1)
+
+    total = memory_usage(os.getpid())['pss']
+    for pid in pids:
+        total += memory_usage(pid)['pss']
+    for pid in pids:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    results.put(total)
+
+
+def _throughput(evaluate, answers, clients):
+    """Evaluations per second with `clients` threads evaluating at the same time"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(evaluate, answers))
+    return len(answers) / (time.perf_counter() - started)
+
+
+def bench(workers, evaluations, path=None):
+    """Latency overhead and throughput of the service, and total memory of `workers` web workers with and without it"""
+    import multiprocessing
+    from serve import memory_usage
+
+    # Fresh processes, so each measurement starts without the other's imports
+    context = multiprocessing.get_context('spawn')
+    service = None
+    folder = tempfile.mkdtemp(prefix='evaluator-')
+    if not path:
+        path = os.path.join(folder, 'evaluator.sock')
+        service = context.Process(target=serve, args=(path,))  # Not a daemon: it forks its pool
+        service.start()
+    client = EvaluatorClient(path, retry_interval=0)
+    deadline = time.monotonic() + 60
+    while not client.ping():
+        if time.monotonic() > deadline:
+            raise RuntimeError('Evaluator service did not start')
+        time.sleep(0.2)
+
+    from nlp_evaluator import evaluate_answer, warm_up
+    warm_up([(ideal, question_type) for _, question_type, ideal in BENCH_QUESTIONS])
+    answers = _bench_answers(evaluations)
+    in_process = _latencies(lambda args: evaluate_answer(**args), answers)
+    via_service = _latencies(lambda args: client.evaluate(**args), answers)
+    print(f'Latency over {evaluations} evaluations:')
+    print(f"  in-process: p50 {in_process['p50_ms']} ms, p99 {in_process['p99_ms']} ms")
+    print(f"  service:    p50 {via_service['p50_ms']} ms, p99 {via_service['p99_ms']} ms "
+          f"(+{via_service['p50_ms'] - in_process['p50_ms']:.2f} ms at p50)")
+    # In-process threads share one core (the GIL); the service spreads them over its processes
+    print(f'Throughput with {workers} concurrent clients:')
+    print(f'  in-process threads: {_throughput(lambda args: evaluate_answer(**args), answers, workers):7.1f} /s')
+    before = client.ping()
+    rate = _throughput(lambda args: client.evaluate(**args), answers, workers)
+    after = client.ping()
+    per_batch = (after['evaluated'] - before['evaluated']) / max(1, after['batches'] - before['batches'])
+    print(f"  service:            {rate:7.1f} /s ({len(after['processes'])} evaluation processes, "
+          f"{per_batch:.1f} answers per batch)")
+
+    memory = {}
+    for mode in ('preloaded', 'per-worker', 'service'):
+        results = context.Queue()
+        process = context.Process(target=_memory_run, args=(mode, workers, min(evaluations, 50), path, results))
+        process.start()
+        memory[mode] = results.get()
+        process.join()
+    stats = client.ping()
+    service_pss = sum(memory_usage(pid)['pss'] for pid in [stats['pid']] + stats['processes'])
+    with_service = memory['service'] + service_pss
+    print(f'Memory (PSS) of {workers} workers and their parent:')
+    for mode in ('preloaded', 'per-worker'):
+        print(f"  in-process, {mode + ':':<12} {memory[mode] / 1024:7.1f} MB "
+              f"(service saves {(memory[mode] - with_service) / 1024:.1f} MB)")
+    print(f"  service:                {with_service / 1024:7.1f} MB "
+          f"({memory['service'] / 1024:.1f} MB workers + {service_pss / 1024:.1f} MB service "
+          f"with {len(stats['processes'])} evaluation processes)")
+
+    if service:
+        service.terminate()
+        service.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local evaluation service for the interview system')
+    parser.add_argument('command', nargs='?', default='serve', choices=['serve', 'bench'])
+    parser.add_argument('--socket', help='Unix socket path (bench: use a running service)')
+    parser.add_argument('--db', default='instance/interview_system.db',
+                        help='database whose ideal answers are preloaded')
+    parser.add_argument('--processes', type=int, help='evaluation processes (default: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=16, help='most evaluations sent to a process as one task')
+    parser.add_argument('--workers', type=int, default=8, help='bench: web workers to measure')
+    parser.add_argument('--evaluations', type=int, default=200, help='bench: evaluations for the latency test')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.workers, args.evaluations, args.socket)
+    else:
+        serve(args.socket or 'instance/evaluator.sock', args.db, args.processes, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Synthetic Dataset Generator
+Fills the database with realistic volumes of data for scale testing
+
+Generates (deterministically for a given --seed and --end-date):
+- users (all with the password 'password123')
+- questions with ideal answers, spread over HR and Technical categories
+- interviews spread over the last --days days
+- interview_responses with answers built from the ideal answer plus filler words
+- performance_analytics for every completed interview
+
+Scores are synthetic (based on each user's skill and the answer quality),
+not produced by nlp_evaluator, so millions of rows take minutes.
+Derived tables (question_stats, user_category_mastery, performance_rollups)
+are rebuilt from the generated rows by init_db at the end, and the
+'questions' and 'answers' data versions are bumped, so a server running on
+the database sees the new data. The near-duplicate answer index is not
+rebuilt; build it with duplicate_detection.py.
+
+Usage:
+    python generate_data.py --users 10000 --questions 2000 --interviews-per-user 20
+    python generate_data.py --db /tmp/scale.db --users 100000 --seed 7
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import app, init_db
+from question_cache import bump_data_version
+
+PASSWORD = 'password123'
+
+CATEGORIES = {
+    'HR': {
+        'General': ['background', 'experience', 'education', 'skills', 'career', 'interests'],
+        'Behavioral': ['conflict', 'deadline', 'mistake', 'feedback', 'pressure', 'initiative'],
+        'Motivation': ['company', 'culture', 'values', 'opportunity', 'mission', 'growth'],
+        'Career Goals': ['goal', 'future', 'plan', 'leadership', 'mentoring', 'aspiration'],
+        'Teamwork': ['team', 'collaboration', 'communication', 'support', 'trust', 'roles'],
+    },
+    'Technical': {
+        'Python': ['list', 'tuple', 'dictionary', 'generator', 'decorator', 'interpreter'],
+        'Database': ['normalization', 'index', 'transaction', 'join', 'query', 'schema'],
+        'Web Development': ['http', 'rest', 'routing', 'session', 'cookie', 'template'],
+        'Data Structures': ['stack', 'queue', 'tree', 'graph', 'hashing', 'heap'],
+        'Networking': ['tcp', 'udp', 'dns', 'router', 'protocol', 'packet'],
+        'Operating Systems': ['process', 'thread', 'scheduling', 'memory', 'deadlock', 'paging'],
+    },
+}
+
+QUESTION_TEMPLATES = {
+    'HR': [
+        'Describe a situation where {topic} mattered in your work.',
+        'How do you handle {topic} in a team?',
+        'What does {topic} mean to you in your career?',
+        'Tell us about your approach to {topic} and {other}.',
+    ],
+    'Technical': [
+        'What is {topic}?',
+        'Explain {topic} with an example.',
+        'Compare {topic} and {other}.',
+        'How would you use {topic} in a real project?',
+    ],
+}
+
+FILLER_WORDS = ('the a and of to in for with that this is it as by on we i my our was are be '
+                'also very some when then because so which can will would').split()
+
+DIFFICULTIES = ['Easy', 'Medium', 'Hard']
+DIFFICULTY_PENALTY = {'Easy': 0, 'Medium': 8, 'Hard': 18}
+
+
+def make_ideal_answer(rng, category, topic, words):
+    """A 4-6 sentence reference answer that uses the category's vocabulary"""
+    sentences = [f'{topic.capitalize()} is an important concept in {category.lower()}.']
+    for _ in range(rng.randint(3, 5)):
+        picked = rng.sample(words, 3)
+        sentences.append(
+            f'It relates to {picked[0]}, {picked[1]} and {picked[2]}, '
+            f'which {rng.choice(["helps", "allows", "means"])} the {rng.choice(FILLER_WORDS[-6:])} '
+            f'{rng.choice(["design", "work", "result", "team", "system"])} is clear and reliable.'
+        )
+    return ' '.join(sentences)
+
+
+def make_answer(rng, ideal_words, quality):
+    """
+    Candidate answer: a share of the ideal answer's words (more for better
+    answers) mixed with filler words, at 30%-150% of the ideal length
+    """
+    length = max(5, int(len(ideal_words) * rng.uniform(0.3, 1.5)))
+    ideal_count = int(length * quality)
+    words = rng.choices(ideal_words, k=ideal_count) + rng.choices(FILLER_WORDS, k=length - ideal_count)
+    rng.shuffle(words)
+    return ' '.join(words).capitalize() + '.'
+
+
+def make_feedback(score):
+    if score >= 85:
+        return 'Excellent answer! You demonstrated comprehensive understanding of the topic.'
+    if score >= 70:
+        return 'Good answer! You covered the main points well.'
+    if score >= 55:
+        return "Fair answer. You're on the right track but could add more detail."
+    if score >= 40:
+        return 'Your answer needs improvement. Try to be more specific and detailed.'
+    return 'Your answer is too brief or lacks relevant information. Please provide more context.'
+
+
+def _average(values):
+    return sum(values) / len(values) if values else 0
+
+
+def _timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class BatchWriter:
+    """Buffers rows per table and writes them with executemany"""
+
+    def __init__(self, conn, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, sql, row):
+        buffer = self.buffers.setdefault(sql, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(sql)
+
+    def flush(self, sql=None):
+        for key in ([sql] if sql else list(self.buffers)):
+            rows = self.buffers.get(key)
+            if rows:
+                self.conn.executemany(key, rows)
+                self.counts[key] = self.counts.get(key, 0) + len(rows)
+                rows.clear()
+
+
+INSERT_USER = '''INSERT INTO users (id, username, email, password, full_name, created_at, is_admin)
+                 VALUES (?, ?, ?, ?, ?, ?, 0)'''
+INSERT_QUESTION = '''INSERT INTO questions (id, question_text, question_type, category, difficulty, ideal_answer, created_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)'''
+INSERT_INTERVIEW = '''INSERT INTO interviews (id, user_id, interview_type, total_questions, started_at, completed_at, status)
+                      VALUES (?, ?, ?, ?, ?, ?, ?)'''
+INSERT_RESPONSE = '''INSERT INTO interview_responses
+                     (interview_id, question_id, user_answer, score, feedback, keywords_matched, answered_at)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)'''
+INSERT_ANALYTICS = '''INSERT INTO performance_analytics
+                      (user_id, interview_id, overall_score, hr_score, technical_score,
+                       total_questions, questions_answered, created_at)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def generate(database, users, questions, interviews_per_user, questions_per_interview,
+             days, seed, end_date, batch_size=50000):
+    """Generate the dataset; returns the number of rows written per table"""
+    rng = random.Random(seed)
+    app.config['DATABASE'] = database
+    init_db()
+
+    conn = sqlite3.connect(database)
+    # Bulk-load settings: no fsync and an in-memory journal. Fine for a
+    # generated test database, not for production data.
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA cache_size = -200000')
+    writer = BatchWriter(conn, batch_size)
+
+    def next_id(table):
+        return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+    start = end_date - timedelta(days=days)
+
+    # Questions (kept in memory; needed to build answers)
+    question_bank = {'HR': [], 'Technical': []}
+    first_question = next_id('questions')
+    for offset in range(questions):
+        question_type = 'HR' if rng.random() < 0.4 else 'Technical'
+        category = rng.choice(list(CATEGORIES[question_type]))
+        words = CATEGORIES[question_type][category]
+        topic, other = rng.sample(words, 2)
+        text = rng.choice(QUESTION_TEMPLATES[question_type]).format(topic=topic, other=other)
+        difficulty = rng.choice(DIFFICULTIES)
+        ideal_answer = make_ideal_answer(rng, category, topic, words)
+        question_id = first_question + offset
+        writer.add(INSERT_QUESTION, (question_id, text, question_type, category, difficulty,
+                                     ideal_answer, _timestamp(start)))
+        question_bank[question_type].append(
+            (question_id, question_type, difficulty, ideal_answer.lower().replace('.', '').replace(',', '').split(), words)
+        )
+    all_questions = question_bank['HR'] + question_bank['Technical']
+
+    # Users, each with their interviews, responses and analytics
+    password_hash = generate_password_hash(PASSWORD)  # Hashing is slow; one hash is shared
+    first_user = next_id('users')
+    interview_id = next_id('interviews')
+    for offset in range(users):
+        user_id = first_user + offset
+        username = f'user{user_id}'
+        joined = start + timedelta(seconds=rng.randint(0, days * 86400 // 2))
+        writer.add(INSERT_USER, (user_id, username, f'{username}@example.com', password_hash,
+                                 f'Test User {user_id}', _timestamp(joined)))
+        skill = rng.betavariate(2, 2)  # 0..1, most users are average
+
+        for _ in range(interviews_per_user):
+            interview_type = rng.choice(['HR', 'Technical', 'Mixed'])
+            pool = all_questions if interview_type == 'Mixed' else question_bank[interview_type]
+            if not pool:
+                continue
+            picked = rng.sample(pool, min(questions_per_interview, len(pool)))
+            started = joined + timedelta(seconds=rng.randint(0, max(1, int((end_date - joined).total_seconds()))))
+            completed = rng.random() > 0.05  # A few interviews are abandoned
+
+            scores = {'HR': [], 'Technical': []}
+            answered_at = started
+            for question_id, question_type, difficulty, ideal_words, words in picked:
+                quality = min(1.0, max(0.0, rng.gauss(skill, 0.15)))
+                score = 100 * (0.2 + 0.7 * quality) - DIFFICULTY_PENALTY[difficulty] + rng.gauss(0, 6)
+                score = round(min(100.0, max(0.0, score)), 2)
+                answered_at += timedelta(seconds=rng.randint(30, 300))
+                matched = rng.sample(words, min(len(words), max(0, int(quality * 5))))
+                writer.add(INSERT_RESPONSE, (interview_id, question_id, make_answer(rng, ideal_words, quality),
+                                             score, make_feedback(score), json.dumps(matched),
+                                             _timestamp(answered_at)))
+                scores[question_type].append(score)
+
+            all_scores = scores['HR'] + scores['Technical']
+            writer.add(INSERT_INTERVIEW, (interview_id, user_id, interview_type, len(picked), _timestamp(started),
+                                          _timestamp(answered_at) if completed else None,
+                                          'Completed' if completed else 'In Progress'))
+            if completed:
+                writer.add(INSERT_ANALYTICS, (user_id, interview_id, _average(all_scores), _average(scores['HR']),
+                                              _average(scores['Technical']), len(picked), len(picked),
+                                              _timestamp(answered_at)))
+            interview_id += 1
+
+    writer.flush()
+
+    # Rebuild derived tables from the generated rows
+    conn.execute('DELETE FROM question_stats')
+    conn.execute('DELETE FROM user_category_mastery')
+    conn.execute('DELETE FROM performance_rollups')
+    # A running server reloads its question cache and drops its cached pages
+    bump_data_version(conn, 'questions')
+    bump_data_version(conn, 'answers')
+    conn.commit()
+    conn.close()
+    init_db()
+
+    names = {INSERT_USER: 'users', INSERT_QUESTION: 'questions', INSERT_INTERVIEW: 'interviews',
+             INSERT_RESPONSE: 'interview_responses', INSERT_ANALYTICS: 'performance_analytics'}
+    return {names[sql]: count for sql, count in writer.counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic interview dataset')
+    parser.add_argument('--db', default=app.config['DATABASE'], help='SQLite database path')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--interviews-per-user', type=int, default=10)
+    parser.add_argument('--questions-per-interview', type=int, default=5)
+    parser.add_argument('--days', type=int, default=365, help='history length')
+    parser.add_argument('--end-date', default=datetime.now().strftime('%Y-%m-%d'),
+                        help='last day of generated history (YYYY-MM-DD)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50000, help='rows per executemany call')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    counts = generate(args.db, args.users, args.questions, args.interviews_per_user,
+                      args.questions_per_interview, args.days, args.seed,
+                      datetime.strptime(args.end_date, '%Y-%m-%d'), args.batch_size)
+    for table, count in counts.items():
+        print(f'{table}: {count} rows')
+    print(f'Finished in {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Live Draft Scoring
+Keyword coverage and length score of an answer while it is being typed
+
+Running evaluate_answer() on the whole draft every few keystrokes would
+cost milliseconds of CPU per update. A DraftSession keeps the state of one
+draft instead:
+- the draft text
+- a count of every stemmed keyword in it
+- the set of expected keywords that the draft contains
+- the number of words
+
+The browser sends only what changed (replace characters start..end of the
+previous draft with some text). Only the words around the change are
+tokenized and stemmed again, so an update costs a few microseconds however
+long the draft is. TF-IDF still runs only when the answer is submitted.
+
+Keywords, coverage and length score follow nlp_evaluator: coverage is the
+keyword score of the final evaluation, the length score uses the same
+formula (words are counted with a regex that is close to word_tokenize).
+
+Drafts are kept in a DraftStore: in evaluator_service.py when it is
+running (so all web workers share one store and the workers do not load
+NLTK), otherwise in the web worker itself. Every update names the revision
+it is based on; when that does not match (first update, another worker
+handled the previous one, or the draft was evicted) the server answers 409
+and the browser sends the whole draft again.
+
+Usage:
+    python live_scoring.py bench      # CPU time per update against evaluate_answer()
+"""
+
+import argparse
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from nlp_evaluator import (
+    get_expected_keywords, get_ideal_keywords, get_stop_words, stemmer, truncate_answer,
+    fallback_length_score, length_score_for_counts, word_tokenize
+)
+
+MAX_DRAFT_CHARS = 20000  # Longer drafts are not scored live (about 3000 words)
+
+WORD_RE = re.compile(r'\w+|[^\w\s]')  # Words and punctuation, like word_tokenize
+KEYWORD_RE = re.compile(r'[a-z0-9]+')  # Words left by preprocess_text()
+
+
+@lru_cache(maxsize=65536)
+def stem_word(word):
+    """Stem of a lowercase word; None for stopwords and words of 1-2 letters"""
+    if len(word) <= 2 or word in get_stop_words():
+        return None
+    return stemmer.stem(word)
+
+
+@lru_cache(maxsize=1024)
+def ideal_profile(ideal_answer, question_type):
+    """(keyword set, word count) of an ideal answer, as evaluate_answer() sees it"""
+    ideal_answer, _ = truncate_answer(ideal_answer)
+    return get_ideal_keywords(ideal_answer, question_type), len(word_tokenize(ideal_answer))
+
+
+class DraftSession:
+    """State of one draft answer"""
+
+    def __init__(self, question_text, question_type, ideal_answer=None):
+        if ideal_answer and len(ideal_answer.strip()) > 10:
+            self.targets, self.ideal_words = ideal_profile(ideal_answer, question_type)
+            self.expected_count = len(self.targets)
+        else:
+            # No ideal answer: every keyword occurrence counts, as in calculate_fallback_score
+            expected = get_expected_keywords(question_text, question_type)
+            self.targets, self.ideal_words = frozenset(expected), None
+            self.expected_count = len(expected)
+        self.text = ''
+        self.revision = 0
+        self.word_count = 0
+        self.keyword_counts = Counter()
+        self.matched = set()  # Targets that occur in the draft
+        self.target_hits = 0  # Occurrences of targets in the draft
+
+    def _count(self, window, sign):
+        """Add (sign=1) or remove (sign=-1) the words of a piece of the draft"""
+        self.word_count += sign * len(WORD_RE.findall(window))
+        for word in KEYWORD_RE.findall(window.lower()):
+            stem = stem_word(word)
+            if stem is None:
+                continue
+            count = self.keyword_counts[stem] + sign
+            self.keyword_counts[stem] = count
+            if stem in self.targets:
+                self.target_hits += sign
+                if count > 0:
+                    self.matched.add(stem)
+                else:
+                    self.matched.discard(stem)
+            if count == 0:
+                del self.keyword_counts[stem]
+
+    def apply(self, start, end, text, revision):
+        """
+        Replace characters start..end of the draft with text
+        Only the words touching the change are counted again
+        """
+        old = self.text
+        if not 0 <= start <= end <= len(old):
+            raise ValueError('Change is outside the draft')
+        if len(old) - (end - start) + len(text) > MAX_DRAFT_CHARS:
+            raise ValueError('Draft is too long to score live')
+
+        # Widen the change to whole words: pieces between whitespace are counted independently
+        low, high = start, end
+        while low > 0 and not old[low - 1].isspace():
+            low -= 1
+        while high < len(old) and not old[high].isspace():
+            high += 1
+
+        self.text = old[:start] + text + old[end:]
+        self._count(old[low:high], -1)
+        self._count(self.text[low:high + len(text) - (end - start)], 1)
+        self.revision = revision
+
+    def reset(self, text, revision):
+        """Replace the whole draft"""
+        self.apply(0, len(self.text), text, revision)
+
+    def scores(self):
+        """Live indicator for the browser"""
+        if self.ideal_words is not None:
+            keyword_score = len(self.matched) / self.expected_count * 100 if self.expected_count else 0
+            length_score = length_score_for_counts(self.word_count, self.ideal_words)
+        else:
+            keyword_score = self.target_hits / self.expected_count * 100 if self.expected_count else 0
+            length_score = fallback_length_score(self.word_count)
+        return {
+            'revision': self.revision,
+            'coverage': round(min(100, keyword_score), 1),
+            'length_score': round(max(0, min(100, length_score)), 1),
+            'word_count': self.word_count,
+            'keywords_matched': sorted(self.matched)[:10],
+            'keywords_expected': len(self.targets),
+        }
+
+
+class DraftStore:
+    """The drafts being typed, least recently updated evicted first"""
+
+    def __init__(self, max_sessions=1000):
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def update(self, key, question, update):
+        """
+        Apply one update from the browser to the draft stored under key
+        question: (question_text, question_type, ideal_answer), used to start a new draft
+        update: {'base_revision', 'revision', 'text'} and either 'start'/'end' or 'reset': true
+        Returns the scores, or None when the browser has to send the whole draft again
+        Raises ValueError for an invalid update
+        """
+        try:
+            revision = int(update['revision'])
+            text = update['text']
+            if not update.get('reset'):
+                start, end = int(update['start']), int(update['end'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid draft update')
+        if not isinstance(text, str):
+            raise ValueError('Invalid draft update')
+
+        # Held for the whole update, so two workers cannot change one draft at once
+        with self.lock:
+            if update.get('reset'):
+                draft = DraftSession(*question)
+                draft.reset(text, revision)
+                self.sessions[key] = draft
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            else:
+                draft = self.sessions.get(key)
+                if draft is None or draft.revision != update.get('base_revision'):
+                    return None
+                draft.apply(start, end, text, revision)
+            self.sessions.move_to_end(key)
+            return draft.scores()
+
+    def discard(self, key):
+        with self.lock:
+            self.sessions.pop(key, None)
+
+
+# ==================== BENCHMARK ====================
+
+BENCH_QUESTION = (
+    'Explain the difference between a list and a tuple in Python.', 'Technical',
+    'Lists are mutable, ordered collections defined with square brackets and can be changed after creation. '
+    'Tuples are immutable, ordered collections defined with parentheses and cannot be changed once created. '
+    'Tuples are faster and can be used as dictionary keys, while lists suit data that changes.'
+)
+BENCH_ANSWER = (
+    'A list in Python is mutable, so you can append, remove or change items after it is created, and it is '
+    'written with square brackets. A tuple is immutable and written with parentheses; once created it cannot '
+    'be changed. Because tuples are immutable they are hashable and can be dictionary keys, and they are a '
+    'little faster to create and iterate. I use lists for collections that grow, like rows read from a '
+    'database, and tuples for fixed records such as coordinates or the return value of a function. '
+)
+
+
+def bench(repeat):
+    from nlp_evaluator import evaluate_answer
+
+    question_text, question_type, ideal_answer = BENCH_QUESTION
+    answer = BENCH_ANSWER * repeat
+    print(f'Draft of {len(answer.split())} words, typed one character at a time')
+
+    draft = DraftSession(question_text, question_type, ideal_answer)
+    timings = []
+    for position, char in enumerate(answer):
+        started = time.process_time_ns()
+        draft.apply(position, position, char, position + 1)
+        draft.scores()
+        timings.append(time.process_time_ns() - started)
+    timings.sort()
+    print(f'Live update CPU:      p50 {timings[len(timings) // 2] / 1000:7.1f} us   '
+          f'p99 {timings[len(timings) * 99 // 100] / 1000:7.1f} us   max {timings[-1] / 1000:7.1f} us')
+
+    started = time.process_time_ns()
+    draft.reset(answer, 0)
+    print(f'Resync (whole draft): {(time.process_time_ns() - started) / 1000:7.1f} us')
+
+    evaluate_answer(question_text, answer, question_type, ideal_answer)  # Warm up
+    runs = 20
+    started = time.process_time_ns()
+    for _ in range(runs):
+        result = evaluate_answer(question_text, answer, question_type, ideal_answer)
+    print(f'evaluate_answer CPU:  {(time.process_time_ns() - started) / runs / 1000:7.1f} us per call')
+    print(f"Final keywords: {sorted(result['keywords_matched'])}")
+    print(f"Live keywords:  {draft.scores()['keywords_matched']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bench_parser = subparsers.add_parser('bench', help='CPU time per live update against evaluate_answer()')
+    bench_parser.add_argument('--repeat', type=int, default=3, help='Length of the draft, in copies of the sample answer')
+    args = parser.parse_args()
+    bench(args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""
+Load Test for the Interview Flow
+Simulates many candidates taking mock interviews at the same time
+
+Each virtual user (one thread):
+1. Registers and logs in
+2. Starts an interview (start_interview)
+3. For every question: opens the question, submits an answer of realistic
+   length, opens the feedback page
+4. Finishes with interview_complete, which redirects to the results page
+
+Runs once per concurrency level and reports, per route: latency
+percentiles and error rates, plus throughput and SQLite write/lock wait
+time (from the server's Server-Timing header). Results are written to a
+JSON file with stable formatting, so two releases can be compared with diff.
+
+An answer refused with 503 (admission control, see admission.py) is sent
+again after Retry-After, like the question page does. answer_latency is the
+time from the first attempt until the answer was accepted, and
+quick_evaluations counts the answers that only got a quick evaluation
+('overload' in the evaluation's degraded_stages, read from the API reply or
+the feedback page's data-degraded-stages attribute).
+
+Usage:
+    python load_test.py --users 1,5,10,25                 # starts serve.py on a temporary database
+    python load_test.py --url http://127.0.0.1:8000 --users 10
+    python load_test.py --flow api                        # same interviews through the JSON API
+    python load_test.py --users 50 --hard-limit 0 --soft-limit 0   # admission control off, to compare
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Words used to build answers that look like real interview answers
+ANSWER_WORDS = (
+    'python programming language experience project team database query table '
+    'framework web application api http request response server client data '
+    'design problem solution performance testing skills communication learning '
+    'growth career goal company culture values challenge example responsibility '
+    'developed implemented improved managed structured object oriented function '
+    'class module library mutable immutable list tuple normalization integrity '
+    'the a and of to in for with on that this is was we i my our it as by'
+).split()
+
+# Routes are reported under these names instead of their full URLs
+ROUTES = {
+    '/register': 'register',
+    '/login': 'login',
+    '/start_interview': 'start_interview',
+    '/interview/question': 'interview_question',
+    '/interview/answer': 'submit_answer',
+    '/interview/feedback': 'show_feedback',
+    '/interview/complete': 'interview_complete',
+    '/interview/<id>/results': 'interview_results',
+    '/api/interview/start': 'api_start_interview',
+    '/api/interview/answer': 'api_submit_answer',
+    '/api/interview/complete': 'api_interview_complete',
+}
+
+# The feedback page lists the evaluation's degraded_stages in this attribute
+DEGRADED_STAGES = re.compile(r'data-degraded-stages="([^"]*)"')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Do not follow redirects, so every request is timed on its own"""
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Collects latency and status samples from all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}     # route -> list of latencies (seconds)
+        self.errors = {}      # route -> {status: count}
+        self.db_waits = []    # Server-Timing db-write values (seconds)
+        self.answer_times = []  # Seconds from the first attempt until an answer was accepted
+        self.quick_evaluations = 0
+        self.interviews = 0
+
+    def add(self, route, latency, status, db_wait):
+        with self.lock:
+            self.samples.setdefault(route, []).append(latency)
+            if status >= 400 or status == 0:
+                route_errors = self.errors.setdefault(route, {})
+                route_errors[str(status)] = route_errors.get(str(status), 0) + 1
+            if db_wait is not None:
+                self.db_waits.append(db_wait)
+
+    def answer_done(self, latency, quick):
+        with self.lock:
+            self.answer_times.append(latency)
+            self.quick_evaluations += quick
+
+    def interview_done(self):
+        with self.lock:
+            self.interviews += 1
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(values):
+    """Latency summary in milliseconds"""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p90_ms': round(percentile(values, 90) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2),
+    }
+
+
+class VirtualUser:
+    """One simulated candidate with its own cookie session"""
+
+    def __init__(self, base_url, recorder, rng):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect
+        )
+        self.headers = {}  # Headers of the last response
+
+    def request(self, path, data=None, as_json=False):
+        """Send one request; returns (status, body)"""
+        url = self.base_url + path
+        if as_json:
+            url = urllib.request.Request(url, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+            body = None
+        else:
+            body = urllib.parse.urlencode(data).encode() if data is not None else None
+        started = time.perf_counter()
+        status, text, headers = 0, '', {}
+        try:
+            with self.opener.open(url, body, timeout=60) as response:
+                status, text, headers = response.status, response.read().decode(), response.headers
+        except urllib.error.HTTPError as error:
+            # Redirects arrive here because NoRedirect does not follow them
+            status, headers = error.code, error.headers
+        except OSError:
+            status = 0
+        latency = time.perf_counter() - started
+        self.headers = headers or {}
+
+        db_wait = None
+        match = re.search(r'db-write;dur=([\d.]+)', headers.get('Server-Timing', '') if headers else '')
+        if match:
+            db_wait = float(match.group(1)) / 1000
+        route = re.sub(r'/\d+', '/<id>', path.split('?')[0])
+        self.recorder.add(ROUTES.get(route, route), latency, status, db_wait)
+        return status, text
+
+    def submit_answer(self, path, data, as_json=False):
+        """Submit an answer, sending it again after Retry-After while the server answers 503"""
+        started = time.perf_counter()
+        while True:
+            status, text = self.request(path, data, as_json)
+            if status != 503:
+                break
+            time.sleep(float(self.headers.get('Retry-After') or 1))
+        return status, text, time.perf_counter() - started
+
+    def answer_text(self):
+        """An answer of realistic length (30 to 200 words)"""
+        words = [self.rng.choice(ANSWER_WORDS) for _ in range(self.rng.randint(30, 200))]
+        return ' '.join(words).capitalize() + '.'
+
+    def run(self, name, interviews, questions, flow='pages'):
+        password = 'loadtest123'
+        self.request('/register', {'username': name, 'email': f'{name}@loadtest.local',
+                                   'password': password, 'full_name': name})
+        status, _ = self.request('/login', {'username': name, 'password': password})
+        if status != 302:
+            return
+
+        if flow == 'api':
+            self.run_api(interviews, questions)
+            return
+
+        for _ in range(interviews):
+            interview_type = self.rng.choice(['HR', 'Technical', 'Mixed'])
+            status, _ = self.request('/start_interview', {'interview_type': interview_type,
+                                                          'num_questions': questions})
+            if status != 302:
+                continue
+            for _ in range(questions):
+                status, _ = self.request('/interview/question')
+                if status != 200:
+                    break  # Fewer questions available than requested
+                status, _, latency = self.submit_answer('/interview/answer', {'answer': self.answer_text()})
+                if status != 302:
+                    break
+                _, text = self.request('/interview/feedback')
+                stages = DEGRADED_STAGES.search(text)
+                self.recorder.answer_done(latency, bool(stages) and 'overload' in stages.group(1).split())
+            status, _ = self.request('/interview/complete')
+            if status != 302 or '/results' not in self.headers.get('Location', ''):
+                continue
+            status, _ = self.request(urllib.parse.urlsplit(self.headers['Location']).path)
+            if status == 200:
+                self.recorder.interview_done()
+
+    def run_api(self, interviews, questions):
+        """The same interviews through the JSON interview API (one request per answer)"""
+        for _ in range(interviews):
+            interview_type = self.rng.choice(['HR', 'Technical', 'Mixed'])
+            status, text = self.request('/api/interview/start', {'interview_type': interview_type,
+                                                                 'num_questions': questions}, as_json=True)
+            if status != 200:
+                continue
+            question = json.loads(text)['question']
+            while question:
+                status, text, latency = self.submit_answer('/api/interview/answer', {'answer': self.answer_text()},
+                                                           as_json=True)
+                if status != 200:
+                    break
+                reply = json.loads(text)
+                self.recorder.answer_done(latency, 'overload' in reply['evaluation'].get('degraded_stages', []))
+                question = reply['next_question']
+            status, _ = self.request('/api/interview/complete', {}, as_json=True)
+            if status == 200:
+                self.recorder.interview_done()
+
+
+def run_level(base_url, users, interviews, questions, seed, flow='pages'):
+    """Run all virtual users for one concurrency level and summarize the results"""
+    recorder = Recorder()
+    run_id = f'{int(time.time())}{random.Random(seed).randint(0, 9999)}'
+    threads = []
+    for index in range(users):
+        user = VirtualUser(base_url, recorder, random.Random(seed * 100003 + index))
+        thread = threading.Thread(target=user.run, args=(f'load{run_id}u{users}n{index}', interviews, questions, flow))
+        threads.append(thread)
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    total_requests = sum(len(samples) for samples in recorder.samples.values())
+    total_errors = sum(sum(errors.values()) for errors in recorder.errors.values())
+    routes = {}
+    for route, samples in sorted(recorder.samples.items()):
+        summary = summarize(samples)
+        errors = recorder.errors.get(route, {})
+        summary['errors'] = dict(sorted(errors.items()))
+        summary['error_rate'] = round(sum(errors.values()) / len(samples), 4)
+        routes[route] = summary
+
+    db_waits = sorted(recorder.db_waits)
+    return {
+        'users': users,
+        'duration_s': round(duration, 2),
+        'requests': total_requests,
+        'requests_per_s': round(total_requests / duration, 2),
+        'requests_per_interview': round(total_requests / recorder.interviews, 2) if recorder.interviews else None,
+        'interviews_completed': recorder.interviews,
+        'interviews_per_s': round(recorder.interviews / duration, 3),
+        'error_rate': round(total_errors / total_requests, 4) if total_requests else 0,
+        # Database locked, or answers refused by admission control
+        'busy_503': sum(errors.get('503', 0) for errors in recorder.errors.values()),
+        'answer_latency': summarize(recorder.answer_times),
+        'quick_evaluations': recorder.quick_evaluations,
+        'db_write_wait': {
+            **summarize(db_waits),
+            'total_s': round(sum(db_waits), 3),
+        },
+        'routes': routes,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, soft_limit=None, hard_limit=None):
+    """
+    Start serve.py on a free port, in a temporary folder so it gets a fresh database
+    soft_limit and hard_limit override the admission control limits (0 turns them off)
+    """
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    limits = []
+    if soft_limit is not None:
+        limits += ['--soft-limit', str(soft_limit)]
+    if hard_limit is not None:
+        limits += ['--hard-limit', str(hard_limit)]
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+         '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)] + limits,
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1).read()
+            return server, base_url
+        except OSError:
+            if server.poll() is not None:
+                break
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('Server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the interview flow')
+    parser.add_argument('--url', help='test a running server instead of starting serve.py')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='serve.py workers when the server is started by this script')
+    parser.add_argument('--users', default='1,5,10,25', help='comma-separated concurrency levels')
+    parser.add_argument('--interviews', type=int, default=2, help='interviews per virtual user')
+    parser.add_argument('--questions', type=int, default=5, help='questions per interview')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for answers')
+    parser.add_argument('--flow', choices=['pages', 'api'], default='pages',
+                        help='use the HTML pages or the JSON interview API')
+    parser.add_argument('--soft-limit', type=int,
+                        help='serve.py admission control soft limit (default: app.py config, 0: off)')
+    parser.add_argument('--hard-limit', type=int,
+                        help='serve.py admission control hard limit (default: app.py config, 0: off)')
+    parser.add_argument('--output', default='load_test_results.json', help='results file')
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        server, base_url = start_server(args.workers, args.soft_limit, args.hard_limit)
+
+    results = {
+        'config': {
+            'url': args.url or 'serve.py',
+            'workers': None if args.url else args.workers,
+            'interviews_per_user': args.interviews,
+            'questions_per_interview': args.questions,
+            'seed': args.seed,
+            'flow': args.flow,
+            'soft_limit': None if args.url else args.soft_limit,
+            'hard_limit': None if args.url else args.hard_limit,
+        },
+        'levels': [],
+    }
+    try:
+        print(f'{"users":>6} {"req/s":>8} {"intv/s":>8} {"errors":>7} {"p50 ms":>8} {"p99 ms":>8} '
+              f'{"answer p99":>11} {"quick":>6} {"503":>6} {"db wait p99":>12}')
+        for users in [int(u) for u in args.users.split(',')]:
+            level = run_level(base_url, users, args.interviews, args.questions, args.seed, args.flow)
+            results['levels'].append(level)
+            submit = level['routes'].get('submit_answer') or level['routes'].get('api_submit_answer', {})
+            print(f"{users:>6} {level['requests_per_s']:>8} {level['interviews_per_s']:>8} "
+                  f"{level['error_rate']:>7.2%} {submit.get('p50_ms', '-'):>8} {submit.get('p99_ms', '-'):>8} "
+                  f"{level['answer_latency'].get('p99_ms', '-'):>11} {level['quick_evaluations']:>6} "
+                  f"{level['busy_503']:>6} {level['db_write_wait'].get('p99_ms', '-'):>12}", flush=True)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
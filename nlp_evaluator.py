@@ -18,6 +18,8 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import re
 import json
+import time
+from functools import lru_cache
 
 # Download required NLTK data
 try:
@@ -33,6 +35,13 @@ except LookupError:
 # Initialize stemmer for word normalization
 stemmer = PorterStemmer()
 
+# Evaluation budget (keeps the cost of one evaluation bounded for huge answers)
+MAX_ANSWER_TOKENS = 1000        # Only the first N words of an answer are analyzed
+EVALUATION_TIME_BUDGET = 0.5    # CPU seconds per evaluate_answer call before cheaper stages are used
+
+# English stopword set, loaded once by get_stop_words()
+_stop_words = None
+
 # Expected keywords for different question types (fallback when ideal answer not available)
 EXPECTED_KEYWORDS = {
     'HR': {
@@ -70,6 +79,36 @@ def preprocess_text(text):
     return text
 
 
+def truncate_answer(text, max_tokens=MAX_ANSWER_TOKENS):
+    """
+    Keep only the first max_tokens words of an answer
+    Words are counted as preprocess_text() splits them, so words joined by
+    punctuation ("a.b.c") cannot get past the limit as one token
+    Scans words one at a time so a huge answer is never split completely
+    Returns (truncated_text, was_truncated)
+    """
+    if not text or not max_tokens:
+        return text, False
+    
+    end = None
+    for count, match in enumerate(re.finditer(r'[a-zA-Z0-9]+', text), start=1):
+        if count == max_tokens:
+            end = match.end()
+        elif count > max_tokens:
+            # There is at least one more word, so the answer is cut at the limit
+            return text[:end], True
+    
+    return text, False
+
+
+def get_stop_words():
+    """Load the English stopword list once and reuse it for every evaluation"""
+    global _stop_words
+    if _stop_words is None:
+        _stop_words = set(stopwords.words('english'))
+    return _stop_words
+
+
 def extract_keywords(text, question_type):
     """
     Extract relevant keywords from text using NLTK
@@ -79,7 +118,7 @@ def extract_keywords(text, question_type):
     tokens = word_tokenize(processed_text)
     
     # Remove stopwords (common words like 'the', 'is', etc.)
-    stop_words = set(stopwords.words('english'))
+    stop_words = get_stop_words()
     keywords = [word for word in tokens if word not in stop_words and len(word) > 2]
     
     # Stem keywords (reduce words to root form: running -> run)
@@ -88,7 +127,7 @@ def extract_keywords(text, question_type):
     return stemmed_keywords
 
 
-def calculate_tfidf_similarity(user_answer, ideal_answer):
+def calculate_tfidf_similarity(user_answer, ideal_answer, ngram_range=(1, 2)):
     """
     Calculate semantic similarity using TF-IDF and Cosine Similarity
     
@@ -100,13 +139,15 @@ def calculate_tfidf_similarity(user_answer, ideal_answer):
     - Measures the angle between two vectors
     - Returns value between 0 (completely different) and 1 (identical)
     - Higher values indicate more similar content
+    
+    ngram_range=(1, 1) skips bigrams, which is much cheaper on long answers
     """
     try:
         
         vectorizer = TfidfVectorizer(
             max_features=500,
             stop_words='english',
-            ngram_range=(1, 2),  # Unigrams and bigrams
+            ngram_range=ngram_range,  # Unigrams and bigrams by default
             min_df=1
         )
         
@@ -128,6 +169,15 @@ def calculate_tfidf_similarity(user_answer, ideal_answer):
         return 0, False
 
 
+@lru_cache(maxsize=1024)
+def get_ideal_keywords(ideal_answer, question_type):
+    """
+    Keywords of an ideal answer, cached because the same ideal answers
+    are compared against every candidate's response
+    """
+    return frozenset(extract_keywords(ideal_answer, question_type))
+
+
 def calculate_keyword_similarity(user_answer, ideal_answer, question_type):
     """
     Calculate similarity based on keyword matching
@@ -135,7 +185,7 @@ def calculate_keyword_similarity(user_answer, ideal_answer, question_type):
     """
     # Extract keywords from both answers
     user_keywords = set(extract_keywords(user_answer, question_type))
-    ideal_keywords = set(extract_keywords(ideal_answer, question_type))
+    ideal_keywords = get_ideal_keywords(ideal_answer, question_type)
     
     if not ideal_keywords:
         return 0, []
@@ -155,9 +205,11 @@ def calculate_length_score(user_answer, ideal_answer):
     Evaluate answer completeness based on length
     Compares user answer length with ideal answer length
     """
-    user_words = len(word_tokenize(user_answer))
-    ideal_words = len(word_tokenize(ideal_answer))
-    
+    return length_score_for_counts(len(word_tokenize(user_answer)), len(word_tokenize(ideal_answer)))
+
+
+def length_score_for_counts(user_words, ideal_words):
+    """Length score from the word counts of the user answer and the ideal answer"""
     if ideal_words == 0:
         return 50  # Default score if no ideal answer
     
@@ -179,17 +231,13 @@ def calculate_length_score(user_answer, ideal_answer):
     return max(0, min(100, length_score))
 
 
-def calculate_fallback_score(user_answer, question_text, question_type):
+def get_expected_keywords(question_text, question_type):
     """
-    Fallback scoring method when ideal answer is not available
-    Uses keyword matching with expected keywords
+    Stemmed keywords expected in an answer when the question has no ideal answer
+    (may contain repeats; each one counts towards the keyword score)
     """
-    answer_lower = user_answer.lower()
     question_lower = question_text.lower()
     
-    # Extract keywords from user answer
-    answer_keywords = extract_keywords(user_answer, question_type)
-    
     # Get expected keywords based on question
     expected_keywords_list = []
     for key, keywords in EXPECTED_KEYWORDS.get(question_type, {}).items():
@@ -204,20 +252,34 @@ def calculate_fallback_score(user_answer, question_text, question_type):
         expected_keywords_list = all_keywords
     
     # Stem expected keywords
-    expected_stemmed = [stemmer.stem(kw.lower()) for kw in expected_keywords_list]
+    return [stemmer.stem(kw.lower()) for kw in expected_keywords_list]
+
+
+def fallback_length_score(word_count):
+    """Length score used when there is no ideal answer to compare with"""
+    if word_count < 10:
+        return word_count * 5
+    elif word_count > 200:
+        return 100
+    else:
+        return min(100, 50 + (word_count - 10) * 0.5)
+
+
+def calculate_fallback_score(user_answer, question_text, question_type):
+    """
+    Fallback scoring method when ideal answer is not available
+    Uses keyword matching with expected keywords
+    """
+    # Extract keywords from user answer
+    answer_keywords = extract_keywords(user_answer, question_type)
+    expected_stemmed = get_expected_keywords(question_text, question_type)
     
     # Calculate keyword match ratio
     matched_keywords = [kw for kw in answer_keywords if kw in expected_stemmed]
     keyword_score = (len(matched_keywords) / len(expected_stemmed) * 100) if expected_stemmed else 0
     
     # Calculate length score
-    word_count = len(word_tokenize(user_answer))
-    if word_count < 10:
-        length_score = word_count * 5
-    elif word_count > 200:
-        length_score = 100
-    else:
-        length_score = min(100, 50 + (word_count - 10) * 0.5)
+    length_score = fallback_length_score(len(word_tokenize(user_answer)))
     
     # Combined score
     final_score = (keyword_score * 0.6 + length_score * 0.4)
@@ -226,10 +288,12 @@ def calculate_fallback_score(user_answer, question_text, question_type):
     return final_score, matched_keywords
 
 
-def generate_sentiment_feedback(score, matched_keywords, user_answer, ideal_answer=None):
+def generate_sentiment_feedback(score, matched_keywords, user_answer, ideal_answer=None, brief=False):
     """
     Generate sentiment-based feedback based on evaluation score
     Provides constructive feedback to help users improve
+    
+    brief=True skips the length analysis (used when the time budget is exhausted)
     """
     feedback_parts = []
     
@@ -252,6 +316,9 @@ def generate_sentiment_feedback(score, matched_keywords, user_answer, ideal_answ
     else:
         feedback_parts.append("Try to include more relevant technical terms and concepts.")
     
+    if brief:
+        return " ".join(feedback_parts)
+    
     # Length feedback
     user_word_count = len(word_tokenize(user_answer))
     if ideal_answer:
@@ -273,40 +340,68 @@ def generate_sentiment_feedback(score, matched_keywords, user_answer, ideal_answ
     return " ".join(feedback_parts)
 
 
-def evaluate_answer(question_text, user_answer, question_type='Technical', ideal_answer=None):
+def evaluate_answer(question_text, user_answer, question_type='Technical', ideal_answer=None,
+                    max_tokens=None, time_budget=None):
     """
     Main evaluation function that combines multiple NLP techniques
     
     Evaluation Process:
-    1. Preprocessing: Clean and normalize text
+    1. Preprocessing: Clean and normalize text (long answers are truncated)
     2. TF-IDF + Cosine Similarity: Compare semantic similarity with ideal answer
     3. Keyword Matching: Find common important terms
     4. Length Analysis: Check answer completeness
     5. Score Calculation: Weighted combination of all factors
     6. Feedback Generation: Sentiment-based constructive feedback
     
+    Evaluation Budget:
+    - Only the first max_tokens words of the answer are analyzed
+    - If half of time_budget is used before TF-IDF, bigrams are skipped
+    - If the whole time_budget is used, TF-IDF is skipped and brief feedback is given
+    - The budget is CPU time of the calling thread: time spent waiting for
+      the CPU or the GIL under load does not count, so a busy server does
+      not change the score of an ordinary answer
+    
     Args:
         question_text: The interview question
         user_answer: The user's response
         question_type: 'HR' or 'Technical'
         ideal_answer: Reference answer for comparison (optional)
+        max_tokens: Word limit for analysis (default MAX_ANSWER_TOKENS)
+        time_budget: CPU seconds allowed for this call (default EVALUATION_TIME_BUDGET)
     
     Returns:
-        dict with 'score', 'feedback', and 'keywords_matched'
+        dict with 'score', 'feedback', 'keywords_matched', 'degraded' and 'degraded_stages'
     """
     # Validate input
     if not user_answer or len(user_answer.strip()) < 5:
         return {
             'score': 0,
             'feedback': 'Answer is too short. Please provide a more detailed response (minimum 5 characters).',
-            'keywords_matched': []
+            'keywords_matched': [],
+            'degraded': False,
+            'degraded_stages': []
         }
     
+    if max_tokens is None:
+        max_tokens = MAX_ANSWER_TOKENS
+    if time_budget is None:
+        time_budget = EVALUATION_TIME_BUDGET
+    
+    started = time.thread_time()
+    degraded_stages = []
+    
+    def elapsed():
+        return time.thread_time() - started
+    
+    # Cap the amount of text analyzed
+    user_answer, truncated = truncate_answer(user_answer, max_tokens)
+    if truncated:
+        degraded_stages.append('truncated')
+    if ideal_answer:
+        ideal_answer, _ = truncate_answer(ideal_answer, max_tokens)
+    
     # If ideal answer is provided, use advanced evaluation
     if ideal_answer and len(ideal_answer.strip()) > 10:
-        # Method 1: TF-IDF + Cosine Similarity (Primary method - 50% weight)
-        tfidf_score, tfidf_success = calculate_tfidf_similarity(user_answer, ideal_answer)
-        
         # Method 2: Keyword Matching (30% weight)
         keyword_score, matched_keywords = calculate_keyword_similarity(
             user_answer, ideal_answer, question_type
@@ -315,6 +410,19 @@ def evaluate_answer(question_text, user_answer, question_type='Technical', ideal
         # Method 3: Length Analysis (20% weight)
         length_score = calculate_length_score(user_answer, ideal_answer)
         
+        # Method 1: TF-IDF + Cosine Similarity (Primary method - 50% weight)
+        # Runs last so the cheaper methods above always finish within the budget
+        if elapsed() >= time_budget:
+            tfidf_score, tfidf_success = 0, False
+            degraded_stages.append('tfidf')
+        elif elapsed() >= time_budget / 2:
+            tfidf_score, tfidf_success = calculate_tfidf_similarity(
+                user_answer, ideal_answer, ngram_range=(1, 1)
+            )
+            degraded_stages.append('bigrams')
+        else:
+            tfidf_score, tfidf_success = calculate_tfidf_similarity(user_answer, ideal_answer)
+        
         # Calculate final score with weighted average
         if tfidf_success:
             # Use all three methods
@@ -326,24 +434,142 @@ def evaluate_answer(question_text, user_answer, question_type='Technical', ideal
         # Ensure score is between 0 and 100
         final_score = max(0, min(100, final_score))
         
-        # Generate feedback
-        feedback = generate_sentiment_feedback(
-            final_score, matched_keywords, user_answer, ideal_answer
-        )
-        
     else:
         # Fallback method when ideal answer is not available
         final_score, matched_keywords = calculate_fallback_score(
             user_answer, question_text, question_type
         )
-        
-        # Generate feedback without ideal answer reference
-        feedback = generate_sentiment_feedback(
-            final_score, matched_keywords, user_answer, None
-        )
+        ideal_answer = None
+    
+    # Generate feedback (brief feedback once the time budget is used up)
+    brief = elapsed() >= time_budget
+    if brief:
+        degraded_stages.append('feedback')
+    feedback = generate_sentiment_feedback(
+        final_score, matched_keywords, user_answer, ideal_answer, brief=brief
+    )
     
     return {
         'score': round(final_score, 2),
         'feedback': feedback,
-        'keywords_matched': matched_keywords[:10] if matched_keywords else []
+        'keywords_matched': matched_keywords[:10] if matched_keywords else [],
+        'degraded': bool(degraded_stages),
+        'degraded_stages': degraded_stages
+    }
+
+
+def quick_evaluate(question_text, user_answer, question_type='Technical', max_tokens=None):
+    """
+    Keyword and length scoring only (calculate_fallback_score), used when the
+    server is overloaded; the answer is rescored with evaluate_answer later
+
+    Returns:
+        the same dict as evaluate_answer, with 'overload' in 'degraded_stages'
+    """
+    if not user_answer or len(user_answer.strip()) < 5:
+        return evaluate_answer(question_text, user_answer, question_type)
+
+    user_answer, truncated = truncate_answer(user_answer, max_tokens or MAX_ANSWER_TOKENS)
+    score, matched_keywords = calculate_fallback_score(user_answer, question_text, question_type)
+    degraded_stages = ['overload'] + (['truncated'] if truncated else [])
+    return {
+        'score': round(score, 2),
+        'feedback': generate_sentiment_feedback(score, matched_keywords, user_answer, brief=True),
+        'keywords_matched': matched_keywords[:10],
+        'degraded': True,
+        'degraded_stages': degraded_stages
     }
+
+
+def warm_up(ideal_answers=()):
+    """
+    Load NLTK data and evaluator caches ahead of time
+    
+    The production server calls this once before forking its workers, so
+    all workers share one copy of this state instead of building their own.
+    
+    Args:
+        ideal_answers: iterable of (ideal_answer, question_type) pairs to pre-index
+    """
+    get_stop_words()
+    word_tokenize('warm up')
+    
+    # Rebuild the ideal answer keyword cache for the current question bank
+    get_ideal_keywords.cache_clear()
+    for ideal_answer, question_type in ideal_answers:
+        if ideal_answer:
+            ideal_answer, _ = truncate_answer(ideal_answer)
+            get_ideal_keywords(ideal_answer, question_type)
+    
+    # One full evaluation imports the remaining scikit-learn code paths
+    evaluate_answer(
+        'What is Python?',
+        'Python is an interpreted programming language.',
+        'Technical',
+        'Python is a high-level, interpreted programming language.'
+    )
+
+
+# ==================== BENCHMARK ====================
+
+BENCH_QUESTION = (
+    'What is database normalization?', 'Technical',
+    'Database normalization is the process of organizing data to reduce redundancy and improve data integrity. '
+    'It divides large tables into smaller ones and defines relationships between them.'
+)
+
+
+def bench_answers(size):
+    """Answers of about `size` characters built to be expensive to evaluate"""
+    words = 'data table normalization redundancy integrity relationship query index'.split()
+    return {
+        'repeated words': ' '.join(words[i % len(words)] for i in range(size // 10)),
+        'unique words': ' '.join(f'term{i}' for i in range(size // 9)),
+        'one long word': 'x' * size,
+        'punctuation-joined words': '.'.join(words[i % len(words)] for i in range(size // 10)),
+    }
+
+
+def bench(size, repeat, limit):
+    """
+    Worst-case evaluate_answer time on adversarially large answers, with the
+    default caps and without them; returns False if a capped run took longer than limit
+    """
+    question_text, question_type, ideal_answer = BENCH_QUESTION
+    warm_up([(ideal_answer, question_type)])
+    print(f'Answers of {size // 1024} KB, worst of {repeat} runs, '
+          f'caps: {MAX_ANSWER_TOKENS} words, {EVALUATION_TIME_BUDGET} s CPU')
+    bounded = True
+    for name, answer in bench_answers(size).items():
+        worst, result = 0, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = evaluate_answer(question_text, answer, question_type, ideal_answer)
+            worst = max(worst, time.perf_counter() - started)
+        started = time.perf_counter()
+        evaluate_answer(question_text, answer, question_type, ideal_answer, max_tokens=0, time_budget=float('inf'))
+        uncapped = time.perf_counter() - started
+        bounded = bounded and worst <= limit
+        print(f"  {name:25s} capped {worst * 1000:8.1f} ms   uncapped {uncapped * 1000:9.1f} ms   "
+              f"degraded: {', '.join(result['degraded_stages']) or '-'}")
+    print(f"Worst case {'within' if bounded else 'OVER'} the {limit * 1000:.0f} ms limit")
+    return bounded
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='NLP answer evaluation')
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--size', type=int, default=1024 * 1024, help='bench: answer size in characters')
+    parser.add_argument('--repeat', type=int, default=3, help='bench: runs per answer')
+    parser.add_argument('--limit', type=float, default=2 * EVALUATION_TIME_BUDGET,
+                        help='bench: seconds a capped evaluation may take (exit status 1 above it)')
+    args = parser.parse_args()
+
+    sys.exit(0 if bench(args.size, args.repeat, args.limit) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Conditional Responses and Rendered-Fragment Cache
+For result pages that are reloaded often but change only when they are written to
+
+Each page depends on a few data versions (the data_versions table, see
+question_cache.py). The write paths bump them in the transaction that changes
+the data:
+- 'interview:<id>'   - an answer was saved, the interview was completed or rescored
+- 'performance:<id>' - one of the user's interviews was completed or rescored
+- 'duplicates:<id>'  - an answer saved to another interview may be a near-duplicate
+                       of one of this interview's answers (shares an LSH bucket)
+- 'answers'          - the whole near-duplicate index changed (rebuilt, answers archived)
+- 'questions'        - the question bank changed
+
+A request first reads the page's versions, one primary key query. The ETag
+is a hash of the page, its parameters (always including the logged-in user),
+those versions and the code version, and Last-Modified is the newest
+change of those versions:
+- If-None-Match matches (or, without If-None-Match, If-Modified-Since is not
+  older than Last-Modified): 304, nothing else is read or rendered
+- Otherwise the rendered data part of the page (the fragment) is taken from
+  a per-process LRU cache keyed by the ETag, or rendered and stored; only the
+  page around it (navigation, flashed messages) is rendered every time
+
+Responses are `private, no-cache`: browsers keep them, but ask every time.
+
+Usage:
+    python page_cache.py bench --db /tmp/scale.db   # 200, cached and 304 latency of the pages
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+def code_version(root):
+    """
+    Hash of the contents of the Python files in root and the templates: a
+    deployment with changed code or templates changes every ETag, so browsers
+    do not keep the old pages, while every host running the same code gives
+    the same ETags. Only root itself and templates/ are read (not .git,
+    instance/ or the archive)
+    """
+    digest = hashlib.sha1()
+    paths = [name for name in os.listdir(root) if name.endswith('.py')]
+    for folder, _, files in os.walk(os.path.join(root, 'templates')):
+        paths += [os.path.relpath(os.path.join(folder, name), root) for name in files if name.endswith('.html')]
+    for path in sorted(paths):
+        with open(os.path.join(root, path), 'rb') as f:
+            digest.update(path.replace(os.sep, '/').encode() + b'\0' + hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()[:12]
+
+
+def page_etag(page, key, versions, code):
+    """ETag of one page: changes when the key, any of the versions or the code changes"""
+    text = '|'.join([page, code] + [str(part) for part in key] +
+                    [f'{name}={version}' for name, (version, _) in sorted(versions.items())])
+    return hashlib.sha1(text.encode()).hexdigest()[:20]
+
+
+class FragmentCache:
+    """Rendered page fragments by ETag, least recently used evicted first"""
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self.fragments = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag):
+        with self.lock:
+            fragment = self.fragments.get(etag)
+            if fragment is None:
+                self.misses += 1
+                return None
+            self.fragments.move_to_end(etag)
+            self.hits += 1
+            return fragment
+
+    def put(self, etag, fragment):
+        with self.lock:
+            self.fragments[etag] = fragment
+            self.fragments.move_to_end(etag)
+            while len(self.fragments) > self.max_entries:
+                self.fragments.popitem(last=False)
+
+    def __len__(self):
+        return len(self.fragments)
+
+
+# ==================== BENCHMARK ====================
+
+def _percentiles(latencies):
+    latencies.sort()
+    return (f'p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms   '
+            f'p99 {latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000:7.2f} ms')
+
+
+def bench(database, requests, seed=42):
+    """Latency of the result pages when rendered, served from the fragment cache and answered with 304"""
+    import app as application
+
+    application.app.config['DATABASE'] = database
+    application.init_db()  # Migrations, e.g. on a database made by generate_data.py
+    client = application.app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id=1, username='admin', is_admin=1)
+
+    conn = application.get_db()
+    rng = random.Random(seed)
+    interviews = conn.execute('''
+        SELECT user_id, id FROM interviews WHERE status = 'Completed' AND archived_month IS NULL
+        ORDER BY id DESC LIMIT 2000
+    ''').fetchall()
+    conn.close()
+    if not interviews:
+        print('There are no completed interviews')
+        return
+    samples = [interviews[rng.randrange(len(interviews))] for _ in range(requests)]
+
+    pages = {
+        'performance': lambda user_id, interview_id: '/performance',
+        'interview results': lambda user_id, interview_id: f'/interview/{interview_id}/results',
+        'admin interview results': lambda user_id, interview_id: f'/admin/results/{interview_id}',
+    }
+    print(f'{requests} requests per case')
+    for name, path in pages.items():
+        timings = {'rendered': [], 'fragment cached': [], '304': []}
+        for user_id, interview_id in samples:
+            if name != 'admin interview results':
+                with client.session_transaction() as session:
+                    session.update(user_id=user_id, username=f'user{user_id}', is_admin=0)
+            else:
+                with client.session_transaction() as session:
+                    session.update(user_id=1, username='admin', is_admin=1)
+            url = path(user_id, interview_id)
+            application.fragment_cache.fragments.clear()
+
+            started = time.perf_counter()
+            response = client.get(url)
+            timings['rendered'].append(time.perf_counter() - started)
+            etag = response.headers.get('ETag')
+
+            started = time.perf_counter()
+            client.get(url)
+            timings['fragment cached'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            response = client.get(url, headers={'If-None-Match': etag})
+            timings['304'].append(time.perf_counter() - started)
+            if response.status_code != 304:
+                print(f'  {url} answered {response.status_code} to a matching If-None-Match')
+        print(f'  {name}')
+        for case, latencies in timings.items():
+            print(f'    {case:16s} {_percentiles(latencies)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Conditional responses and rendered-fragment cache')
+    parser.add_argument('command', choices=['bench'])
+    parser.add_argument('--db', default='instance/interview_system.db', help='database file')
+    parser.add_argument('--requests', type=int, default=200, help='bench: requests per case')
+    args = parser.parse_args()
+
+    bench(args.db, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Question Bank Cache
+Process-local copy of the questions table
+
+The question bank is small and changes rarely, but answers, results and
+admin pages read it all the time. Each process keeps one copy:
+- QuestionRecord objects with __slots__ (no per-object __dict__)
+- by_id: question id -> record
+- ids_by_type / ids_by_category: compact arrays of question ids, for picking
+  random questions and counting without a query
+
+Invalidation: the data_versions table (created by init_db in app.py) holds a
+counter per kind of data (and when it last changed). Every write to the
+questions table bumps the 'questions' counter in the same transaction
+(bump_data_version). page_cache.py uses other counters the same way. Before use,
+the cache compares its version with the table, a single-row primary key
+lookup, and reloads when it changed. An edit made in one server worker
+therefore reaches all the others.
+"""
+
+import threading
+from array import array
+
+QUESTION_FIELDS = ('id', 'question_text', 'question_type', 'category', 'difficulty', 'ideal_answer', 'created_at')
+
+
+def data_version(conn, name):
+    """Current version of a kind of data (0 if it was never bumped)"""
+    row = conn.execute('SELECT version FROM data_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def data_versions(conn, names):
+    """Versions of several kinds of data in one query: {name: (version, changed_at)}"""
+    rows = conn.execute(f'''
+        SELECT name, version, changed_at FROM data_versions WHERE name IN ({', '.join('?' * len(names))})
+    ''', list(names)).fetchall()
+    versions = {name: (0, None) for name in names}
+    versions.update((row[0], (row[1], row[2])) for row in rows)
+    return versions
+
+
+def data_version_statement(name):
+    """bump_data_version() as (sql, params), for statements queued with the change (write_behind.py)"""
+    return ('''
+        INSERT INTO data_versions (name, version, changed_at) VALUES (?, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+    ''', (name,))
+
+
+def bump_data_version(conn, name):
+    """Mark a kind of data as changed; call it in the transaction that changes the data"""
+    conn.execute(*data_version_statement(name))
+
+
+class QuestionRecord:
+    """One question; supports record['field'] as well, like the sqlite3.Row it replaces"""
+    __slots__ = QUESTION_FIELDS
+
+    def __init__(self, row):
+        for field, value in zip(QUESTION_FIELDS, row):
+            setattr(self, field, value)
+
+    def __getitem__(self, field):
+        return getattr(self, field)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in QUESTION_FIELDS}
+
+
+class QuestionCache:
+    """All questions of the bank, reloaded when the 'questions' data version changes"""
+
+    def __init__(self):
+        self.version = None
+        self.by_id = {}
+        self.all_ids = array('l')
+        self.ids_by_type = {}
+        self.ids_by_category = {}
+        self.lock = threading.Lock()
+
+    def refresh(self, conn):
+        """Reload if the question bank changed since it was loaded; returns the cache"""
+        version = data_version(conn, 'questions')
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self._load(conn, version)
+        return self
+
+    def _load(self, conn, version):
+        rows = conn.execute(f'SELECT {", ".join(QUESTION_FIELDS)} FROM questions ORDER BY id').fetchall()
+        by_id = {}
+        all_ids = array('l')
+        ids_by_type = {}
+        ids_by_category = {}
+        for row in rows:
+            record = QuestionRecord(row)
+            by_id[record.id] = record
+            all_ids.append(record.id)
+            ids_by_type.setdefault(record.question_type, array('l')).append(record.id)
+            ids_by_category.setdefault(record.category or 'General', array('l')).append(record.id)
+
+        # Replace everything at once, so readers in other threads never see half a reload
+        self.by_id, self.all_ids = by_id, all_ids
+        self.ids_by_type, self.ids_by_category = ids_by_type, ids_by_category
+        self.version = version
+
+    def get(self, question_id):
+        return self.by_id.get(question_id)
+
+    def ids(self, question_type=None):
+        """Ids of all questions, or of one type"""
+        if question_type is None:
+            return self.all_ids
+        return self.ids_by_type.get(question_type, array('l'))
+
+    def count(self, question_type=None):
+        return len(self.ids(question_type))
+
+    def __len__(self):
+        return len(self.by_id)
@@ -0,0 +1,269 @@
+"""
+Question Search (SQLite FTS5)
+Ranked full-text search over the question bank
+
+questions_fts (created by init_db in app.py) is an FTS5 index of
+question_text and ideal_answer, and of question_type, category and
+difficulty for the filters. It is an external content table: it stores
+only the index, the text stays in the questions table. Triggers on questions
+update it in the same transaction as every insert, update and delete, so
+it is never out of date, whatever wrote to the table.
+
+Search: every word typed must occur, except stop words. Words are stemmed
+(porter), so "lists" finds "list". Results are ranked with bm25, a match in
+the question text counting QUESTION_WEIGHT times as much as a match in the
+ideal answer. The type, category and difficulty filters are matched in the
+index too, so FTS5 intersects them with the words instead of checking the
+questions table for every match. Every match is ranked (FTS5's ORDER BY rank
+keeps only the best LIMIT + OFFSET while it scans), so paging goes through
+all of them, best first.
+
+Similar questions: before a question is added, existing questions that
+contain at least half of its significant words are looked up (an OR of
+ANDs over the question texts, answered from the index). The best
+SIMILAR_CANDIDATES by bm25 are compared word by word (Dice coefficient),
+and those of at least SIMILAR_THRESHOLD are shown to the admin.
+
+Usage:
+    python question_search.py rebuild                  # rebuild the index from the questions table
+    python question_search.py bench --db /tmp/scale.db
+"""
+
+import argparse
+import itertools
+import random
+import re
+import sqlite3
+import time
+
+from markupsafe import Markup, escape
+
+QUESTION_WEIGHT = 10.0       # bm25 weight of question_text against ideal_answer (1.0)
+SIMILAR_CANDIDATES = 20      # Best bm25 matches compared word by word
+SIMILAR_MAX_WORDS = 6        # Longest significant words of a new question used to find similar ones
+SIMILAR_THRESHOLD = 0.5      # Dice coefficient of significant words shown as a similar question
+SNIPPET_WORDS = 16           # Words of the ideal answer shown around the matches
+
+# Columns: question_text, ideal_answer, then the filter columns, which do not count
+BM25_WEIGHTS = f'{QUESTION_WEIGHT}, 1.0, 0.0, 0.0, 0.0'
+BM25 = f'bm25(questions_fts, {BM25_WEIGHTS})'
+
+_WORD = re.compile(r'\w+')
+_HIGHLIGHT_START, _HIGHLIGHT_END = '\x02', '\x03'  # Cannot occur in a question
+
+# Words left out of searches: they match most questions
+STOP_WORDS = frozenset('''
+    a about an and are as at be between by can could describe do does did explain for from give how i if in
+    is it its me of on or should tell that the their there these this to us use used using was we what when
+    where which who why will with would you your
+'''.split())
+
+
+def _significant_words(text):
+    """Lowercase words of a question that say what it is about"""
+    return {word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in STOP_WORDS}
+
+
+def _singular(words):
+    """Words with a plural 's' removed, to compare two questions"""
+    return {word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+            for word in words}
+
+
+def match_expression(text):
+    """
+    FTS5 query for what the admin typed: every word must occur (stop words only
+    if nothing else was typed). Words are quoted, so FTS5 syntax in the input
+    is searched for literally
+    """
+    words = _WORD.findall(text)
+    words = [word for word in words if word.lower() not in STOP_WORDS] or words
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words)
+
+
+def _highlight(marked):
+    """HTML of a highlight()/snippet() result: the text escaped, matches in <mark>"""
+    html = escape(marked or '')
+    return Markup(html.replace(_HIGHLIGHT_START, Markup('<mark>')).replace(_HIGHLIGHT_END, Markup('</mark>')))
+
+
+def _filters(question_type, category, difficulty):
+    """
+    FTS5 column filters and the exact SQL conditions for the filters that are set
+    The index finds 'Web Development' for 'Development' too; the SQL conditions do not
+    """
+    terms, clauses, params = [], [], []
+    for column, value in (('question_type', question_type), ('category', category), ('difficulty', difficulty)):
+        if value:
+            words = _WORD.findall(value)
+            if words:
+                terms.append(f'{column} : "{" ".join(words)}"')
+            clauses.append(f'q.{column} = ?')
+            params.append(value)
+    return terms, clauses, params
+
+
+def search_questions(conn, text, question_type=None, category=None, difficulty=None, limit=20, offset=0):
+    """
+    Questions matching text, best match first (newest first when text is empty)
+    Returns a list of dicts: id, rank (bm25, lower is better; None without text),
+    question_html and answer_html (matches highlighted)
+    """
+    terms, clauses, params = _filters(question_type, category, difficulty)
+    expression = match_expression(text or '')
+    if expression is None:
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = conn.execute(f'''
+            SELECT q.id, q.question_text, q.ideal_answer FROM questions q {where}
+            ORDER BY q.id DESC LIMIT ? OFFSET ?
+        ''', params + [limit, offset]).fetchall()
+        return [{'id': row[0], 'rank': None, 'question_html': escape(row[1] or ''),
+                 'answer_html': escape(' '.join((row[2] or '').split()[:SNIPPET_WORDS]))}
+                for row in rows]
+
+    # Rank first, reading only the index (and questions when filtering); the
+    # highlights read the text of each match, so they are made for this page only
+    where = ' AND '.join(['questions_fts MATCH ?', 'questions_fts.rank MATCH ?'] + clauses)
+    expression = ' AND '.join([f'({expression})'] + terms)
+    join = 'JOIN questions q ON q.id = questions_fts.rowid' if clauses else ''
+    ranked = conn.execute(f'''
+        SELECT questions_fts.rowid, questions_fts.rank FROM questions_fts {join}
+        WHERE {where}
+        ORDER BY questions_fts.rank LIMIT ? OFFSET ?
+    ''', [expression, f'bm25({BM25_WEIGHTS})'] + params + [limit, offset]).fetchall()
+    if not ranked:
+        return []
+
+    ids = [row[0] for row in ranked]
+    marks = (f"'{_HIGHLIGHT_START}'", f"'{_HIGHLIGHT_END}'")
+    highlights = {
+        row[0]: row[1:]
+        for row in conn.execute(f'''
+            SELECT rowid, highlight(questions_fts, 0, {marks[0]}, {marks[1]}),
+                   snippet(questions_fts, 1, {marks[0]}, {marks[1]}, '...', {SNIPPET_WORDS})
+            FROM questions_fts
+            WHERE questions_fts MATCH ? AND rowid IN ({', '.join('?' * len(ids))})
+        ''', [expression] + ids)
+    }
+    return [{'id': question_id, 'rank': rank,
+             'question_html': _highlight(highlights[question_id][0]),
+             'answer_html': _highlight(highlights[question_id][1])}
+            for question_id, rank in ranked if question_id in highlights]
+
+
+def similar_questions(conn, question_text, limit=5):
+    """
+    Existing questions with about the same wording, most similar first
+    Returns a list of dicts: id, question_text, question_type, category, difficulty, similarity
+    """
+    words = _significant_words(question_text or '')
+    if not words:
+        return []
+    # Questions with at least half of the words: ranking every question that
+    # shares one common word would read most of the index. The index is
+    # stemmed, so plurals match too
+    terms = sorted(words, key=lambda word: (-len(word), word))[:SIMILAR_MAX_WORDS]
+    groups = [' AND '.join(f'"{word}"' for word in group)
+              for group in itertools.combinations(terms, (len(terms) + 1) // 2)]
+    candidates = conn.execute(f'''
+        SELECT rowid FROM questions_fts
+        WHERE questions_fts MATCH ?
+        ORDER BY {BM25} LIMIT ?
+    ''', (f"question_text : (({') OR ('.join(groups)}))", SIMILAR_CANDIDATES)).fetchall()
+    if not candidates:
+        return []
+
+    rows = conn.execute(f'''
+        SELECT id, question_text, question_type, category, difficulty FROM questions
+        WHERE id IN ({', '.join('?' * len(candidates))})
+    ''', [row[0] for row in candidates]).fetchall()
+    words = _singular(words)
+    similar = []
+    for question_id, text, question_type, category, difficulty in rows:
+        other = _singular(_significant_words(text or ''))
+        similarity = 2 * len(words & other) / (len(words) + len(other)) if other else 0
+        if similarity >= SIMILAR_THRESHOLD:
+            similar.append({'id': question_id, 'question_text': text, 'question_type': question_type,
+                            'category': category, 'difficulty': difficulty,
+                            'similarity': round(similarity, 2)})
+    similar.sort(key=lambda question: -question['similarity'])
+    return similar[:limit]
+
+
+def rebuild_index(database):
+    """Index every question again (after the index was damaged or restored from an old backup)"""
+    conn = sqlite3.connect(database)
+    started = time.perf_counter()
+    conn.execute("INSERT INTO questions_fts (questions_fts) VALUES ('rebuild')")
+    conn.commit()
+    count = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+    conn.close()
+    print(f'Indexed {count} questions in {time.perf_counter() - started:.1f}s')
+
+
+def _percentiles(latencies):
+    latencies.sort()
+    return (f'p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms   '
+            f'p99 {latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000:6.2f} ms   '
+            f'max {latencies[-1] * 1000:6.2f} ms')
+
+
+def bench(database, queries, seed=42):
+    """Search and similar-question latency with words taken from stored questions"""
+    conn = sqlite3.connect(database)
+    rng = random.Random(seed)
+    total = conn.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+    max_id = conn.execute('SELECT MAX(id) FROM questions').fetchone()[0]
+    if not total:
+        print('There are no questions')
+        return
+    categories = [row[0] for row in conn.execute('SELECT DISTINCT category FROM questions')]
+
+    samples = []
+    while len(samples) < queries:
+        row = conn.execute('SELECT question_text FROM questions WHERE id >= ? ORDER BY id LIMIT 1',
+                           (rng.randint(1, max_id),)).fetchone()
+        words = _WORD.findall(row[0])
+        if words:
+            samples.append((row[0], words))
+
+    cases = {
+        'one word': lambda text, words: search_questions(conn, rng.choice(words)),
+        'two words + filters': lambda text, words: search_questions(
+            conn, ' '.join(rng.sample(words, min(2, len(words)))),
+            question_type=rng.choice(['HR', 'Technical']), category=rng.choice(categories)),
+        'whole question': lambda text, words: search_questions(conn, text),
+        'similar questions': lambda text, words: similar_questions(conn, text),
+    }
+    print(f'{total} questions, {queries} queries per case')
+    for name, run in cases.items():
+        latencies = []
+        for text, words in samples:
+            started = time.perf_counter()
+            run(text, words)
+            latencies.append(time.perf_counter() - started)
+        print(f'  {name:20s} {_percentiles(latencies)}')
+
+    found = sum(any(match['question_text'] == text for match in similar_questions(conn, text))
+                for text, _ in samples)
+    print(f'  similar questions finds the question itself for {found / queries:.1%} of the samples')
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full-text search over the question bank')
+    parser.add_argument('command', choices=['rebuild', 'bench'])
+    parser.add_argument('--db', default='instance/interview_system.db', help='database file')
+    parser.add_argument('--queries', type=int, default=500, help='bench: queries to time per case')
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        rebuild_index(args.db)
+    else:
+        bench(args.db, args.queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Production Server Entry Point
+Runs the Flask application with several pre-forked worker processes
+
+Startup (done once, in the parent process):
+1. init_db() - create tables, run migrations, insert sample questions
+2. Load the question cache and preload evaluator state (NLTK data, stopwords,
+   ideal answer keywords), unless evaluator_service.py is running and does
+   the evaluations
+3. Open the listening socket
+4. Fork N workers; they share the preloaded memory copy-on-write
+
+Signals handled by the parent:
+- SIGHUP: graceful reload (preload again, then replace workers one by one)
+- SIGUSR1: print memory usage of every worker
+- SIGTERM / SIGINT: stop all workers and exit
+
+The question bank is also checked every few seconds and a graceful reload
+happens automatically when it changes.
+
+Each worker counts its running evaluations in its own slot of a shared
+array, and the workers read the accept queue of the listening socket, so
+admission control (admission.py) sees the load of the whole server.
+
+Usage:
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --soft-limit 8 --hard-limit 32   # admission control limits (0: off)
+    python serve.py bench --max-workers 4      # RSS and requests/sec per worker count
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from multiprocessing import Pool
+
+from werkzeug.serving import make_server
+
+from app import admission, app, evaluator_client, get_db, init_db, question_cache, write_queue
+from question_cache import data_version
+
+
+def question_bank_version():
+    """Data version of the question bank, bumped whenever questions are added or deleted"""
+    conn = get_db()
+    version = data_version(conn, 'questions')
+    conn.close()
+    return version
+
+
+def preload():
+    """
+    Prepare everything workers need before they are forked
+    Returns the question bank version that was preloaded
+    """
+    init_db()
+
+    conn = get_db()
+    question_cache.refresh(conn)
+    conn.close()
+
+    # With the evaluator service running the workers never load the NLP models
+    if evaluator_client.ping():
+        print(f"Using the evaluator service at {app.config['EVALUATOR_SOCKET']}", flush=True)
+    else:
+        from nlp_evaluator import warm_up
+
+        warm_up([(q.ideal_answer, q.question_type) for q in question_cache.by_id.values() if q.ideal_answer])
+
+    # Move preloaded objects out of the garbage collector's reach, so
+    # collections in the workers do not write to (and copy) shared pages
+    gc.collect()
+    gc.freeze()
+
+    return question_cache.version
+
+
+def memory_usage(pid):
+    """
+    Memory of one process in kB
+    rss counts shared pages in full; pss splits them between the processes sharing them
+    """
+    usage = {'rss': 0, 'pss': 0}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    usage['rss'] = int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    usage['pss'] = int(line.split()[1])
+    except OSError:
+        pass  # Not Linux, or the process already exited
+    return usage
+
+
+class PreforkServer:
+    """Parent process that owns the listening socket and supervises the workers"""
+
+    def __init__(self, host, port, workers, reload_interval=5):
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.reload_interval = reload_interval
+        self.workers = {}  # pid -> admission counter slot
+        self.running = True
+        self.reload_requested = False
+        self.report_requested = False
+        self.server = None
+        self.version = None
+
+    def spawn_worker(self):
+        """Fork one worker that serves requests from the shared socket"""
+        slot = min(set(range(self.num_workers + 1)) - set(self.workers.values()))
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = slot
+            return pid
+
+        # Worker process
+        server = self.server
+        admission.assign(slot)
+
+        def stop(signum, frame):
+            # shutdown() waits for the current request to finish, so run it in a thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        try:
+            server.serve_forever()
+        finally:
+            write_queue.close()  # Commit queued answers; os._exit skips atexit handlers
+            os._exit(0)
+
+    def stop_worker(self, pid):
+        """Ask a worker to finish its current request and exit"""
+        try:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+        self.release_worker(pid)
+
+    def release_worker(self, pid):
+        """Forget an exited worker; evaluations it was running no longer count"""
+        slot = self.workers.pop(pid, None)
+        if slot is not None:
+            admission.release(slot)
+
+    def reload(self):
+        """Preload again, then replace the workers one at a time so the socket is always served"""
+        print('Reloading workers...', flush=True)
+        gc.unfreeze()
+        self.version = preload()
+        for pid in list(self.workers):
+            self.spawn_worker()
+            self.stop_worker(pid)
+        print(f'Reloaded {len(self.workers)} workers', flush=True)
+
+    def report(self):
+        """Print memory usage of the parent and every worker"""
+        parent = memory_usage(os.getpid())
+        print(f"parent {os.getpid()}: rss={parent['rss']} kB pss={parent['pss']} kB", flush=True)
+        for pid in sorted(self.workers):
+            usage = memory_usage(pid)
+            print(f"worker {pid}: rss={usage['rss']} kB pss={usage['pss']} kB", flush=True)
+
+    def reap_workers(self):
+        """Replace workers that exited unexpectedly"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.workers:
+                self.release_worker(pid)
+                if self.running:
+                    print(f'Worker {pid} exited, starting a new one', flush=True)
+                    self.spawn_worker()
+
+    def run(self):
+        """Preload, fork the workers and supervise them until stopped"""
+        self.version = preload()
+        self.server = make_server(self.host, self.port, app)
+        # One slot more than workers: a reload starts a new worker before stopping the old one
+        admission.share(self.num_workers + 1, self.server.socket)
+
+        def request_stop(signum, frame):
+            self.running = False
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_report(signum, frame):
+            self.report_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGUSR1, request_report)
+
+        for _ in range(self.num_workers):
+            self.spawn_worker()
+        print(f'Serving on http://{self.host}:{self.port} with {self.num_workers} workers '
+              f'(parent pid {os.getpid()})', flush=True)
+
+        last_check = time.monotonic()
+        while self.running:
+            time.sleep(0.2)
+            self.reap_workers()
+
+            if self.report_requested:
+                self.report_requested = False
+                self.report()
+
+            # Reload on SIGHUP or when the question bank changed
+            if not self.reload_requested and time.monotonic() - last_check >= self.reload_interval:
+                last_check = time.monotonic()
+                if question_bank_version() != self.version:
+                    self.reload_requested = True
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+
+        print('Stopping workers...', flush=True)
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.server.server_close()
+
+
+# ==================== BENCHMARK ====================
+
+def _client(args):
+    """Send requests from one client process, returns the number that succeeded"""
+    url, count = args
+    ok = 0
+    for _ in range(count):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                ok += 1
+        except OSError:
+            pass
+    return ok
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_ready(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _worker_pids(parent_pid):
+    try:
+        with open(f'/proc/{parent_pid}/task/{parent_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def bench(max_workers, requests, concurrency, path):
+    """
+    Start the server with 1..max_workers workers and measure each setup
+    Reports requests/sec and average per-worker RSS/PSS
+    """
+    print(f'{"workers":>8} {"req/s":>10} {"rss kB":>10} {"pss kB":>10} {"ok":>8}')
+    for workers in range(1, max_workers + 1):
+        port = _free_port()
+        url = f'http://127.0.0.1:{port}{path}'
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--host', '127.0.0.1',
+             '--port', str(port), '--workers', str(workers)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            if not _wait_until_ready(url):
+                print(f'{workers:>8} server did not start')
+                continue
+
+            per_client = max(1, requests // concurrency)
+            with Pool(concurrency) as pool:
+                started = time.perf_counter()
+                ok = sum(pool.map(_client, [(url, per_client)] * concurrency))
+                duration = time.perf_counter() - started
+
+            usage = [memory_usage(pid) for pid in _worker_pids(proc.pid)]
+            rss = sum(u['rss'] for u in usage) / len(usage) if usage else 0
+            pss = sum(u['pss'] for u in usage) / len(usage) if usage else 0
+            print(f'{workers:>8} {ok / duration:>10.1f} {rss:>10.0f} {pss:>10.0f} {ok:>8}', flush=True)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Production server for the interview system')
+    parser.add_argument('command', nargs='?', default='serve', choices=['serve', 'bench'])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--reload-interval', type=float, default=5,
+                        help='seconds between question bank change checks')
+    parser.add_argument('--soft-limit', type=int, default=app.config['EVALUATION_SOFT_LIMIT'],
+                        help='evaluations running + requests queued before quick evaluations (0: never)')
+    parser.add_argument('--hard-limit', type=int, default=app.config['EVALUATION_HARD_LIMIT'],
+                        help='evaluations running + requests queued before answering 503 (0: never)')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1,
+                        help='bench: largest worker count to measure')
+    parser.add_argument('--requests', type=int, default=2000, help='bench: requests per run')
+    parser.add_argument('--concurrency', type=int, default=16, help='bench: client processes')
+    parser.add_argument('--path', default='/', help='bench: URL path to request')
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        bench(args.max_workers, args.requests, args.concurrency, args.path)
+    else:
+        admission.soft_limit = args.soft_limit or None
+        admission.hard_limit = args.hard_limit or None
+        PreforkServer(args.host, args.port, args.workers, args.reload_interval).run()
+
+
+if __name__ == '__main__':
+    main()
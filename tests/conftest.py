@@ -0,0 +1,47 @@
+"""Shared fixtures: the repository root on sys.path and a fresh application database"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Path of a new database with the application's schema and sample questions (app.init_db)"""
+    import app
+
+    path = str(tmp_path / 'interview_system.db')
+    original = app.app.config['DATABASE']
+    app.app.config['DATABASE'] = path
+    try:
+        app.init_db()
+    finally:
+        app.app.config['DATABASE'] = original
+    return path
+
+
+@pytest.fixture
+def client(database, tmp_path, monkeypatch):
+    """A logged-in test client with an interview of two HR questions in progress"""
+    import app
+
+    monkeypatch.setitem(app.app.config, 'DATABASE', database)
+    monkeypatch.setattr(app.evaluator_client, 'path', str(tmp_path / 'no-evaluator.sock'))
+    conn = sqlite3.connect(database)
+    user_id = conn.execute("INSERT INTO users (username, email, password) VALUES ('ann', 'ann@example.com', 'x')").lastrowid
+    conn.commit()
+    conn.close()
+
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session.update(user_id=user_id, username='ann', is_admin=0)
+        reply = client.post('/api/interview/start', json={'interview_type': 'HR', 'num_questions': 2})
+        assert reply.status_code == 200
+        yield client
+    # The next test has another database: start a new flush thread for it
+    app.write_queue.close()
+    app.write_queue.pid = None
@@ -0,0 +1,249 @@
+"""Admission control: full, quick and refused evaluations, and rescoring the quick ones"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import nlp_evaluator
+from admission import FULL, QUICK, AdmissionController, Overloaded, rescore
+from adaptive_selection import MASTERY_WEIGHT
+
+
+# ==================== CONTROLLER ====================
+
+def test_mode_follows_the_evaluations_in_flight():
+    controller = AdmissionController(soft_limit=1, hard_limit=2, retry_after=3)
+    with controller.admit() as first:
+        with controller.admit() as second:
+            with pytest.raises(Overloaded) as refused:
+                controller.mode()
+        assert controller.in_flight() == 1
+    assert (first, second) == (FULL, QUICK)
+    assert refused.value.retry_after == 3
+    assert controller.in_flight() == 0
+
+
+def test_a_refused_or_failed_evaluation_is_not_counted():
+    controller = AdmissionController(soft_limit=None, hard_limit=1)
+    with controller.admit():
+        with pytest.raises(Overloaded):
+            with controller.admit():
+                pass
+    with pytest.raises(ValueError):
+        with controller.admit():
+            raise ValueError('evaluation failed')
+    assert controller.in_flight() == 0
+
+
+def test_no_limits_never_refuse():
+    controller = AdmissionController(soft_limit=None, hard_limit=None)
+    controller.counts[0] = 1000
+    assert controller.mode() == FULL
+
+
+def test_counts_are_shared_by_worker_slots_and_released():
+    controller = AdmissionController(soft_limit=2, hard_limit=None)
+    controller.share(3)
+    controller.assign(1)
+    controller.counts[2] = 2  # Another worker is evaluating two answers
+    assert controller.mode() == QUICK
+    controller.release(2)  # That worker exited
+    assert controller.mode() == FULL
+
+    with controller.admit():
+        assert list(controller.counts) == [0, 1, 0]
+
+
+def test_concurrent_admits_are_counted_exactly():
+    controller = AdmissionController(soft_limit=None, hard_limit=None)
+
+    def work():
+        for _ in range(2000):
+            with controller.admit():
+                pass
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert controller.in_flight() == 0
+
+
+# ==================== ANSWER ROUTES ====================
+
+def saved_responses(database):
+    import app
+
+    assert app.write_queue.flush(5)
+    conn = sqlite3.connect(database)
+    rows = conn.execute('SELECT score, needs_rescoring FROM interview_responses').fetchall()
+    conn.close()
+    return rows
+
+
+def test_answer_at_the_hard_limit_is_refused_with_retry_after(client, database, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.admission, 'hard_limit', 0)
+    reply = client.post('/api/interview/answer', json={'answer': 'Python is a programming language.'})
+
+    assert reply.status_code == 503
+    assert reply.headers['Retry-After'] == str(app.admission.retry_after)
+    assert reply.get_json()['retry_after'] == app.admission.retry_after
+    assert saved_responses(database) == []
+    assert app.admission.in_flight() == 0
+
+
+@pytest.fixture
+def evaluators(monkeypatch):
+    """Records which evaluator scored each answer: evaluate_answer scores 70, quick_evaluate 35"""
+    calls = []
+
+    def evaluate_answer(question_text, user_answer, question_type, **kwargs):
+        calls.append('full')
+        return {'score': 70, 'feedback': 'full', 'keywords_matched': [], 'degraded': False, 'degraded_stages': []}
+
+    def quick_evaluate(question_text, user_answer, question_type, max_tokens=None):
+        calls.append('quick')
+        return {'score': 35, 'feedback': 'quick', 'keywords_matched': [], 'degraded': True,
+                'degraded_stages': ['overload']}
+
+    monkeypatch.setattr(nlp_evaluator, 'evaluate_answer', evaluate_answer)
+    monkeypatch.setattr(nlp_evaluator, 'quick_evaluate', quick_evaluate)
+    return calls
+
+
+def test_answer_below_the_soft_limit_gets_the_full_evaluation(client, database, evaluators):
+    reply = client.post('/api/interview/answer', json={'answer': 'I enjoy working in teams.'})
+
+    assert reply.status_code == 200
+    assert evaluators == ['full']
+    assert reply.get_json()['evaluation']['degraded_stages'] == []
+    assert saved_responses(database) == [(70, 0)]
+
+
+def test_answer_above_the_soft_limit_gets_a_quick_evaluation(client, database, evaluators, monkeypatch):
+    import app
+
+    monkeypatch.setattr(app.admission, 'soft_limit', 0)
+    reply = client.post('/api/interview/answer', json={'answer': 'I enjoy working in teams.'})
+
+    assert reply.status_code == 200
+    assert evaluators == ['quick']
+    assert 'overload' in reply.get_json()['evaluation']['degraded_stages']
+    assert saved_responses(database) == [(35, 1)]  # Flagged for rescoring
+    assert app.admission.in_flight() == 0
+
+
+# ==================== RESCORING ====================
+
+@pytest.fixture
+def quick_scored(database):
+    """
+    A completed interview with a quick score of 40 followed by a full score of 80 for
+    the same HR question, with the statistics, mastery, analytics and rollups they produced
+    """
+    conn = sqlite3.connect(database)
+    question_id, category = conn.execute(
+        "SELECT id, COALESCE(category, 'General') FROM questions WHERE question_type = 'HR' ORDER BY id").fetchone()
+    user_id = conn.execute("INSERT INTO users (username, email, password) VALUES ('bob', 'bob@example.com', 'x')").lastrowid
+    interview_id = conn.execute('''
+        INSERT INTO interviews (user_id, interview_type, total_questions, completed_at, status)
+        VALUES (?, 'HR', 2, '2026-03-04 10:00:00', 'Completed')
+    ''', (user_id,)).lastrowid
+    responses = [conn.execute('''
+        INSERT INTO interview_responses (interview_id, question_id, user_answer, score, feedback, needs_rescoring)
+        VALUES (?, ?, ?, ?, 'quick', ?)
+    ''', (interview_id, question_id, answer, score, needs_rescoring)).lastrowid
+        for answer, score, needs_rescoring in (('first answer', 40, 1), ('second answer', 80, 0))]
+    conn.execute('UPDATE question_stats SET response_count = 2, score_mean = 60, score_m2 = 800 WHERE question_id = ?',
+                 (question_id,))
+    conn.execute('INSERT INTO user_category_mastery (user_id, category, response_count, mastery) VALUES (?, ?, 2, 50)',
+                 (user_id, category))
+    conn.execute('''
+        INSERT INTO performance_analytics
+        (user_id, interview_id, overall_score, hr_score, technical_score, total_questions, questions_answered)
+        VALUES (?, ?, 60, 60, 0, 2, 2)
+    ''', (user_id, interview_id))
+    conn.executemany('''
+        INSERT INTO performance_rollups
+        (user_id, period, period_start, interview_type, interview_count, score_sum, score_min, score_max)
+        VALUES (?, ?, ?, 'HR', 1, 60, 60, 60)
+    ''', [(user_id, 'day', '2026-03-04'), (user_id, 'week', '2026-03-02')])
+    conn.commit()
+    conn.close()
+    return dict(question_id=question_id, category=category, user_id=user_id, interview_id=interview_id,
+                responses=responses)
+
+
+@pytest.fixture
+def full_score_70(monkeypatch):
+    """evaluate_answer scores every answer 70, so the corrections can be checked exactly"""
+    calls = []
+
+    def evaluate_answer(question_text, user_answer, question_type, ideal_answer=None):
+        calls.append(user_answer)
+        return {'score': 70, 'feedback': 'full', 'keywords_matched': ['python']}
+
+    monkeypatch.setattr(nlp_evaluator, 'evaluate_answer', evaluate_answer)
+    return calls
+
+
+def test_rescore_corrects_everything_computed_from_the_quick_score(database, quick_scored, full_score_70):
+    assert rescore(database, MASTERY_WEIGHT) == 1
+    assert full_score_70 == ['first answer']
+
+    conn = sqlite3.connect(database)
+    assert conn.execute('SELECT score, feedback, needs_rescoring FROM interview_responses WHERE id = ?',
+                        (quick_scored['responses'][0],)).fetchone() == (70, 'full', 0)
+    mean, m2 = conn.execute('SELECT score_mean, score_m2 FROM question_stats WHERE question_id = ?',
+                            (quick_scored['question_id'],)).fetchone()
+    assert mean == pytest.approx(75)  # Scores 70 and 80
+    assert m2 == pytest.approx(50)
+    mastery = conn.execute('SELECT mastery FROM user_category_mastery WHERE user_id = ?',
+                           (quick_scored['user_id'],)).fetchone()[0]
+    # The first answer counted fully; one later answer has since weighed it by (1 - weight)
+    assert mastery == pytest.approx(50 + 30 * (1 - MASTERY_WEIGHT))
+    assert conn.execute('SELECT overall_score, hr_score FROM performance_analytics WHERE interview_id = ?',
+                        (quick_scored['interview_id'],)).fetchone() == (75, 75)
+    assert conn.execute('''
+        SELECT period, period_start, interview_count, score_sum, score_min, score_max
+        FROM performance_rollups WHERE user_id = ? ORDER BY period
+    ''', (quick_scored['user_id'],)).fetchall() == [('day', '2026-03-04', 1, 75, 75, 75),
+                                                     ('week', '2026-03-02', 1, 75, 75, 75)]
+    versions = dict(conn.execute('SELECT name, version FROM data_versions'))
+    assert f"interview:{quick_scored['interview_id']}" in versions
+    assert f"performance:{quick_scored['user_id']}" in versions
+    conn.close()
+
+    # Nothing is left to rescore
+    assert rescore(database, MASTERY_WEIGHT) == 0
+
+
+def test_rescore_waits_for_interviews_in_progress(database, quick_scored, full_score_70):
+    conn = sqlite3.connect(database)
+    conn.execute("UPDATE interviews SET status = 'In Progress', completed_at = NULL WHERE id = ?",
+                 (quick_scored['interview_id'],))
+    conn.execute("UPDATE interview_responses SET answered_at = datetime('now') WHERE interview_id = ?",
+                 (quick_scored['interview_id'],))
+    conn.commit()
+
+    assert rescore(database, MASTERY_WEIGHT, min_age=3600) == 0
+
+    conn.execute("UPDATE interview_responses SET answered_at = datetime('now', '-2 hours') WHERE interview_id = ?",
+                 (quick_scored['interview_id'],))
+    conn.commit()
+    conn.close()
+    assert rescore(database, MASTERY_WEIGHT, min_age=3600) == 1
+
+
+def test_rescore_skips_archived_interviews(database, quick_scored, full_score_70):
+    conn = sqlite3.connect(database)
+    conn.execute("UPDATE interviews SET archived_month = '2026-03' WHERE id = ?", (quick_scored['interview_id'],))
+    conn.commit()
+    conn.close()
+
+    assert rescore(database, MASTERY_WEIGHT) == 0
+    assert full_score_70 == []
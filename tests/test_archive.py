@@ -0,0 +1,164 @@
+"""Archive: moving old interviews to month files, and reading them back page by page"""
+
+import os
+import sqlite3
+import stat
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+
+# Days ago each interview was completed; the first ones are older than ARCHIVE_AFTER_DAYS
+COMPLETED_DAYS_AGO = (700, 640, 639, 600, 560, 500, 430, 400, 60, 30, 2)
+RESPONSES_PER_INTERVIEW = 3
+
+
+@pytest.fixture
+def history(database, tmp_path):
+    """A user with completed interviews spread over several months; returns (conn, folder, interview ids)"""
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    user_id = conn.execute("INSERT INTO users (username, email, password) VALUES ('ann', 'ann@example.com', 'x')").lastrowid
+    question_id = conn.execute('SELECT MIN(id) FROM questions').fetchone()[0]
+    interview_ids = []
+    for number, days_ago in enumerate(COMPLETED_DAYS_AGO):
+        completed_at = (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%d %H:%M:%S')
+        interview_id = conn.execute('''
+            INSERT INTO interviews (user_id, interview_type, total_questions, started_at, completed_at, status)
+            VALUES (?, 'HR', ?, ?, ?, 'Completed')
+        ''', (user_id, RESPONSES_PER_INTERVIEW, completed_at, completed_at)).lastrowid
+        for answer in range(RESPONSES_PER_INTERVIEW):
+            conn.execute('''
+                INSERT INTO interview_responses (interview_id, question_id, user_answer, score, feedback, answered_at)
+                VALUES (?, ?, ?, ?, 'ok', ?)
+            ''', (interview_id, question_id, f'answer {number}.{answer}', number * 10 + answer, completed_at))
+        conn.execute('''
+            INSERT INTO performance_analytics
+            (user_id, interview_id, overall_score, hr_score, technical_score, total_questions, questions_answered, created_at)
+            VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+        ''', (user_id, interview_id, number * 10, number * 10, RESPONSES_PER_INTERVIEW, RESPONSES_PER_INTERVIEW,
+              completed_at))
+        interview_ids.append(interview_id)
+    # An old interview that was never finished stays where it is
+    conn.execute('''
+        INSERT INTO interviews (user_id, interview_type, started_at, status)
+        VALUES (?, 'HR', '2000-01-01 10:00:00', 'In Progress')
+    ''', (user_id,))
+    conn.commit()
+    folder = str(tmp_path / 'archive')
+    yield conn, database, folder, user_id, interview_ids
+    conn.close()
+
+
+def responses_of(conn, folder, interview_id):
+    interview = conn.execute('SELECT * FROM interviews WHERE id = ?', (interview_id,)).fetchone()
+    return [(row['id'], row['user_answer'], row['score'])
+            for row in archive.interview_responses(conn, folder, interview)]
+
+
+def test_archive_moves_old_interviews_to_month_files(history):
+    conn, database, folder, _, interview_ids = history
+    old = [interview_id for interview_id, days_ago in zip(interview_ids, COMPLETED_DAYS_AGO)
+           if days_ago > archive.ARCHIVE_AFTER_DAYS]
+
+    interviews, responses = archive.archive(database, folder, chunk_size=2, pause=0)
+
+    assert (interviews, responses) == (len(old), len(old) * RESPONSES_PER_INTERVIEW)
+    archived = {row['id']: row['archived_month'] for row in conn.execute(
+        'SELECT id, archived_month FROM interviews WHERE archived_month IS NOT NULL')}
+    assert sorted(archived) == old
+    for interview_id, month in archived.items():
+        completed_at = conn.execute('SELECT completed_at FROM interviews WHERE id = ?', (interview_id,)).fetchone()[0]
+        assert month == completed_at[:7]
+    for table in archive.ARCHIVED_TABLES:
+        left = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE interview_id IN ({",".join("?" * len(old))})',
+                            old).fetchone()[0]
+        assert left == 0
+
+    months = {row['month']: (row['interview_count'], row['response_count'])
+              for row in conn.execute('SELECT * FROM archive_months')}
+    assert sum(count for count, _ in months.values()) == len(old)
+    for month in months:
+        mode = os.stat(archive.archive_path(folder, month)).st_mode
+        assert not mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)  # Month files are read-only
+
+    # Nothing is left to archive, and a second run changes nothing
+    assert archive.archive(database, folder, pause=0) == (0, 0)
+
+
+def test_archived_responses_read_the_same_as_before(history):
+    conn, database, folder, _, interview_ids = history
+    before = {interview_id: responses_of(conn, folder, interview_id) for interview_id in interview_ids}
+
+    archive.archive(database, folder, chunk_size=2, pause=0)
+
+    after = {interview_id: responses_of(conn, folder, interview_id) for interview_id in interview_ids}
+    assert after == before
+    assert all(len(rows) == RESPONSES_PER_INTERVIEW for rows in after.values())
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 5, len(COMPLETED_DAYS_AGO)])
+def test_user_performance_pages_cross_from_main_into_the_archive(history, limit):
+    conn, database, folder, user_id, interview_ids = history
+    newest_first = list(reversed(interview_ids))
+
+    archive.archive(database, folder, chunk_size=2, pause=0)
+
+    for offset in range(len(interview_ids) + 2):
+        rows = archive.user_performance(conn, folder, user_id, limit, offset)
+        assert [row['interview_id'] for row in rows] == newest_first[offset:offset + limit], f'offset {offset}'
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, len(COMPLETED_DAYS_AGO) + 1])
+def test_all_performance_pages_cross_from_main_into_the_archive(history, limit):
+    conn, database, folder, _, interview_ids = history
+    newest_first = list(reversed(interview_ids))
+    archive.archive(database, folder, chunk_size=2, pause=0)
+
+    for offset in range(len(interview_ids) + 2):
+        rows = archive.all_performance(conn, folder, limit, offset)
+        assert [row['interview_id'] for row in rows] == newest_first[offset:offset + limit], f'offset {offset}'
+        assert {row['username'] for row in rows} <= {'ann'}
+    assert archive.performance_count(conn) == len(interview_ids)
+
+
+def test_first_page_does_not_attach_month_files(history):
+    conn, database, folder, _, _ = history
+    archive.archive(database, folder, pause=0)
+    for month in archive.archived_months(conn):
+        os.unlink(archive.archive_path(folder, month))
+
+    # Three interviews are still in the main database; a page of them never reads the archive
+    assert len(archive.all_performance(conn, folder, 3)) == 3
+    with pytest.raises(FileNotFoundError):
+        archive.all_performance(conn, folder, 4)
+
+
+def test_missing_month_file_is_an_error_not_an_empty_result(history):
+    conn, database, folder, _, interview_ids = history
+    archive.archive(database, folder, pause=0)
+    month = conn.execute('SELECT archived_month FROM interviews WHERE id = ?', (interview_ids[0],)).fetchone()[0]
+    os.unlink(archive.archive_path(folder, month))
+
+    with pytest.raises(FileNotFoundError):
+        responses_of(conn, folder, interview_ids[0])
+
+
+def test_admin_results_page_through_the_archive(history, monkeypatch):
+    import app
+
+    conn, database, folder, _, interview_ids = history
+    archive.archive(database, folder, pause=0)
+    monkeypatch.setitem(app.app.config, 'DATABASE', database)
+    monkeypatch.setitem(app.app.config, 'ARCHIVE_FOLDER', folder)
+    monkeypatch.setitem(app.app.config, 'ADMIN_RESULTS_PAGE_SIZE', 4)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id=1, username='admin', is_admin=1)
+
+    pages = [client.get(f'/admin/results?page={page}').get_data(as_text=True) for page in (1, 2, 3)]
+    for page, html in enumerate(pages, start=1):
+        assert f'({len(interview_ids)} results)' in html
+        assert html.count('View Details') == min(4, len(interview_ids) - (page - 1) * 4)
+    assert 'page=2' in pages[0] and 'page=4' not in pages[2]
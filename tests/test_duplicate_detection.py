@@ -0,0 +1,73 @@
+"""Near-duplicate index: which cached admin results pages a new answer invalidates"""
+
+import sqlite3
+
+import pytest
+
+from duplicate_detection import index_statements
+from question_cache import data_version
+
+ANSWER = ('I handled the conflict by listening to both colleagues, writing down the facts they agreed on '
+          'and proposing a plan that split the work by strengths, which we reviewed again after a week')
+OTHER_ANSWER = ('My greatest strength is patience with customers; in my last job I answered support '
+                'tickets for three years and learned to explain technical problems in simple words')
+
+
+def save_answer(conn, interview_id, question_id, text):
+    """Save and index an answer with the statements record_answer queues"""
+    conn.execute('''
+        INSERT INTO interview_responses (interview_id, question_id, user_answer, score, feedback)
+        VALUES (?, ?, ?, 50, 'ok')
+    ''', (interview_id, question_id, text))
+    for statement in index_statements(text):
+        conn.execute(*statement)
+    conn.commit()
+
+
+@pytest.fixture
+def interviews(database):
+    """Three users with one completed interview each; returns (conn, question id, interview ids)"""
+    conn = sqlite3.connect(database)
+    question_id = conn.execute('SELECT MIN(id) FROM questions').fetchone()[0]
+    interview_ids = []
+    for username in ('ann', 'bob', 'cid'):
+        user_id = conn.execute('INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                               (username, f'{username}@example.com', 'x')).lastrowid
+        interview_ids.append(conn.execute('''
+            INSERT INTO interviews (user_id, interview_type, total_questions, completed_at, status)
+            VALUES (?, 'HR', 1, CURRENT_TIMESTAMP, 'Completed')
+        ''', (user_id,)).lastrowid)
+    save_answer(conn, interview_ids[0], question_id, ANSWER)
+    save_answer(conn, interview_ids[1], question_id, OTHER_ANSWER)
+    yield conn, question_id, interview_ids
+    conn.close()
+
+
+def test_near_copy_invalidates_only_the_matching_interview(interviews):
+    conn, question_id, (ann, bob, cid) = interviews
+    before = {interview_id: data_version(conn, f'duplicates:{interview_id}') for interview_id in (ann, bob)}
+    save_answer(conn, cid, question_id, ANSWER.replace('a week', 'two weeks'))
+    assert data_version(conn, f'duplicates:{ann}') == before[ann] + 1
+    assert data_version(conn, f'duplicates:{bob}') == before[bob]
+
+
+def test_admin_results_page_kept_until_a_match_is_saved(interviews, database, monkeypatch):
+    import app
+
+    conn, question_id, (ann, bob, cid) = interviews
+    monkeypatch.setitem(app.app.config, 'DATABASE', database)
+    admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+    with app.app.test_client() as client:
+        with client.session_transaction() as session:
+            session.update(user_id=admin_id, username='admin', is_admin=1)
+        first = client.get(f'/admin/results/{ann}')
+        assert first.status_code == 200 and first.headers['ETag']
+
+        save_answer(conn, bob, question_id, OTHER_ANSWER + ' and I still enjoy it')
+        reply = client.get(f'/admin/results/{ann}', headers={'If-None-Match': first.headers['ETag']})
+        assert reply.status_code == 304
+
+        save_answer(conn, cid, question_id, ANSWER)
+        reply = client.get(f'/admin/results/{ann}', headers={'If-None-Match': first.headers['ETag']})
+        assert reply.status_code == 200
+        assert b'cid' in reply.data
@@ -0,0 +1,41 @@
+"""JSON API routes: logins, and the current question after a response that never reached the browser"""
+
+import pytest
+
+import nlp_evaluator
+
+API_ROUTES = [('GET', '/api/interview/question'), ('POST', '/api/interview/answer'),
+              ('POST', '/api/interview/complete'), ('GET', '/api/performance/series')]
+
+
+@pytest.fixture(autouse=True)
+def fixed_evaluation(monkeypatch):
+    monkeypatch.setattr(nlp_evaluator, 'evaluate_answer',
+                        lambda *args, **kwargs: {'score': 70, 'feedback': 'full', 'keywords_matched': []})
+
+
+def test_current_question_moves_past_an_answer_saved_with_a_lost_response(client):
+    with client.session_transaction() as session:
+        before = dict(session)
+    assert client.post('/api/interview/answer', json={'answer': 'I enjoy working in teams.'}).status_code == 200
+    # The connection dropped: the browser still has the session cookie from before the answer
+    with client.session_transaction() as session:
+        session.clear()
+        session.update(before)
+
+    question = client.get('/api/interview/question').get_json()['question']
+    assert question['question_num'] == 2
+
+
+def test_current_question_stays_when_the_answer_was_not_saved(client):
+    assert client.get('/api/interview/question').get_json()['question']['question_num'] == 1
+
+
+@pytest.mark.parametrize('method, path', API_ROUTES)
+def test_api_routes_answer_401_without_login(database, monkeypatch, method, path):
+    import app
+
+    monkeypatch.setitem(app.app.config, 'DATABASE', database)
+    reply = app.app.test_client().open(path, method=method, json={})
+    assert reply.status_code == 401
+    assert reply.get_json() == {'error': 'Login required'}
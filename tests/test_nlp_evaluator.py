@@ -0,0 +1,105 @@
+"""Evaluation budget: answer truncation, CPU time budget and worst-case latency"""
+
+import re
+import time
+
+import pytest
+
+import nlp_evaluator
+from nlp_evaluator import BENCH_QUESTION, EVALUATION_TIME_BUDGET, bench_answers, evaluate_answer, truncate_answer
+
+QUESTION_TEXT, QUESTION_TYPE, IDEAL_ANSWER = BENCH_QUESTION
+ANSWER = ('Normalization organizes the tables of a database so that data is not stored twice, '
+          'which removes redundancy and keeps the data consistent.')
+
+
+class StandInStopwords:
+    @staticmethod
+    def words(language):
+        return ['the', 'is', 'a', 'an', 'and', 'of', 'to', 'in', 'that', 'so', 'it', 'not']
+
+
+@pytest.fixture(autouse=True)
+def nltk_data(monkeypatch):
+    """The NLTK data when it is downloaded; otherwise a regex tokenizer and a short stopword list"""
+    try:
+        nlp_evaluator.word_tokenize('An answer.')
+        nlp_evaluator.stopwords.words('english')
+    except LookupError:
+        monkeypatch.setattr(nlp_evaluator, 'word_tokenize', lambda text: re.findall(r'\w+|[^\w\s]', text))
+        monkeypatch.setattr(nlp_evaluator, 'stopwords', StandInStopwords)
+        monkeypatch.setattr(nlp_evaluator, '_stop_words', None)
+
+
+class FakeClock:
+    """thread_time() that reads `used` CPU seconds after the first call"""
+
+    def __init__(self, used):
+        self.used = used
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return 0.0 if self.calls == 1 else self.used
+
+
+def test_truncate_answer_keeps_the_first_words():
+    assert truncate_answer('one two three', 3) == ('one two three', False)
+    assert truncate_answer('one two three four', 3) == ('one two three', True)
+    assert truncate_answer('one two three', 0) == ('one two three', False)
+
+
+def test_words_joined_by_punctuation_count_as_separate_words():
+    assert truncate_answer('a.b.c.d', 2) == ('a.b', True)
+    assert truncate_answer('x' * 100000, 2) == ('x' * 100000, False)  # One word stays one word
+
+
+def test_ordinary_answer_is_not_degraded():
+    result = evaluate_answer(QUESTION_TEXT, ANSWER, QUESTION_TYPE, IDEAL_ANSWER)
+    assert result['degraded_stages'] == []
+    assert not result['degraded']
+    assert 0 < result['score'] <= 100
+
+
+def test_half_the_budget_used_skips_bigrams(monkeypatch):
+    monkeypatch.setattr(nlp_evaluator.time, 'thread_time', FakeClock(0.3))
+    result = evaluate_answer(QUESTION_TEXT, ANSWER, QUESTION_TYPE, IDEAL_ANSWER, time_budget=0.5)
+    assert result['degraded_stages'] == ['bigrams']
+
+
+def test_used_up_budget_skips_tfidf_and_shortens_feedback(monkeypatch):
+    full = evaluate_answer(QUESTION_TEXT, ANSWER, QUESTION_TYPE, IDEAL_ANSWER)
+    monkeypatch.setattr(nlp_evaluator.time, 'thread_time', FakeClock(0.6))
+    result = evaluate_answer(QUESTION_TEXT, ANSWER, QUESTION_TYPE, IDEAL_ANSWER, time_budget=0.5)
+    assert result['degraded_stages'] == ['tfidf', 'feedback']
+    assert 0 < result['score'] <= 100
+    assert len(result['feedback']) < len(full['feedback'])
+
+
+def test_budget_is_cpu_time_not_waiting_time(monkeypatch):
+    # A thread that waits (for the CPU, the GIL or here a sleep) does not use up its budget
+    cpu_clock = time.thread_time
+
+    def slow_clock():
+        time.sleep(0.05)
+        return cpu_clock()
+
+    monkeypatch.setattr(nlp_evaluator.time, 'thread_time', slow_clock)
+    result = evaluate_answer(QUESTION_TEXT, ANSWER, QUESTION_TYPE, IDEAL_ANSWER, time_budget=0.04)
+    assert result['degraded_stages'] == []
+
+
+@pytest.mark.parametrize('name', list(bench_answers(1024)))
+def test_worst_case_answers_are_truncated_and_bounded(name):
+    answer = bench_answers(1024 * 1024)[name]
+    limit = 2 * EVALUATION_TIME_BUDGET  # The same limit as `python nlp_evaluator.py bench`
+
+    started = time.perf_counter()
+    result = evaluate_answer(QUESTION_TEXT, answer, QUESTION_TYPE, IDEAL_ANSWER)
+    took = time.perf_counter() - started
+
+    if name == 'one long word':
+        assert 'truncated' not in result['degraded_stages']  # One word: nothing to cut
+    else:
+        assert result['degraded_stages'][0] == 'truncated'
+    assert took <= limit, f'{name}: {took * 1000:.0f} ms'
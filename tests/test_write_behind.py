@@ -0,0 +1,129 @@
+"""Write-behind queue: crash safety, failed statements, commit timeouts and a dead flush thread"""
+
+import sqlite3
+
+import pytest
+
+from write_behind import INSERT, SCHEMA, WriteBehindQueue, WriteTimeout, _unit, crash_test
+
+
+def fresh_database(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    conn.commit()
+    conn.close()
+    return path
+
+
+def committed_units(path):
+    conn = sqlite3.connect(path)
+    parts = {}
+    for unit, part in conn.execute('SELECT unit, part FROM responses'):
+        parts.setdefault(unit, set()).add(part)
+    conn.close()
+    return parts
+
+
+def test_killed_writer_keeps_acknowledged_writes_and_no_partial_ones():
+    # Each round kills a writing process at a random moment and checks the database
+    assert crash_test(rounds=3, count=100000)
+
+
+def test_failed_submission_does_not_lose_the_rest_of_its_batch(tmp_path):
+    path = fresh_database(tmp_path)
+    queue = WriteBehindQueue(path, max_delay=0.05)
+    try:
+        first = queue.submit(_unit(1))
+        bad = queue.submit([(INSERT, (2, 1, 'answer')), ('INSERT INTO missing_table VALUES (?)', (1,))])
+        queue.submit(_unit(3), wait=True)
+        with pytest.raises(sqlite3.OperationalError):
+            bad.wait(5)
+        first.wait(5)
+    finally:
+        queue.close()
+
+    # The failed submission is rolled back as a whole, the others are committed
+    assert committed_units(path) == {1: {1, 2}, 3: {1, 2}}
+
+
+def test_wait_times_out_while_the_database_is_locked(tmp_path):
+    path = fresh_database(tmp_path)
+    queue = WriteBehindQueue(path, timeout=0.2)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute('BEGIN EXCLUSIVE')
+    try:
+        with pytest.raises(WriteTimeout):
+            queue.submit(_unit(1), wait=True)
+        assert not queue.flush(0.1)
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+
+    # The timed-out write was not lost: it is committed once the lock is gone
+    assert queue.flush(10)
+    queue.close()
+    assert committed_units(path) == {1: {1, 2}}
+
+
+def test_writes_are_committed_directly_after_the_flush_thread_stops(tmp_path):
+    path = fresh_database(tmp_path)
+    calls = []
+
+    def database():
+        calls.append(path)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError('unable to open database file')  # Stops the flush thread
+        return path
+
+    queue = WriteBehindQueue(database)
+    queue.submit(_unit(1))
+    queue.submit(_unit(2), wait=True)
+    assert queue.flush(5)
+    assert isinstance(queue.failed, sqlite3.OperationalError)
+    queue.submit(_unit(3), wait=True)
+    queue.close()
+
+    assert committed_units(path) == {1: {1, 2}, 2: {1, 2}, 3: {1, 2}}
+
+
+def test_unless_skips_a_submission_that_was_already_saved(tmp_path):
+    path = fresh_database(tmp_path)
+    queue = WriteBehindQueue(path)
+    saved = ('SELECT 1 FROM responses WHERE unit = ?', (1,))
+    queue.submit(_unit(1), unless=saved)
+    queue.submit(_unit(1), unless=saved)  # In the same batch
+    queue.submit(_unit(1), wait=True, unless=saved)  # In a later one
+    queue.close()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 2  # One submission, two rows
+    conn.close()
+
+
+def test_answer_retried_after_a_commit_timeout_is_saved_once(client, database, monkeypatch):
+    import app
+    import nlp_evaluator
+
+    monkeypatch.setattr(nlp_evaluator, 'evaluate_answer',
+                        lambda *args, **kwargs: {'score': 70, 'feedback': 'full', 'keywords_matched': []})
+    monkeypatch.setitem(app.app.config, 'WRITE_BEHIND_WAIT', True)
+    monkeypatch.setattr(app.write_queue, 'timeout', 0.2)
+    answer = {'answer': 'I am a software developer who enjoys working in teams.'}
+
+    blocker = sqlite3.connect(database, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')  # Readers go on, the write queue waits
+    try:
+        assert client.post('/api/interview/answer', json=answer).status_code == 503
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+    # The first attempt is committed late; the client's retry must not save the answer again
+    reply = client.post('/api/interview/answer', json=answer)
+    assert reply.status_code == 200
+    assert reply.get_json()['next_question']['question_num'] == 2
+
+    conn = sqlite3.connect(database)
+    assert conn.execute('SELECT COUNT(*) FROM interview_responses').fetchone()[0] == 1
+    assert conn.execute('SELECT SUM(response_count) FROM question_stats').fetchone()[0] == 1
+    conn.close()
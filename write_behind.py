@@ -0,0 +1,385 @@
+"""
+Write-Behind Queue with Group Commit
+Buffers database writes and commits them in batches
+
+Without it every answer is its own INSERT + COMMIT, and each commit waits
+for the disk (fsync). Here request threads submit their statements to a
+queue and a background thread commits everything that is waiting in one
+transaction, so many requests share one fsync.
+
+- submit(statements) returns immediately (write-behind); submit(..., wait=True)
+  returns once the statements are committed (group commit)
+- flush() waits until everything submitted so far is committed; call it
+  before reading data that may still be in the queue
+- The statements of one submit() call are committed together or not at all
+- submit(..., unless=(sql, params)) skips the statements when that query
+  returns a row at commit time, so a retried request is not saved twice
+- Waits are bounded: submit(..., wait=True) raises WriteTimeout after
+  `timeout` seconds, and flush() returns False when its timeout passes
+- If the flush thread stops (e.g. the database could not be opened), what
+  is waiting and every later submission is committed directly (in the
+  submitting thread), as if there were no queue
+
+Crash safety: committed batches are durable like any SQLite commit, and a
+crash during a flush rolls the whole batch back (never half a submission).
+Writes that were submitted without waiting and not flushed yet are lost if
+the process crashes, so at most max_delay seconds of such writes are at risk.
+
+Usage:
+    python write_behind.py bench        # throughput vs one commit per request
+    python write_behind.py crash-test   # kill a writer mid-stream and check the database
+"""
+
+import argparse
+import atexit
+import logging
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteTimeout(TimeoutError):
+    """The statements were not committed in time (they may still be committed later)"""
+
+
+class WriteTicket:
+    """Tells the submitter when (and whether) its statements were committed"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise WriteTimeout('Write was not committed in time')
+        if self.error:
+            raise self.error
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+
+class WriteBehindQueue:
+    """
+    Queue of pending writes with a background group-commit thread
+
+    database: path of the SQLite database, or a function returning it
+    max_batch: most submissions committed in one transaction
+    max_delay: seconds to wait for more submissions before committing
+    timeout: seconds submit(..., wait=True) waits for the commit
+    """
+
+    def __init__(self, database, max_batch=200, max_delay=0.02, timeout=10.0):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.pid = None
+        self.thread = None
+
+    def _start(self):
+        """Start the flush thread (again after a fork, since threads do not survive fork())"""
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.pending = []
+        self.urgent = False
+        self.closed = False
+        self.failed = None  # Error that stopped the flush thread
+        self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, statements, wait=False, unless=None):
+        """
+        Queue a list of (sql, params) to run in order in one transaction
+        unless: (sql, params) checked in that transaction first; if it returns a row
+        the statements are skipped (e.g. the same answer was already saved)
+        Returns a WriteTicket; with wait=True, blocks until committed and
+        raises the statements' error, or WriteTimeout after self.timeout seconds
+        """
+        if self.pid != os.getpid():
+            self._start()
+        ticket = WriteTicket()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Write queue is closed')
+            failed = self.failed
+            if not failed:
+                self.pending.append((statements, unless, ticket))
+                if wait:
+                    self.urgent = True  # Someone is waiting: do not hold the batch open
+                self.condition.notify()
+        if failed:
+            self._commit_directly([(statements, unless, ticket)])  # No flush thread: as if there were no queue
+        if wait:
+            ticket.wait(self.timeout)
+        return ticket
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything submitted by this process so far is committed
+        Returns False if that did not happen within timeout seconds
+        """
+        if self.pid != os.getpid():
+            return True  # Nothing was submitted in this process
+        # The queue is first-in first-out, so an empty submission is a barrier
+        ticket = self.submit([], wait=False)
+        with self.condition:
+            self.urgent = True
+            self.condition.notify()
+        return ticket._done.wait(timeout) and ticket.error is None
+
+    def close(self):
+        """Commit what is left and stop the flush thread"""
+        if self.pid != os.getpid() or self.closed:
+            return
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _next_batch(self):
+        """Wait for pending writes, give others a moment to join, then take a batch"""
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            deadline = time.monotonic() + self.max_delay
+            while len(self.pending) < self.max_batch and not self.urgent and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            if not self.pending:
+                self.urgent = False
+            return batch
+
+    def _database(self):
+        return self.database() if callable(self.database) else self.database
+
+    def _run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self._database(), timeout=30)
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    break  # Closed and nothing left
+                self._commit(conn, batch)
+        except Exception as error:
+            logger.exception('Write queue stopped; writes are committed directly from now on')
+            self._fail(error)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _fail(self, error):
+        """The flush thread stops: what is still waiting is committed directly, and so is every later submission"""
+        with self.condition:
+            self.failed = error
+            pending, self.pending = self.pending, []
+        if pending:
+            self._commit_directly(pending)
+
+    def _commit_directly(self, batch):
+        """Commit with a connection of its own; the tickets get the error if that is impossible too"""
+        try:
+            conn = sqlite3.connect(self._database(), timeout=30)
+        except Exception as error:
+            logger.exception('Queued write failed')
+            for _, _, ticket in batch:
+                ticket.error = error
+                ticket._done.set()
+            return
+        try:
+            self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        try:
+            # One transaction (and one fsync) for the whole batch
+            with conn:
+                for statements, unless, _ in batch:
+                    _execute(conn, statements, unless)
+        except sqlite3.Error:
+            # Commit the submissions one by one so a bad one does not lose the others
+            for statements, unless, ticket in batch:
+                try:
+                    with conn:
+                        _execute(conn, statements, unless)
+                except sqlite3.Error as error:
+                    logger.exception('Queued write failed')
+                    ticket.error = error
+        except Exception as error:
+            for _, _, ticket in batch:
+                ticket.error = ticket.error or error
+            raise
+        finally:
+            for _, _, ticket in batch:
+                ticket._done.set()
+
+
+def _execute(conn, statements, unless):
+    if unless is not None:
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')  # So no other writer saves it between the check and the statements
+        if conn.execute(*unless).fetchone():
+            return  # Already saved by an earlier submission
+    for sql, params in statements:
+        conn.execute(sql, params)
+
+
+# ==================== BENCHMARK AND CRASH TEST ====================
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        unit INTEGER NOT NULL,
+        part INTEGER NOT NULL,
+        answer TEXT NOT NULL
+    )
+'''
+INSERT = 'INSERT INTO responses (unit, part, answer) VALUES (?, ?, ?)'
+
+
+def _unit(number):
+    """Two statements per submission, like an answer plus its statistics update"""
+    answer = 'answer text ' * 20
+    return [(INSERT, (number, 1, answer)), (INSERT, (number, 2, answer))]
+
+
+def _run_threads(threads, writes, work):
+    per_thread = writes // threads
+    workers = [threading.Thread(target=work, args=(t * per_thread, per_thread)) for t in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+def bench(threads, writes):
+    """Compare one commit per request with the write-behind and group-commit modes"""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        def fresh_db(name):
+            path = os.path.join(folder, f'{name}.db')
+            conn = sqlite3.connect(path)
+            conn.execute(SCHEMA)
+            conn.commit()
+            conn.close()
+            return path
+
+        path = fresh_db('per_request')
+
+        def per_request(start, count):
+            for number in range(start, start + count):
+                conn = sqlite3.connect(path, timeout=30)
+                for sql, params in _unit(number):
+                    conn.execute(sql, params)
+                conn.commit()
+                conn.close()
+        results['commit per request'] = _run_threads(threads, writes, per_request)
+
+        for name, wait in (('group commit (wait)', True), ('write-behind', False)):
+            queue = WriteBehindQueue(fresh_db(name.split()[0]))
+
+            def queued(start, count):
+                for number in range(start, start + count):
+                    queue.submit(_unit(number), wait=wait)
+                queue.flush()
+            results[name] = _run_threads(threads, writes, queued)
+            queue.close()
+
+    print(f'{threads} threads, {writes} writes (2 statements each)')
+    for name, rate in results.items():
+        print(f'{name:>22}: {rate:10.1f} writes/s')
+
+
+def _crash_child(path, count):
+    """Submit writes and print the number of each one that is acknowledged as committed"""
+    queue = WriteBehindQueue(path, max_delay=0.005)
+    lock = threading.Lock()
+
+    def work(start):
+        for number in range(start, count, 4):
+            queue.submit(_unit(number), wait=True)
+            with lock:
+                print(number, flush=True)
+
+    workers = [threading.Thread(target=work, args=(s,)) for s in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def crash_test(rounds, count):
+    """
+    Kill a writing process at a random moment and check that:
+    1. every write acknowledged as committed is in the database
+    2. no submission was committed only partly
+    """
+    failures = 0
+    for round_number in range(rounds):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'crash.db')
+            conn = sqlite3.connect(path)
+            conn.execute(SCHEMA)
+            conn.commit()
+            conn.close()
+
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '_crash-child', path, str(count)],
+                                     stdout=subprocess.PIPE, text=True)
+            time.sleep(random.uniform(0.05, 0.5))
+            os.kill(child.pid, signal.SIGKILL)
+            acknowledged = {int(line) for line in child.stdout.read().split()}
+            child.wait()
+
+            conn = sqlite3.connect(path)
+            parts = {}
+            for unit, part in conn.execute('SELECT unit, part FROM responses'):
+                parts.setdefault(unit, set()).add(part)
+            conn.close()
+
+            lost = acknowledged - set(parts)
+            partial = [unit for unit, seen in parts.items() if seen != {1, 2}]
+            ok = not lost and not partial
+            failures += not ok
+            print(f'round {round_number + 1}: acknowledged={len(acknowledged)} committed={len(parts)} '
+                  f'lost={len(lost)} partial={len(partial)} {"OK" if ok else "FAILED"}')
+    print('All rounds passed' if not failures else f'{failures} rounds failed')
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write-behind queue benchmark and crash test')
+    parser.add_argument('command', choices=['bench', 'crash-test', '_crash-child'])
+    parser.add_argument('args', nargs='*')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    options = parser.parse_args()
+
+    if options.command == 'bench':
+        bench(options.threads, options.writes)
+    elif options.command == 'crash-test':
+        sys.exit(0 if crash_test(options.rounds, 100000) else 1)
+    else:
+        _crash_child(options.args[0], int(options.args[1]))
+
+
+if __name__ == '__main__':
+    main()